@@ -1,14 +1,17 @@
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 from .database import get_db
-from .schemas import TokenData
+from .schemas import TokenData, CurrentUser
 # app/auth.py
-from .user_operations import get_user_by_username
+from .user_operations import get_user_by_username, get_cached_user
+from .cache import TTLCache
+from .config import AUTH_TOKEN_CACHE_SIZE, AUTH_TRUST_TOKEN_CLAIMS
+from .hashing import verify_password_async
 
 import os
 
@@ -18,17 +21,13 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 70
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Расшифрованные токены: token -> payload, запись живёт до истечения токена
+token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE)
 
 async def authenticate_user(username: str, password: str, db: AsyncSession = Depends(get_db)):
     user = await get_user_by_username(db, username)
-    if user and verify_password(password, user.hashed_password):
+    if user and await verify_password_async(password, user.hashed_password):
         return user
     return False
 
@@ -42,6 +41,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Проверка подписи и срока действия с мемоизацией на время жизни токена
+def decode_access_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        expires_at = payload.get("exp")
+        if expires_at is not None:
+            token_cache.set(token, payload, ttl=expires_at - time.time())
+    elif payload.get("exp") is not None and payload["exp"] <= time.time():
+        raise JWTError("Signature has expired.")
+    return payload
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,14 +60,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = await get_user_by_username(db, username=username)
+    # Режим доверия подписанным claims: id пользователя берётся из токена без запроса в БД
+    user_id = payload.get("uid")
+    if AUTH_TRUST_TOKEN_CLAIMS and user_id is not None:
+        return CurrentUser(id=user_id, username=username)
+
+    user = await get_cached_user(db, username=username)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,80 @@
+# app/bulk.py
+# Массовая загрузка постов: разбор JSON-массива или потока NDJSON, валидация
+# пачками схемой PostCreate и вставка пачек через crud.bulk_insert_posts.
+# Ошибки отдельных элементов и пачек собираются в ответ и не прерывают загрузку.
+import json
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import BULK_CHUNK_SIZE, BULK_INSERT_METHOD
+from .crud import bulk_insert_posts
+from .schemas import PostCreate
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+# Элементы тела запроса: (index, dict) либо (index, ошибка разбора).
+# NDJSON читается потоком построчно, JSON-массив — целиком.
+async def iter_items(request: Request):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        index = 0
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, _parse_line(line)
+                    index += 1
+        if buffer.strip():
+            yield index, _parse_line(buffer)
+        return
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    for index, item in enumerate(items):
+        yield index, item
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+async def ingest_posts(db: AsyncSession, items, user_id: int, chunk_size: int = BULK_CHUNK_SIZE, method: str = BULK_INSERT_METHOD):
+    result = {"inserted": 0, "ids": [], "errors": []}
+    chunk, chunk_indexes = [], []
+
+    async def flush():
+        if not chunk:
+            return
+        try:
+            ids = await bulk_insert_posts(db, chunk, user_id, method=method)
+            result["inserted"] += len(chunk)
+            result["ids"].extend(ids)
+        except Exception as e:
+            message = [{"type": "database_error", "msg": str(e).splitlines()[0]}]
+            result["errors"].extend({"index": index, "errors": message} for index in chunk_indexes)
+        chunk.clear()
+        chunk_indexes.clear()
+
+    async for index, item in items:
+        if isinstance(item, Exception):
+            result["errors"].append({"index": index, "errors": [{"type": "json_invalid", "msg": str(item)}]})
+            continue
+        try:
+            chunk.append(PostCreate.model_validate(item))
+            chunk_indexes.append(index)
+        except ValidationError as e:
+            result["errors"].append({"index": index, "errors": json.loads(e.json(include_url=False))})
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    await flush()
+    return result
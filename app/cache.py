@@ -0,0 +1,146 @@
+# app/cache.py
+import time
+from collections import OrderedDict
+
+
+# Кэш в памяти процесса: LRU с ограничением по размеру и временем жизни записей.
+# ttl можно переопределить для отдельной записи (например, до истечения токена).
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= self.timer():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (self.timer() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Интерфейс хранилища для кэша ответов. Значения — байты, поэтому его может
+# реализовать и Redis-совместимый сервер (см. RedisCacheBackend).
+class CacheBackend:
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def get_many(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl=None):
+        raise NotImplementedError
+
+    # items — пары (ключ, значение)
+    async def set_many(self, items, ttl=None):
+        for key, value in items:
+            await self.set(key, value, ttl=ttl)
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    # Атомарный счётчик без срока жизни (поколения списков)
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def get_counter(self, key: str) -> int:
+        raise NotImplementedError
+
+
+# LRU в памяти процесса. Инвалидация видна только этому процессу, поэтому при
+# нескольких воркерах устаревшие данные живут не дольше ttl.
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Счётчики не вытесняются LRU, иначе поколение могло бы откатиться назад
+        self._counters = {}
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def get_many(self, keys):
+        return [self._cache.get(key) for key in keys]
+
+    async def set(self, key, value, ttl=None):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+    async def incr(self, key):
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        self._cache.clear()
+        self._counters.clear()
+
+
+# Адаптер для клиента с API redis.asyncio (get/mget/set/delete/incr): общий кэш
+# для всех воркеров
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, client, ttl: float = 30.0, prefix: str = "blog:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key):
+        return await self.client.get(self.prefix + key)
+
+    async def get_many(self, keys):
+        if not keys:
+            return []
+        return await self.client.mget([self.prefix + key for key in keys])
+
+    async def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        await self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    # Одна отправка конвейера вместо запроса на каждый ключ
+    async def set_many(self, items, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items:
+            pipeline.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        await pipeline.execute()
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def incr(self, key):
+        return int(await self.client.incr(self.prefix + key))
+
+    async def get_counter(self, key):
+        value = await self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
@@ -0,0 +1,190 @@
+# app/compression.py
+# ASGI middleware для ответов с JSON, NDJSON и CSV:
+# 1. Сжатие gzip или brotli по Accept-Encoding (с учётом q). Тело, отправленное
+#    одним сообщением, сжимается целиком, если оно не меньше COMPRESSION_MIN_SIZE;
+#    потоковые ответы (экспорт) сжимаются по частям по мере отправки, без сборки
+#    всего тела в памяти. ETag не меняется: он описывает данные, а не их
+#    кодирование, и остаётся пригодным для If-Match; кэши различают варианты по
+#    Vary: Accept-Encoding.
+# 2. Условный GET для маршрутов без своего ETag (лента, поиск, теги): слабый ETag
+#    по хешу тела и 304 при совпадении с If-None-Match — без сжатия и передачи тела.
+#    Маршруты с кэшем ответов (app/post_cache.py) проверяют If-None-Match сами,
+#    до сериализации.
+import hashlib
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from .config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI, COMPRESSION_BROTLI_QUALITY
+from .post_cache import etag_matches
+
+# Необязательная зависимость: без неё brotli не предлагается
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type.endswith("json")
+
+# Кодирование из Accept-Encoding: наибольший q среди supported, при равных —
+# в порядке supported. "*" относится к кодированиям, не названным явно.
+def negotiate(accept_encoding: str, supported) -> str:
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class GzipCompressor:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    # flush=True отдаёт всё накопленное (Z_SYNC_FLUSH): клиент может разобрать
+    # уже полученную часть потока
+    def process(self, data: bytes, flush: bool = False) -> bytes:
+        chunk = self._compressor.compress(data)
+        if flush:
+            chunk += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return chunk
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class BrotliCompressor:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data: bytes, flush: bool = False) -> bytes:
+        chunk = self._compressor.process(data)
+        if flush:
+            chunk += self._compressor.flush()
+        return chunk
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+COMPRESSORS = {"br": BrotliCompressor, "gzip": GzipCompressor}
+
+def default_encodings():
+    return ("br", "gzip") if brotli is not None and COMPRESSION_BROTLI else ("gzip",)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE, encodings=None):
+        self.app = app
+        self.min_size = min_size
+        self.encodings = default_encodings() if encodings is None else tuple(encodings)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = negotiate(headers.get("accept-encoding", ""), self.encodings)
+        conditional = scope["method"] == "GET"
+        if encoding is None and not conditional:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(send, encoding, headers.get("if-none-match") if conditional else None, conditional, self.min_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    def __init__(self, send, encoding, if_none_match, conditional: bool, min_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        self.conditional = conditional
+        self.min_size = min_size
+        self.start = None
+        self.compressor = None
+        self.started = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Заголовки отправляются вместе с первой частью тела, когда известно,
+            # сжимать ли ответ
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.started:
+            await self._send_body(message)
+            return
+        self.started = True
+
+        status = self.start["status"]
+        headers = MutableHeaders(scope=self.start)
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        compressible = (
+            self.encoding is not None and 200 <= status < 300 and status != 204
+            and "content-encoding" not in headers and is_compressible(headers.get("content-type", ""))
+        )
+
+        if not more_body:
+            if self.conditional and status == 200 and "etag" not in headers and is_compressible(headers.get("content-type", "")):
+                headers["ETag"] = 'W/"%s"' % hashlib.md5(body).hexdigest()
+                if self.if_none_match is not None and etag_matches(self.if_none_match, headers["ETag"]):
+                    await self._not_modified(headers)
+                    return
+            if compressible and len(body) >= self.min_size:
+                compressor = COMPRESSORS[self.encoding]()
+                body = compressor.process(body) + compressor.finish()
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        # Потоковый ответ: размер известен только из Content-Length, если он задан
+        content_length = headers.get("content-length")
+        if compressible and (content_length is None or int(content_length) >= self.min_size):
+            self.compressor = COMPRESSORS[self.encoding]()
+            del headers["Content-Length"]
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+        await self._send(self.start)
+        await self._send_body(message)
+
+    async def _send_body(self, message):
+        if self.compressor is None or message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        more_body = message.get("more_body", False)
+        data = message.get("body", b"")
+        if more_body:
+            if not data:
+                return
+            data = self.compressor.process(data, flush=True)
+        else:
+            data = self.compressor.process(data) + self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _not_modified(self, headers):
+        for name in ("content-type", "content-length"):
+            if name in headers:
+                del headers[name]
+        self.start["status"] = 304
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": b""})
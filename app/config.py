@@ -1,3 +1,4 @@
+import os
 
 DATABASE_CONFIG = {
     'host': 'db',
@@ -10,4 +11,129 @@ DATABASE_CONFIG = {
 # Формируем строку подключения к базе данных
 DATABASE_URL = f"postgresql+asyncpg://{DATABASE_CONFIG['user']}:{DATABASE_CONFIG['password']}@{DATABASE_CONFIG['host']}:{DATABASE_CONFIG['port']}/{DATABASE_CONFIG['dbname']}"
 
+# Пул для хеширования паролей (bcrypt), чтобы не блокировать event loop.
+# PASSWORD_HASH_EXECUTOR: "thread" или "process".
+# PASSWORD_HASH_WORKERS: сколько хешей считается одновременно (не зависит от числа запросов).
+# PASSWORD_HASH_MAX_PENDING: сколько запросов может ждать в очереди, остальные получают 503.
+# PASSWORD_HASH_QUEUE_TIMEOUT: сколько секунд запрос может ждать свободного воркера.
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "2.0"))
 
+# Кэш аутентифицированных пользователей (ключ — sub из токена).
+# AUTH_TRUST_TOKEN_CLAIMS=1 берёт id пользователя прямо из подписанного токена и
+# не обращается к БД вовсе; удалённый пользователь при этом сохраняет доступ до
+# истечения токена.
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "0").lower() in ("1", "true", "yes")
+
+# Параметры движка и пула соединений. На каждый процесс (воркер uvicorn/gunicorn)
+# открывается до DB_POOL_SIZE + DB_MAX_OVERFLOW соединений, поэтому
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) должно быть меньше max_connections в Postgres.
+DB_ECHO = os.getenv("DB_ECHO", "0").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+# Размер кэша подготовленных выражений asyncpg на соединение (0 — выключить, нужно для pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# Реплика для чтения (необязательно). Если не задана, все запросы идут в основную БД.
+# После записи клиент REPLICA_STICKY_SECONDS секунд читает из основной БД
+# (cookie read_primary_until), чтобы видеть свои изменения несмотря на отставание реплики.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+# Кэш ответов для чтения постов. RESPONSE_CACHE_URL=redis://... включает общий
+# кэш в Redis (нужен пакет redis), иначе используется LRU в памяти процесса.
+# RESPONSE_CACHE_TTL — время жизни записи в секундах, 0 выключает кэш.
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+
+# Массовая загрузка постов (POST /posts/bulk): размер пачки для валидации и
+# вставки и способ вставки. "insert" — многострочный INSERT ... RETURNING (возвращает id),
+# "copy" — COPY через asyncpg (только PostgreSQL, быстрее, но без id в ответе).
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_INSERT_METHOD = os.getenv("BULK_INSERT_METHOD", "insert")
+
+
+# Отладка запросов к БД (для разработки и CI, см. app/query_debug.py).
+# QUERY_DEBUG=1 считает SQL-выражения каждого HTTP-запроса и пишет предупреждение,
+# если их больше QUERY_DEBUG_MAX_STATEMENTS или одно выражение повторяется
+# QUERY_DEBUG_MAX_REPEATS раз (N+1). Выражения дольше SLOW_QUERY_SECONDS
+# логируются с параметрами и планом EXPLAIN (0 — выключить).
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "0").lower() in ("1", "true", "yes")
+QUERY_DEBUG_MAX_STATEMENTS = int(os.getenv("QUERY_DEBUG_MAX_STATEMENTS", "10"))
+QUERY_DEBUG_MAX_REPEATS = int(os.getenv("QUERY_DEBUG_MAX_REPEATS", "3"))
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.1"))
+
+# Ограничение частоты запросов (token bucket, см. app/rate_limit.py).
+# RATE_LIMITS: правила "МЕТОД /путь=N/T" через ";" — N запросов за T секунд на
+# пользователя (по токену) или IP; пустая строка выключает ограничение.
+# RATE_LIMIT_STORE_URL=redis://... делает лимиты общими для всех воркеров.
+# RATE_LIMIT_TRUST_FORWARDED=1 берёт IP из X-Forwarded-For (только за доверенным прокси).
+RATE_LIMITS = os.getenv("RATE_LIMITS", "POST /token=10/60; POST /register=5/60")
+RATE_LIMIT_STORE_URL = os.getenv("RATE_LIMIT_STORE_URL")
+RATE_LIMIT_STORE_SIZE = int(os.getenv("RATE_LIMIT_STORE_SIZE", "100000"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0").lower() in ("1", "true", "yes")
+
+# Запуск воркера (см. app/startup.py). DB_SCHEMA_CHECK: "alembic" — сверить версию
+# в alembic_version с головной ревизией миграций и не стартовать при расхождении
+# (схему обновляет `alembic upgrade head` до запуска воркеров); "create_all" —
+# создать таблицы из моделей (разработка без миграций); "off" — не проверять.
+# STARTUP_WARMUP=1 до готовности (/ready) открывает соединения пула и выполняет
+# на них частые запросы, чтобы первый запрос не платил за прогрев.
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "alembic")
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1").lower() in ("1", "true", "yes")
+
+# Пакетное чтение постов (GET/POST /posts/batch): максимум ID в одном запросе
+POSTS_BATCH_MAX_IDS = int(os.getenv("POSTS_BATCH_MAX_IDS", "500"))
+
+# Теги постов: максимум тегов у поста и длина имени тега
+MAX_TAGS_PER_POST = int(os.getenv("MAX_TAGS_PER_POST", "10"))
+MAX_TAG_LENGTH = int(os.getenv("MAX_TAG_LENGTH", "50"))
+
+# Фоновые задачи (app/jobs.py). JOBS_BACKEND: "memory" — очередь в процессе,
+# "outbox" — таблица job_outbox и отдельный процесс `python -m app.worker`,
+# "inline" — сразу после commit в запросе. JOBS_CONCURRENCY — одновременных задач
+# на процесс, JOBS_MAX_ATTEMPTS — попыток до отказа, пауза между ними начинается
+# с JOBS_RETRY_DELAY секунд и удваивается. JOBS_LEASE_SECONDS — через сколько
+# app.worker снова выдаст взятую, но не завершённую задачу (упавший процесс).
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "memory")
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "4"))
+JOBS_QUEUE_SIZE = int(os.getenv("JOBS_QUEUE_SIZE", "10000"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_DELAY = float(os.getenv("JOBS_RETRY_DELAY", "1"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+JOBS_SHUTDOWN_TIMEOUT = float(os.getenv("JOBS_SHUTDOWN_TIMEOUT", "10"))
+
+# Ключи применённых задач статистики (user_post_stats_jobs) хранятся
+# STATS_JOB_KEY_TTL секунд: столько задача может ждать повтора, не будучи учтённой дважды
+STATS_JOB_KEY_TTL = float(os.getenv("STATS_JOB_KEY_TTL", str(7 * 24 * 3600)))
+
+# Лента подписок (GET /feed, см. app/feed.py). Для каждого автора в памяти процесса
+# хранятся ключи FEED_AUTHOR_CACHE_POSTS его последних постов: первая страница
+# ленты собирается без запросов к posts для авторов из кэша. Запись поста сбрасывает
+# запись автора только в своём процессе, в остальных она живёт не дольше FEED_AUTHOR_CACHE_TTL.
+FEED_AUTHOR_CACHE_SIZE = int(os.getenv("FEED_AUTHOR_CACHE_SIZE", "10000"))
+FEED_AUTHOR_CACHE_POSTS = int(os.getenv("FEED_AUTHOR_CACHE_POSTS", "50"))
+FEED_AUTHOR_CACHE_TTL = float(os.getenv("FEED_AUTHOR_CACHE_TTL", "30"))
+
+# Сжатие ответов (см. app/compression.py): gzip или brotli по Accept-Encoding.
+# Ответы меньше COMPRESSION_MIN_SIZE байт не сжимаются. Brotli предлагается, только
+# если установлен пакет brotli (или brotlicffi); COMPRESSION_BROTLI=0 выключает его.
+# Уровни подобраны для динамических ответов: быстрее, чем по умолчанию, почти без потери степени сжатия.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI = os.getenv("COMPRESSION_BROTLI", "1").lower() in ("1", "true", "yes")
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Отрывок текста поста для списков (view=summary, см. app/fields.py): первые
+# POST_EXCERPT_LENGTH символов content, сохраняются в posts.excerpt при записи
+POST_EXCERPT_LENGTH = int(os.getenv("POST_EXCERPT_LENGTH", "200"))
@@ -1,32 +1,89 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy import Integer, any_, bindparam, delete, insert, update
+from sqlalchemy.dialects.postgresql import ARRAY
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
 from fastapi import HTTPException, status
 from .models import Post, User
 from .schemas import PostCreate, UserCreate
-from .auth import get_password_hash
+from .hashing import get_password_hash_async
 from .user_operations import get_user_by_username
+from .pagination import decode_cursor, encode_cursor, fetch_keyset_page
+from .post_cache import post_written, post_deleted, posts_bulk_written
+from .stats import get_statistics, month_start, record_post_change
+from . import jobs
+from .search import query_terms, search_condition, ranked_search_query
+from . import tags as post_tags
+from . import feed
+from .fields import make_excerpt, post_columns
 
-# Получение списка постов с пагинацией
-async def get_posts(db: AsyncSession, skip: int = 0, limit: int = 10):
+logger = logging.getLogger(__name__)
+
+# Колонки поста для выборок без ORM-объектов: строки сразу сериализуются
+# в JSON (app/serialization.py), без построения и валидации моделей.
+# Порядок — как у полей schemas.Post, чтобы JSON совпадал с прежним.
+POST_COLUMNS = (Post.title, Post.content, Post.id, Post.created_at, Post.updated_at, Post.user_id, Post.version)
+
+# Выборка колонок поста; with_author добавляет имя автора через LEFT JOIN users
+# в том же запросе (?expand=author без отдельного запроса на каждый пост).
+# fields — только эти поля (app/fields.py) и ключи, нужные запросу; лишние
+# убирает fields.project после связей.
+def _select_posts(with_author: bool = False, fields: Optional[tuple] = None):
+    if fields is None:
+        columns = POST_COLUMNS
+    else:
+        columns = post_columns(fields, required=("id", "created_at", "user_id") if with_author else ("id", "created_at"))
+    if not with_author:
+        return select(*columns)
+    return select(*columns, User.username.label("author_username")).outerjoin(User, User.id == Post.user_id)
+
+def _embed_author(post: dict) -> dict:
+    username = post.pop("author_username")
+    post["author"] = {"id": post["user_id"], "username": username} if username is not None else None
+    return post
+
+# Получение списка постов с пагинацией (словари с колонками поста); tag — только посты с тегом
+async def get_posts(db: AsyncSession, skip: int = 0, limit: int = 10, with_author: bool = False, tag: Optional[str] = None, fields: Optional[tuple] = None):
     try:
-        query = select(Post)
+        query = _select_posts(with_author, fields).order_by(Post.created_at, Post.id)
+        if tag:
+            query = query.where(post_tags.tag_condition(tag))
         
         # Если указаны skip или limit, применяем их для пагинации
         if skip or limit:
             query = query.offset(skip).limit(limit)
         
         result = await db.execute(query)
-        posts = result.scalars().all()
+        posts = [row._asdict() for row in result]
 
         if not posts:
             raise HTTPException(status_code=404, detail="No posts found")
 
+        if with_author:
+            posts = [_embed_author(post) for post in posts]
         return posts
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching posts: {str(e)}")
+
+# Получение страницы постов по курсору: время ответа не зависит от глубины страницы
+async def get_posts_page(db: AsyncSession, cursor: Optional[str] = None, limit: int = 10, with_author: bool = False, tag: Optional[str] = None, fields: Optional[tuple] = None):
+    key = decode_cursor(cursor) if cursor else None
+    query = _select_posts(with_author, fields)
+    if tag:
+        query = query.where(post_tags.tag_condition(tag))
+    try:
+        posts, next_cursor, prev_cursor = await fetch_keyset_page(db, query, Post, key, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching posts: {str(e)}")
+    if with_author:
+        posts = [_embed_author(post) for post in posts]
+    return posts, next_cursor, prev_cursor
 
 
 # Получение одного поста по ID
@@ -37,72 +94,294 @@ async def get_post(db: AsyncSession, post_id: int):
         raise HTTPException(status_code=404, detail="Post not found")
     return post
 
+# Версия и время изменения поста для проверки If-None-Match без чтения содержимого
+async def get_post_validator(db: AsyncSession, post_id: int):
+    result = await db.execute(select(Post.id, Post.version, Post.updated_at).where(Post.id == post_id))
+    return result.one_or_none()
+
+# Пост с раскрытыми связями (GET /post/{id}?expand=...): автор тем же запросом,
+# теги — вторым
+async def get_post_expanded(db: AsyncSession, post_id: int, with_author: bool = False, with_tags: bool = False):
+    result = await db.execute(_select_posts(with_author).where(Post.id == post_id))
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    post = row._asdict()
+    if with_author:
+        _embed_author(post)
+    if with_tags:
+        await attach_tags(db, [post])
+    return post
+
+# Посты по списку ID одним запросом (GET/POST /posts/batch): {id: словарь колонок}.
+# В PostgreSQL — id = ANY(:ids) с массивом в одном параметре: текст запроса не
+# зависит от числа ID, и asyncpg переиспользует одно подготовленное выражение.
+async def get_posts_by_ids(db: AsyncSession, post_ids: list[int], with_author: bool = False, fields: Optional[tuple] = None):
+    if not post_ids:
+        return {}
+    if db.get_bind().dialect.name == "postgresql":
+        condition = Post.id == any_(bindparam("post_ids", list(post_ids), type_=ARRAY(Integer)))
+    else:
+        condition = Post.id.in_(post_ids)
+    try:
+        result = await db.execute(_select_posts(with_author, fields).where(condition))
+        posts = [row._asdict() for row in result]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching posts: {str(e)}")
+    if with_author:
+        posts = [_embed_author(post) for post in posts]
+    return {post["id"]: post for post in posts}
+
+# Авторы для уже выбранных постов (результатов поиска) одним запросом
+# IN (...), а не отдельным запросом на каждый пост
+async def attach_authors(db: AsyncSession, posts: list[dict]):
+    user_ids = {post["user_id"] for post in posts}
+    if not user_ids:
+        return posts
+    try:
+        result = await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))
+        authors = {row.id: {"id": row.id, "username": row.username} for row in result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching authors: {str(e)}")
+    for post in posts:
+        post["author"] = authors.get(post["user_id"])
+    return posts
+
+# Теги для уже выбранных постов одним запросом (?expand=tags)
+async def attach_tags(db: AsyncSession, posts: list[dict]):
+    try:
+        return await post_tags.attach_tags(db, posts)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching tags: {str(e)}")
+
+# Облако тегов: теги с числом постов, самые популярные первыми
+async def get_tags(db: AsyncSession, limit: int = 50):
+    try:
+        return await post_tags.get_tags(db, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching tags: {str(e)}")
+
 # Создание нового поста
 async def create_post(db: AsyncSession, post: PostCreate, user_id: int):
     try:
-        db_post = Post(**post.model_dump(), user_id=user_id)
+        db_post = Post(**post.model_dump(exclude={"tags"}), excerpt=make_excerpt(post.content), user_id=user_id)
         db.add(db_post)
+        await db.flush()
+        if post.tags:
+            await post_tags.add_post_tags(db, [(db_post.id, post.tags)])
+        record_post_change(db, user_id, db_post.created_at, 1)
         await db.commit()
+        # До refresh: задача в режиме inline делает commit в этой же сессии
+        await jobs.dispatch(db)
         await db.refresh(db_post)
+        await post_written(db_post)
+        feed.author_posts_changed(user_id)
         return db_post
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating post: {str(e)}")
 
-# Обновление поста
-async def update_post(db: AsyncSession, post_id: int, post_data: PostCreate, ):
-    result = await db.execute(select(Post).where(Post.id == post_id))
-    db_post = result.scalar_one_or_none()
-    if not db_post:
-        raise HTTPException(status_code=404, detail="Post not found")
+# Вставка пачки уже провалидированных постов одной транзакцией.
+# "insert": многострочный INSERT ... RETURNING id; "copy": COPY через asyncpg без возврата id
+# (пачки с тегами вставляются через INSERT: для связей нужны id постов).
+async def bulk_insert_posts(db: AsyncSession, posts: list[PostCreate], user_id: int, method: str = "insert"):
+    dialect = db.get_bind().dialect.name
     try:
-        for key, value in post_data.model_dump().items():
-            setattr(db_post, key, value)
+        if method == "copy" and dialect == "postgresql" and not any(post.tags for post in posts):
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            connection = await db.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                "posts",
+                records=[(post.title, post.content, make_excerpt(post.content), user_id, now, now) for post in posts],
+                columns=["title", "content", "excerpt", "user_id", "created_at", "updated_at"],
+            )
+            ids = []
+            record_post_change(db, user_id, now, len(posts))
+        else:
+            result = await db.execute(
+                insert(Post).returning(Post.id, Post.created_at, sort_by_parameter_order=True),
+                [{**post.model_dump(exclude={"tags"}), "excerpt": make_excerpt(post.content), "user_id": user_id} for post in posts],
+            )
+            rows = result.all()
+            ids = [row.id for row in rows]
+            await post_tags.add_post_tags(db, [(post_id, post.tags) for post_id, post in zip(ids, posts)])
+            for month, count in Counter(month_start(row.created_at) for row in rows).items():
+                record_post_change(db, user_id, month, count)
         await db.commit()
-        await db.refresh(db_post)
-        return db_post
+    except Exception:
+        await db.rollback()
+        raise
+    await posts_bulk_written()
+    feed.author_posts_changed(user_id)
+    await jobs.dispatch(db)
+    return ids
+
+# Причина, по которой условная запись не затронула ни одной строки.
+# Выполняется только в этом (редком) случае, успешная запись обходится одним запросом.
+async def _raise_write_failure(db: AsyncSession, post_id: int, user_id: Optional[int], action: str):
+    await db.rollback()
+    result = await db.execute(select(Post.user_id).where(Post.id == post_id))
+    post = result.one_or_none()
+    if post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    if user_id is not None and post.user_id != user_id:
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action} this post")
+    raise HTTPException(status_code=412, detail="Post has been modified, reload it and try again")
+
+# Обновление поста одним запросом UPDATE ... WHERE id AND user_id [AND version] RETURNING.
+# user_id — проверка владельца, versions — допустимые версии из If-Match.
+async def update_post(db: AsyncSession, post_id: int, post_data: PostCreate, user_id: Optional[int] = None, versions: Optional[list[int]] = None):
+    statement = (
+        update(Post)
+        .where(Post.id == post_id)
+        .values(**post_data.model_dump(exclude={"tags"}), excerpt=make_excerpt(post_data.content), version=Post.version + 1)
+        .returning(*POST_COLUMNS)
+    )
+    if user_id is not None:
+        statement = statement.where(Post.user_id == user_id)
+    if versions is not None:
+        statement = statement.where(Post.version.in_(versions))
+    try:
+        result = await db.execute(statement)
+        db_post = result.one_or_none()
+        if db_post is not None:
+            if post_data.tags is not None:
+                await post_tags.set_post_tags(db, post_id, post_data.tags)
+            await db.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating post: {str(e)}")
+    if db_post is None:
+        await _raise_write_failure(db, post_id, user_id, "update")
+    await post_written(db_post)
+    return db_post
 
-# Удаление поста 
-async def delete_post(db: AsyncSession, post_id: int, ):
-    result = await db.execute(select(Post).where(Post.id == post_id))
-    db_post = result.scalar_one_or_none()
-    if not db_post:
-        raise HTTPException(status_code=404, detail="Post not found")
+# Удаление поста одним запросом DELETE ... WHERE id AND user_id [AND version] RETURNING
+async def delete_post(db: AsyncSession, post_id: int, user_id: Optional[int] = None, versions: Optional[list[int]] = None):
+    statement = (
+        delete(Post)
+        .where(Post.id == post_id)
+        .returning(Post.user_id, Post.created_at)
+    )
+    if user_id is not None:
+        statement = statement.where(Post.user_id == user_id)
+    if versions is not None:
+        statement = statement.where(Post.version.in_(versions))
     try:
-        await db.delete(db_post)
-        await db.commit()
-        return {"message": "Post deleted successfully"}
+        # Связи с тегами — до DELETE поста: иначе ON DELETE CASCADE удалит их раньше,
+        # и счётчики тегов не уменьшатся. Если пост не удалён, _raise_write_failure
+        # откатывает и это.
+        await post_tags.remove_post_tags(db, post_id)
+        result = await db.execute(statement)
+        deleted = result.one_or_none()
+        if deleted is not None:
+            if deleted.user_id is not None and deleted.created_at is not None:
+                record_post_change(db, deleted.user_id, deleted.created_at, -1)
+            await db.commit()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting post: {str(e)}")
+    if deleted is None:
+        await _raise_write_failure(db, post_id, user_id, "delete")
+    await post_deleted(post_id)
+    if deleted.user_id is not None:
+        feed.author_posts_changed(deleted.user_id)
+    await jobs.dispatch(db)
+    return {"message": "Post deleted successfully"}
+
+# Потоковое чтение постов для экспорта: курсор на стороне сервера (yield_per),
+# строки без создания ORM-объектов, пачками по batch_size
+EXPORT_COLUMNS = (Post.id, Post.title, Post.content, Post.created_at, Post.updated_at, Post.user_id)
 
-# Поиск постов по названию или содержимому
-async def search_posts(db: AsyncSession, query: str, skip: int = 0, limit: int = 10):
+async def stream_posts(db: AsyncSession, user_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, batch_size: int = 1000):
+    query = select(*EXPORT_COLUMNS).order_by(Post.created_at, Post.id)
+    if user_id is not None:
+        query = query.where(Post.user_id == user_id)
+    if created_from is not None:
+        query = query.where(Post.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(Post.created_at < created_to)
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        yield partition
+
+# Полнотекстовый поиск постов по названию и содержимому: результаты
+# отсортированы по релевантности и содержат подсвеченный фрагмент
+async def search_posts(db: AsyncSession, query: str, skip: int = 0, limit: int = 10, tag: Optional[str] = None):
+    terms = query_terms(query)
+    if not terms:
+        raise HTTPException(status_code=404, detail="No posts found matching the search criteria")
     try:
-        search_query = select(Post).where(
-            Post.title.ilike(f"%{query}%") | Post.content.ilike(f"%{query}%")
-        ).offset(skip).limit(limit)
+        dialect = db.get_bind().dialect.name
+        search_query = ranked_search_query(dialect, terms).offset(skip).limit(limit)
+        if tag:
+            search_query = search_query.where(post_tags.tag_condition(tag))
         result = await db.execute(search_query)
-        posts = result.scalars().all()
+        posts = [row._asdict() for row in result]
         if not posts:
             raise HTTPException(status_code=404, detail="No posts found matching the search criteria")
         return posts
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching posts: {str(e)}")
 
-# Получение статистики по постам пользователя за текущий месяц
+# Поиск постов с keyset-пагинацией: порядок по (created_at, id), без ранжирования
+async def search_posts_page(db: AsyncSession, query: str, cursor: Optional[str] = None, limit: int = 10, tag: Optional[str] = None):
+    key = decode_cursor(cursor) if cursor else None
+    terms = query_terms(query)
+    if not terms:
+        return [], None, None
+    try:
+        dialect = db.get_bind().dialect.name
+        search_query = select(*POST_COLUMNS).where(search_condition(dialect, terms))
+        if tag:
+            search_query = search_query.where(post_tags.tag_condition(tag))
+        return await fetch_keyset_page(db, search_query, Post, key, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching posts: {str(e)}")
+
+# Подписка на автора; повторная подписка ничего не меняет
+async def follow_user(db: AsyncSession, follower_id: int, followee_id: int):
+    if follower_id == followee_id:
+        raise HTTPException(status_code=400, detail="Cannot follow yourself")
+    try:
+        followee = (await db.execute(select(User.id).where(User.id == followee_id))).one_or_none()
+        if followee is not None:
+            await feed.follow(db, follower_id, followee_id)
+            await db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error following user: {str(e)}")
+    if followee is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": "Followed successfully"}
+
+async def unfollow_user(db: AsyncSession, follower_id: int, followee_id: int):
+    try:
+        await feed.unfollow(db, follower_id, followee_id)
+        await db.commit()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error unfollowing user: {str(e)}")
+    return {"message": "Unfollowed successfully"}
+
+# Страница ленты подписок, новые посты первыми: (посты, next_cursor).
+# Ключи страницы собирает app/feed.py, посты читаются одним запросом по ID.
+async def get_feed(db: AsyncSession, follower_id: int, cursor: Optional[str] = None, limit: int = 10, with_author: bool = False, fields: Optional[tuple] = None):
+    key = decode_cursor(cursor)[:2] if cursor else None
+    try:
+        keys = await feed.feed_keys(db, follower_id, key, limit)
+        posts = await get_posts_by_ids(db, [post_id for _, post_id in keys[:limit]], with_author=with_author, fields=fields)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching feed: {str(e)}")
+    # Пост мог быть удалён между чтением ключей и постов
+    items = [posts[post_id] for _, post_id in keys[:limit] if post_id in posts]
+    next_cursor = encode_cursor(*keys[limit - 1]) if len(keys) > limit else None
+    return items, next_cursor
+
+# Получение статистики по постам пользователя из таблицы агрегатов user_post_stats
 async def get_user_post_statistics(db: AsyncSession, user_id: int):
     try:
-        current_date = datetime.now()
-        query = select(
-            func.count(Post.id).label("post_count")
-        ).where(
-            Post.user_id == user_id,
-            Post.created_at >= current_date.replace(day=1)
-        )
-        result = await db.execute(query)
-        post_count = result.scalar_one_or_none() or 0
-        return {"average_posts_per_month": post_count}
+        return await get_statistics(db, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching user statistics: {str(e)}")
 
@@ -111,13 +390,14 @@ async def create_user(db: AsyncSession, user: UserCreate):
     db_user = await get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=407, detail="Username already registered")
+    # Хешируем вне try, чтобы 503 от перегруженного пула не превратился в 500
+    hashed_password = await get_password_hash_async(user.password)
     try:
-        hashed_password = get_password_hash(user.password)
         db_user = User(username=user.username, hashed_password=hashed_password)
         db.add(db_user)
         await db.commit()
         await db.refresh(db_user)
         return db_user
     except Exception as e:
-        print("Register User:", e)
+        logger.exception("Error creating user %s", user.username)
         raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
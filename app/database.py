@@ -1,16 +1,140 @@
+import time
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.engine import make_url
 from contextlib import asynccontextmanager
+from fastapi import Depends, Request, Response
 import os
-from .config import DATABASE_URL as url_db
+from . import metrics, query_debug
+from .config import (
+    DATABASE_URL as url_db,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE,
+    DATABASE_REPLICA_URL,
+    REPLICA_STICKY_SECONDS,
+    QUERY_DEBUG,
+)
 
 
 DATABASE_URL = os.getenv("DATABASE_URL", url_db)
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+# Статистика ожидания свободного соединения в пуле: учитываются только получения
+# соединения, когда все size + max_overflow соединений заняты
+class PoolStats:
+    def __init__(self):
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+# Пул, который замеряет время получения соединения
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            if exhausted:
+                self.stats.record_wait(elapsed)
+                metrics.DB_POOL_WAIT.observe(elapsed)
+
+    def recreate(self):
+        # engine.dispose() пересоздаёт пул, статистику сохраняем
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+# Создание движка по настройкам из config. Для SQLite параметры пула не
+# применяются: SQLAlchemy сам выбирает подходящий пул.
+def create_database_engine(url: str = DATABASE_URL, **overrides):
+    options = {"echo": DB_ECHO}
+    backend = make_url(url).get_backend_name()
+    if backend != "sqlite":
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    options.update(overrides)
+    engine = metrics.instrument_engine(create_async_engine(url, **options))
+    if QUERY_DEBUG:
+        query_debug.instrument_engine(engine)
+    return engine
+
+# Текущее состояние пула соединений движка
+def pool_metrics(engine) -> dict:
+    pool = engine.sync_engine.pool
+    metrics = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        metrics.update(
+            waits=stats.waits,
+            wait_seconds_total=round(stats.wait_seconds_total, 6),
+            wait_seconds_max=round(stats.wait_seconds_max, 6),
+        )
+    return metrics
+
+
+engine = create_database_engine(DATABASE_URL)
 AsyncSessionLocal =  sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
 
+# Необязательная реплика для чтения
+read_engine = create_database_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+AsyncReadSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=read_engine, class_=AsyncSession)
+    if read_engine is not None else None
+)
+
+# Состояние пулов для /metrics: считывается в момент запроса метрик
+def _collect_pool_connections():
+    engines = {"primary": engine, "replica": read_engine}
+    for name, db_engine in engines.items():
+        if db_engine is None:
+            continue
+        pool_state = pool_metrics(db_engine)
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in pool_state:
+                yield (name, state), pool_state[state]
+
+metrics.registry.gauge(
+    "db_pool_connections", "Pooled connections by engine and state", ("engine", "state"),
+    collect=_collect_pool_connections,
+)
+
+PRIMARY_STICKY_COOKIE = "read_primary_until"
+
 Base = declarative_base()
 
 # Функция для получения сессии
@@ -18,6 +142,29 @@ async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
-async def startup_event():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Вызывается обработчиками записи: следующие чтения клиента идут в основную БД
+def stick_to_primary(response: Response):
+    if REPLICA_STICKY_SECONDS > 0:
+        response.set_cookie(
+            PRIMARY_STICKY_COOKIE,
+            str(int(time.time()) + REPLICA_STICKY_SECONDS),
+            max_age=REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+
+def _wants_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(PRIMARY_STICKY_COOKIE, 0)) >= time.time()
+    except ValueError:
+        return False
+
+# Сессия для read-only обработчиков: реплика, если она настроена и клиент
+# недавно ничего не записывал, иначе основная БД. Сессия основной БД открывает
+# соединение только при первом запросе, поэтому при чтении из реплики она ничего не стоит.
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)):
+    if AsyncReadSessionLocal is None or _wants_primary(request):
+        yield db
+        return
+    async with AsyncReadSessionLocal() as session:
+        yield session
@@ -0,0 +1,55 @@
+# app/export.py
+# Потоковый экспорт постов в NDJSON или CSV. Строки из БД сериализуются сразу
+# пачками, поэтому память не зависит от размера выгрузки.
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from .crud import EXPORT_COLUMNS, stream_posts
+
+FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def ndjson_chunk(rows) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(FIELDS, map(_isoformat, row))), ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode()
+
+def csv_chunk(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(FIELDS)
+    writer.writerows([_isoformat(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def _export_body(db: AsyncSession, format: str, **filters):
+    # Сессия из зависимости уже закрыта к началу отправки ответа: первый запрос
+    # снова возьмёт соединение из пула, поэтому закрываем её сами в конце
+    try:
+        if format == "csv":
+            yield csv_chunk([], header=True)
+        async for rows in stream_posts(db, **filters):
+            yield csv_chunk(rows) if format == "csv" else ndjson_chunk(rows)
+    finally:
+        await db.close()
+
+def export_response(db: AsyncSession, format: str = "ndjson", user_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    return StreamingResponse(
+        _export_body(db, format, user_id=user_id, created_from=created_from, created_to=created_to),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'},
+    )
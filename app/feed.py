@@ -0,0 +1,100 @@
+# app/feed.py
+# Лента подписок (fan-out on read): посты не копируются в ленты подписчиков при
+# записи, а собираются при чтении из последних постов каждого автора.
+# 1. Авторы читателя — по первичному ключу follows.
+# 2. Для каждого автора — не больше limit + 1 последних постов старше курсора:
+#    ключи (created_at, id) из кэша авторов или одним запросом для остальных,
+#    с отдельным поиском по ix_posts_user_id_created_at на каждого автора.
+# 3. Отсортированные списки авторов сливаются heapq.merge (k-way merge), и
+#    берутся первые limit + 1 ключей.
+# Работа на страницу ограничена (limit + 1) * число авторов строк индекса и не
+# зависит от того, сколько всего постов у авторов.
+import heapq
+from itertools import islice
+from sqlalchemy import Integer, bindparam, delete, func, literal, select, true, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import TTLCache
+from .config import FEED_AUTHOR_CACHE_SIZE, FEED_AUTHOR_CACHE_POSTS, FEED_AUTHOR_CACHE_TTL
+from .models import Follow, Post
+
+# Ключи последних постов автора, новые первыми: {user_id: (ключи, complete)}.
+# complete — у автора нет постов, кроме перечисленных. LRU оставляет в кэше
+# авторов, которых читают чаще всего.
+author_cache = TTLCache(maxsize=FEED_AUTHOR_CACHE_SIZE, ttl=FEED_AUTHOR_CACHE_TTL)
+
+# Вызывается из crud после commit создания или удаления поста автора
+def author_posts_changed(user_id: int):
+    author_cache.delete(user_id)
+
+
+async def follow(db: AsyncSession, follower_id: int, followee_id: int):
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    await db.execute(
+        dialect_insert(Follow).values(follower_id=follower_id, followee_id=followee_id)
+        .on_conflict_do_nothing(index_elements=[Follow.follower_id, Follow.followee_id])
+    )
+
+async def unfollow(db: AsyncSession, follower_id: int, followee_id: int):
+    await db.execute(delete(Follow).where(Follow.follower_id == follower_id, Follow.followee_id == followee_id))
+
+async def followees(db: AsyncSession, follower_id: int) -> list[int]:
+    result = await db.execute(select(Follow.followee_id).where(Follow.follower_id == follower_id))
+    return list(result.scalars())
+
+
+# До limit последних постов каждого автора старше key одним запросом: {user_id: [ключи]}.
+# В PostgreSQL — LATERAL по unnest(:ids) с LIMIT на каждого автора; в других СУБД
+# (SQLite в разработке и тестах) — ROW_NUMBER() по постам всех авторов.
+async def _latest_keys(db: AsyncSession, user_ids: list[int], key, limit: int) -> dict:
+    def older(query):
+        if key is None:
+            return query
+        return query.where(tuple_(Post.created_at, Post.id) < tuple_(literal(key[0], Post.created_at.type), literal(key[1], Post.id.type)))
+
+    if db.get_bind().dialect.name == "postgresql":
+        authors = func.unnest(bindparam("author_ids", user_ids, type_=ARRAY(Integer))).table_valued("user_id").render_derived()
+        latest = older(
+            select(Post.user_id, Post.created_at, Post.id).where(Post.user_id == authors.c.user_id)
+        ).order_by(Post.created_at.desc(), Post.id.desc()).limit(limit).lateral("latest")
+        query = select(latest.c.user_id, latest.c.created_at, latest.c.id).select_from(authors).join(latest, true())
+    else:
+        position = func.row_number().over(partition_by=Post.user_id, order_by=(Post.created_at.desc(), Post.id.desc()))
+        ranked = older(
+            select(Post.user_id, Post.created_at, Post.id, position.label("position")).where(Post.user_id.in_(user_ids))
+        ).subquery()
+        query = select(ranked.c.user_id, ranked.c.created_at, ranked.c.id).where(ranked.c.position <= limit)
+    keys = {user_id: [] for user_id in user_ids}
+    for row in await db.execute(query):
+        keys[row.user_id].append((row.created_at, row.id))
+    for author_keys in keys.values():
+        author_keys.sort(reverse=True)
+    return keys
+
+
+# Ключи (created_at, id) постов страницы ленты, новые первыми; key — ключ последнего
+# поста предыдущей страницы. Возвращает limit + 1 ключей, если есть следующая страница.
+async def feed_keys(db: AsyncSession, follower_id: int, key=None, limit: int = 10) -> list:
+    user_ids = await followees(db, follower_id)
+    lists, misses = [], []
+    for user_id in user_ids:
+        cached = author_cache.get(user_id)
+        if cached is not None:
+            keys, complete = cached
+            if key is not None:
+                keys = [k for k in keys if k < key]
+            # Кэш отвечает, если в нём хватает постов на страницу или других постов нет
+            if len(keys) > limit or complete:
+                lists.append(keys[:limit + 1])
+                continue
+        misses.append(user_id)
+
+    if misses:
+        # Первая страница заполняет кэш: читаем с запасом на следующие обращения
+        fetch = limit + 1 if key is not None else max(limit + 1, FEED_AUTHOR_CACHE_POSTS)
+        for user_id, keys in (await _latest_keys(db, misses, key, fetch)).items():
+            if key is None:
+                author_cache.set(user_id, (keys, len(keys) < fetch))
+            lists.append(keys[:limit + 1])
+    return list(islice(heapq.merge(*lists, reverse=True), limit + 1))
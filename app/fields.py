@@ -0,0 +1,51 @@
+# app/fields.py
+# Проекция полей постов в списках: ?fields=id,title,... и ?view=summary (все поля,
+# кроме content, и отрывок excerpt). В запрос попадают только нужные колонки,
+# поэтому длинные тексты не читаются из БД и не передаются клиенту. В PostgreSQL
+# content длиннее порога хранится сжатым вне строки таблицы (TOAST, миграция
+# 3f8d2b6e9a14) и распаковывается только запросами, которые его выбирают.
+from .config import POST_EXCERPT_LENGTH
+from .models import Post
+
+# Поля в порядке вывода (как у schemas.Post); excerpt — только по запросу
+FIELD_COLUMNS = {
+    "title": Post.title,
+    "content": Post.content,
+    "excerpt": Post.excerpt,
+    "id": Post.id,
+    "created_at": Post.created_at,
+    "updated_at": Post.updated_at,
+    "user_id": Post.user_id,
+    "version": Post.version,
+}
+SUMMARY_FIELDS = tuple(name for name in FIELD_COLUMNS if name != "content")
+
+
+def make_excerpt(content: str, length: int = POST_EXCERPT_LENGTH) -> str:
+    if len(content) <= length:
+        return content
+    return content[:length].rstrip() + "…"
+
+
+# Поля из строки "id,title": кортеж в порядке вывода, ValueError для неизвестных
+def parse_fields(value: str) -> tuple:
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(names - FIELD_COLUMNS.keys())
+    if unknown:
+        raise ValueError(", ".join(unknown))
+    if not names:
+        raise ValueError("empty")
+    return tuple(name for name in FIELD_COLUMNS if name in names)
+
+# Колонки для выборки: fields и required — поля, нужные для самого запроса
+# (ключ курсора, автор), которые потом убирает project
+def post_columns(fields, required=()):
+    return [column for name, column in FIELD_COLUMNS.items() if name in fields or name in required]
+
+# Убирает из строк служебные поля, не вошедшие в fields; связи (author, tags) остаются
+def project(posts: list[dict], fields) -> list[dict]:
+    extra = FIELD_COLUMNS.keys() - set(fields)
+    for post in posts:
+        for name in extra:
+            post.pop(name, None)
+    return posts
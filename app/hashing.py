@@ -0,0 +1,129 @@
+# app/hashing.py
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from . import metrics
+from .config import (
+    PASSWORD_HASH_EXECUTOR,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Синхронные функции bcrypt. Объявлены на уровне модуля, чтобы их можно было
+# передать в ProcessPoolExecutor.
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingPoolSaturated(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password hashing is overloaded, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+
+# Пул для bcrypt с контролем допуска: одновременно выполняется не больше
+# `workers` хешей, ещё `max_pending` запросов ждут в очереди не дольше
+# `queue_timeout` секунд, остальные сразу получают 503.
+class HashingPool:
+    def __init__(self, kind: str = "thread", workers: int = 4, max_pending: int = 64, queue_timeout: float = 2.0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.pending = 0
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _get_semaphore(self):
+        # Семафор привязан к event loop, поэтому пересоздаём его для нового цикла
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.workers)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            if self.pending >= self.max_pending:
+                raise HashingPoolSaturated()
+            self.pending += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise HashingPoolSaturated()
+            finally:
+                self.pending -= 1
+        else:
+            await semaphore.acquire()
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    async def run(self, func, *args):
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            # Время считается после получения слота, без ожидания в очереди
+            started = time.perf_counter()
+            try:
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+            finally:
+                metrics.PASSWORD_HASH_DURATION.observe(time.perf_counter() - started, func.__name__)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(check_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_pool = HashingPool(
+    kind=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    queue_timeout=PASSWORD_HASH_QUEUE_TIMEOUT,
+)
+
+# Асинхронные обёртки, которые используют обработчики запросов
+async def get_password_hash_async(password: str) -> str:
+    return await password_pool.hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.verify(plain_password, hashed_password)
+
+async def shutdown_event():
+    password_pool.shutdown()
@@ -0,0 +1,205 @@
+# app/index_advisor.py
+# Проверка планов запросов crud: выполняет каждую функцию crud на наполненной
+# базе, перехватывает её SQL и печатает план (EXPLAIN ANALYZE в PostgreSQL,
+# EXPLAIN QUERY PLAN в SQLite), отмечая последовательные сканирования таблиц.
+# Всё выполняется в одной транзакции, которая в конце откатывается, поэтому
+# тестовые данные (--posts) не остаются в базе.
+#
+#   python -m app.index_advisor [--users 100] [--posts 20000] [--verbose] [--fail-on-seq-scan]
+import argparse
+import asyncio
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud, feed, jobs, query_debug, stats, tags
+from .database import DATABASE_URL, create_database_engine
+from .fields import SUMMARY_FIELDS
+from .models import Follow, Post, PostTag, User
+from .pagination import encode_cursor
+from .schemas import PostCreate
+from .user_operations import get_user_by_username
+
+
+async def _consume(generator):
+    async for _ in generator:
+        pass
+
+# Проверяемые запросы: (название, функция от (db, ctx))
+QUERIES = [
+    ("get_posts offset", lambda db, ctx: crud.get_posts(db, skip=ctx["offset"], limit=10)),
+    ("get_posts summary", lambda db, ctx: crud.get_posts(db, skip=ctx["offset"], limit=10, fields=SUMMARY_FIELDS)),
+    ("get_posts with author", lambda db, ctx: crud.get_posts(db, skip=ctx["offset"], limit=10, with_author=True)),
+    ("get_posts_page cursor", lambda db, ctx: crud.get_posts_page(db, cursor=ctx["cursor"], limit=10)),
+    ("get_post", lambda db, ctx: crud.get_post(db, ctx["post_id"])),
+    ("get_post_validator", lambda db, ctx: crud.get_post_validator(db, ctx["post_id"])),
+    ("get_post_expanded", lambda db, ctx: crud.get_post_expanded(db, ctx["post_id"], with_author=True, with_tags=True)),
+    ("get_posts by tag", lambda db, ctx: crud.get_posts(db, skip=0, limit=10, tag=ctx["tag"])),
+    ("get_posts_page by tag", lambda db, ctx: crud.get_posts_page(db, limit=10, tag=ctx["tag"])),
+    ("get_tags", lambda db, ctx: crud.get_tags(db)),
+    ("get_posts_by_ids", lambda db, ctx: crud.get_posts_by_ids(db, [ctx["post_id"], ctx["delete_id"]])),
+    ("search_posts", lambda db, ctx: crud.search_posts(db, query=ctx["search"], limit=10)),
+    ("search_posts_page", lambda db, ctx: crud.search_posts_page(db, query=ctx["search"], limit=10)),
+    ("stream_posts by user and month", lambda db, ctx: _consume(crud.stream_posts(
+        db, user_id=ctx["user_id"], created_from=ctx["month_from"], created_to=ctx["month_to"]))),
+    ("get_feed", lambda db, ctx: crud.get_feed(db, ctx["user_id"], limit=10)),
+    ("get_feed next page", lambda db, ctx: crud.get_feed(db, ctx["user_id"], cursor=ctx["cursor"], limit=10)),
+    ("get_user_post_statistics", lambda db, ctx: crud.get_user_post_statistics(db, ctx["user_id"])),
+    ("get_user_by_username", lambda db, ctx: get_user_by_username(db, ctx["username"])),
+    ("update_post", lambda db, ctx: crud.update_post(
+        db, ctx["post_id"], PostCreate(title="Advisor", content="Advisor"), user_id=ctx["user_id"])),
+    ("delete_post", lambda db, ctx: crud.delete_post(db, ctx["delete_id"], user_id=ctx["user_id"])),
+]
+
+
+# Таблицы, которые план читает целиком. Индексные сканирования (в том числе
+# полные, SCAN ... USING INDEX), виртуальные таблицы FTS5 и подзапросы
+# (anon_N — имена, которые им даёт SQLAlchemy) не считаются.
+def sequential_scans(dialect: str, plan: str):
+    if dialect == "postgresql":
+        return sorted(set(re.findall(r"Seq Scan on (\w+)", plan)))
+    tables = set()
+    for line in plan.splitlines():
+        match = re.search(r"\bSCAN (\w+)", line)
+        if (match and "USING" not in line and "VIRTUAL TABLE" not in line
+                and match.group(1) != "CONSTANT" and not re.fullmatch(r"anon_\d+", match.group(1))):
+            tables.add(match.group(1))
+    return sorted(tables)
+
+
+TAGS = 20
+FOLLOWS = 10
+
+async def seed(db: AsyncSession, users: int, posts: int):
+    start = datetime(2024, 1, 1)
+    user_ids = (await db.execute(
+        insert(User).returning(User.id),
+        [{"username": f"index_advisor_{i}", "hashed_password": "-", "created_at": start} for i in range(users)],
+    )).scalars().all()
+    for offset in range(0, posts, 5000):
+        await db.execute(insert(Post), [
+            {
+                "title": f"Post {i}",
+                "content": f"Content of post number {i}",
+                "user_id": user_ids[i % users],
+                "created_at": start + timedelta(minutes=i),
+                "updated_at": start + timedelta(minutes=i),
+            }
+            for i in range(offset, min(posts, offset + 5000))
+        ])
+    # Каждый пост получает один из TAGS тегов
+    tag_ids = await tags.ensure_tags(db, [f"advisor-{i}" for i in range(TAGS)])
+    for i in range(TAGS):
+        await db.execute(insert(PostTag).from_select(
+            ["post_id", "tag_id"],
+            select(Post.id, literal(tag_ids[f"advisor-{i}"])).where(Post.id % TAGS == i),
+        ))
+    # Каждый пользователь подписан на FOLLOWS следующих
+    follows = min(FOLLOWS, users - 1)
+    if follows:
+        await db.execute(insert(Follow), [
+            {"follower_id": user_ids[i], "followee_id": user_ids[(i + j) % users]}
+            for i in range(users) for j in range(1, follows + 1)
+        ])
+    await stats.rebuild(db)
+    await tags.rebuild(db)
+
+# Параметры запросов: пользователь с постами, пост из середины таблицы и т. п.
+async def build_context(db: AsyncSession):
+    user = (await db.execute(
+        select(User.id, User.username).join(Post, Post.user_id == User.id).order_by(User.id).limit(1)
+    )).one_or_none()
+    if user is None:
+        raise SystemExit("No posts in the database, run with --posts N to seed test data")
+    total = (await db.execute(select(func.count()).select_from(Post))).scalar_one()
+    posts = (await db.execute(
+        select(Post.id, Post.created_at).where(Post.user_id == user.id).order_by(Post.created_at, Post.id)
+    )).all()
+    middle = posts[len(posts) // 2]
+    month_from = middle.created_at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "offset": total // 2,
+        "cursor": encode_cursor(middle.created_at, middle.id),
+        "post_id": middle.id,
+        "delete_id": posts[-1].id,
+        "search": "post",
+        "tag": "advisor-0",
+        "month_from": month_from,
+        "month_to": (month_from + timedelta(days=32)).replace(day=1),
+    }
+
+
+# pysqlite сам управляет транзакциями и ломает точки сохранения: отключаем это
+# и открываем транзакцию явно (рецепт из документации SQLAlchemy для SQLite)
+def _enable_sqlite_savepoints(engine):
+    @event.listens_for(engine.sync_engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+async def run(url: str, users: int, posts: int, verbose: bool = False):
+    engine = create_database_engine(url)
+    query_debug.instrument_engine(engine, log_slow=False)
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        _enable_sqlite_savepoints(engine)
+    analyze = dialect == "postgresql"
+    # Фоновые задачи crud выполняются в той же транзакции: их запросы тоже проверяются
+    # и откатываются вместе с остальными
+    jobs.queue.backend = "inline"
+    # Лента должна читать посты из базы, а не из кэша авторов
+    feed.author_cache.clear()
+    reports = []
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        # commit внутри crud освобождает точку сохранения, а не внешнюю транзакцию
+        db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        try:
+            if posts:
+                await seed(db, users, posts)
+                if dialect == "postgresql":
+                    await conn.exec_driver_sql("ANALYZE posts, users, user_post_stats")
+            ctx = await build_context(db)
+            for name, query in QUERIES:
+                with query_debug.capture_queries() as log:
+                    await query(db, ctx)
+                for statement, parameters, elapsed in log.statements:
+                    if not query_debug.is_explainable(statement):
+                        continue
+                    plan = await conn.run_sync(
+                        lambda sync_conn: query_debug.explain(sync_conn, statement, parameters, analyze=analyze))
+                    reports.append((name, statement, elapsed, plan, sequential_scans(dialect, plan)))
+        finally:
+            await db.close()
+            await transaction.rollback()
+            # В кэше авторов остались ключи откаченных постов
+            feed.author_cache.clear()
+    await engine.dispose()
+
+    for name, statement, elapsed, plan, scans in reports:
+        status = "SEQ SCAN " + ", ".join(scans) if scans else "ok"
+        print(f"{name:34} {elapsed * 1000:9.2f} ms  {status}")
+        if verbose or scans:
+            print("    " + query_debug.statement_shape(statement))
+            print("\n".join("    | " + line for line in plan.splitlines()))
+    return [report for report in reports if report[4]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report sequential scans in crud query plans")
+    parser.add_argument("--url", default=DATABASE_URL, help="строка подключения (по умолчанию DATABASE_URL)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=20000, help="сколько тестовых постов добавить на время проверки (0 — только имеющиеся данные)")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы всех запросов")
+    parser.add_argument("--fail-on-seq-scan", action="store_true", help="код возврата 1 при последовательных сканированиях (для CI)")
+    args = parser.parse_args()
+    flagged = asyncio.run(run(args.url, args.users, args.posts, args.verbose))
+    if flagged and args.fail_on_seq_scan:
+        sys.exit(1)
@@ -0,0 +1,237 @@
+# app/jobs.py
+# Фоновые задачи для побочных эффектов записи: обработчик запроса ставит задачу
+# в той же транзакции, что и запись, и отвечает сразу после commit.
+#
+#   jobs.enqueue(db, "refresh_user_stats", {...})   # до commit
+#   await db.commit()
+#   await jobs.dispatch(db)                         # после commit
+#
+# Способ выполнения (JOBS_BACKEND):
+# - "memory" — очередь asyncio в процессе воркера uvicorn, JOBS_CONCURRENCY задач
+#   одновременно. Не переживает перезапуск: задачи, не выполненные за
+#   JOBS_SHUTDOWN_TIMEOUT при остановке, теряются.
+# - "outbox" — строка в таблице job_outbox в той же транзакции; выполняет
+#   отдельный процесс `python -m app.worker`. Задача не теряется и выполняется
+#   хотя бы один раз, поэтому обработчики должны быть идемпотентными.
+# - "inline" — сразу после commit в том же запросе (тесты, отладка).
+# Неудачная задача повторяется до JOBS_MAX_ATTEMPTS раз с экспоненциальной паузой.
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import metrics
+from .config import (
+    JOBS_BACKEND,
+    JOBS_CONCURRENCY,
+    JOBS_QUEUE_SIZE,
+    JOBS_MAX_ATTEMPTS,
+    JOBS_RETRY_DELAY,
+    JOBS_SHUTDOWN_TIMEOUT,
+)
+from .models import JobOutbox
+
+logger = logging.getLogger(__name__)
+
+JOBS_PROCESSED = metrics.registry.counter(
+    "jobs_processed_total", "Background job runs by result (ok, retry, failed)", ("job", "result"))
+JOB_DURATION = metrics.registry.histogram(
+    "job_duration_seconds", "Background job handler time", ("job",))
+JOB_LAG = metrics.registry.histogram(
+    "job_lag_seconds", "Time from enqueue to the start of a job run", ("job",))
+
+
+# Обработчики: async def handler(db, payload) с собственной сессией БД
+handlers = {}
+
+def handler(name: str):
+    def register(func):
+        handlers[name] = func
+        return func
+    return register
+
+
+class Job:
+    def __init__(self, name: str, payload: dict, enqueued_at: float = None, attempts: int = 0):
+        self.name = name
+        self.payload = payload
+        self.enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        self.attempts = attempts
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Пауза перед попыткой attempt + 1: base, 2 * base, 4 * base ... со случайным разбросом
+def retry_delay(attempt: int, base: float = JOBS_RETRY_DELAY) -> float:
+    return base * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+
+
+# Выполнение одной попытки с метриками; исключение обработчика пробрасывается
+async def run_job(db, job: Job):
+    func = handlers.get(job.name)
+    if func is None:
+        raise LookupError(f"Unknown job: {job.name}")
+    JOB_LAG.observe(max(0.0, time.time() - job.enqueued_at), job.name)
+    started = time.perf_counter()
+    try:
+        await func(db, job.payload)
+    finally:
+        JOB_DURATION.observe(time.perf_counter() - started, job.name)
+
+
+class JobQueue:
+    def __init__(self, backend: str = "memory", concurrency: int = 4, maxsize: int = 10000,
+                 max_attempts: int = 5, session_factory=None):
+        if backend not in ("memory", "outbox", "inline"):
+            raise ValueError(f"Unknown jobs backend: {backend}")
+        self.backend = backend
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self.max_attempts = max_attempts
+        # По умолчанию — сессии основной БД (импорт при первом использовании: database
+        # импортирует модели, а они нужны этому модулю)
+        self.session_factory = session_factory
+        self.retrying = 0
+        # Очередь в outbox по данным последнего опроса app.worker (только в его процессе)
+        self.outbox_pending = 0
+        self._queue = None
+        self._workers = []
+        self._loop = None
+
+    def _get_session_factory(self):
+        if self.session_factory is None:
+            from .database import AsyncSessionLocal
+            self.session_factory = AsyncSessionLocal
+        return self.session_factory
+
+    # Очередь и задачи-исполнители привязаны к event loop и создаются при первой задаче
+    def _get_queue(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._loop = loop
+            self._workers = [loop.create_task(self._work()) for _ in range(self.concurrency)]
+        return self._queue
+
+    @property
+    def depth(self) -> int:
+        return (self._queue.qsize() if self._queue is not None else 0) + self.retrying
+
+    def enqueue(self, db, name: str, payload: dict):
+        if name not in handlers:
+            raise LookupError(f"Unknown job: {name}")
+        if self.backend == "outbox":
+            db.add(JobOutbox(name=name, payload=payload, created_at=utcnow(), run_at=utcnow(), attempts=0))
+        else:
+            db.info.setdefault("pending_jobs", []).append(Job(name, payload))
+
+    async def dispatch(self, db):
+        jobs = db.info.pop("pending_jobs", [])
+        for job in jobs:
+            if self.backend == "inline":
+                await self._attempt_inline(db, job)
+                continue
+            try:
+                self._get_queue().put_nowait(job)
+            except asyncio.QueueFull:
+                # Очередь переполнена: задача выполняется в запросе, запись замедляется
+                # вместо потери задачи
+                logger.warning("Job queue is full, running %s inline", job.name)
+                await self._attempt_inline(db, job)
+
+    async def _attempt_inline(self, db, job: Job):
+        job.attempts += 1
+        try:
+            await run_job(db, job)
+            JOBS_PROCESSED.inc(job.name, "ok")
+        except Exception:
+            await db.rollback()
+            if self.backend == "inline":
+                JOBS_PROCESSED.inc(job.name, "failed")
+                logger.exception("Job %s failed, payload %r", job.name, job.payload)
+            else:
+                self._schedule_retry(job)
+
+    def _schedule_retry(self, job: Job):
+        if job.attempts >= self.max_attempts:
+            JOBS_PROCESSED.inc(job.name, "failed")
+            logger.exception("Job %s failed after %d attempts, payload %r", job.name, job.attempts, job.payload)
+            return
+        JOBS_PROCESSED.inc(job.name, "retry")
+        logger.warning("Job %s failed (attempt %d), retrying", job.name, job.attempts, exc_info=True)
+        self.retrying += 1
+        asyncio.get_running_loop().call_later(retry_delay(job.attempts), self._requeue, job)
+
+    def _requeue(self, job: Job):
+        self.retrying -= 1
+        try:
+            self._get_queue().put_nowait(job)
+        except asyncio.QueueFull:
+            JOBS_PROCESSED.inc(job.name, "failed")
+            logger.error("Job queue is full, dropping retry of %s, payload %r", job.name, job.payload)
+
+    async def _work(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            job.attempts += 1
+            try:
+                async with self._get_session_factory()() as db:
+                    await run_job(db, job)
+                JOBS_PROCESSED.inc(job.name, "ok")
+            except Exception:
+                self._schedule_retry(job)
+            finally:
+                queue.task_done()
+
+    # Ожидание, пока очередь опустеет, включая задачи, отложенные до повтора
+    async def join(self):
+        while self._queue is not None:
+            await self._queue.join()
+            if not self.retrying:
+                return
+            await asyncio.sleep(0.01)
+
+    # Остановка воркера uvicorn: ждём выполнения очереди не дольше timeout
+    async def shutdown(self, timeout: float = JOBS_SHUTDOWN_TIMEOUT):
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Dropping %d background jobs on shutdown", self.depth)
+        for worker in self._workers:
+            worker.cancel()
+        self._queue = None
+        self._workers = []
+
+
+queue = JobQueue(
+    backend=JOBS_BACKEND,
+    concurrency=JOBS_CONCURRENCY,
+    maxsize=JOBS_QUEUE_SIZE,
+    max_attempts=JOBS_MAX_ATTEMPTS,
+)
+
+metrics.registry.gauge(
+    "jobs_queue_depth", "Background jobs waiting to run", ("backend",),
+    collect=lambda: [(("memory",), queue.depth), (("outbox",), queue.outbox_pending)],
+)
+
+# Задачи откаченной транзакции не выполняются
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_jobs(session):
+    session.info.pop("pending_jobs", None)
+
+
+def enqueue(db, name: str, payload: dict):
+    queue.enqueue(db, name, payload)
+
+async def dispatch(db):
+    await queue.dispatch(db)
+
+async def shutdown_event():
+    await queue.shutdown()
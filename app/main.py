@@ -1,99 +1,290 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import timedelta
-from .database import get_db, startup_event
+from datetime import datetime, timedelta
+import logging
+from typing import Literal, Optional, Union
+from .database import get_db, get_read_db, stick_to_primary, engine, pool_metrics
 from .crud import (
     create_post as crud_create_post,
     get_posts as crud_get_posts,
+    get_posts_page as crud_get_posts_page,
     get_post as crud_get_post,
+    get_post_validator as crud_get_post_validator,
+    get_post_expanded as crud_get_post_expanded,
+    get_posts_by_ids as crud_get_posts_by_ids,
+    attach_authors as crud_attach_authors,
+    attach_tags as crud_attach_tags,
+    get_tags as crud_get_tags,
     update_post as crud_update_post,
     delete_post as crud_delete_post,
     search_posts as crud_search_posts,
+    search_posts_page as crud_search_posts_page,
     get_user_post_statistics as crud_get_user_post_statistics,
+    follow_user as crud_follow_user,
+    unfollow_user as crud_unfollow_user,
+    get_feed as crud_get_feed,
     create_user,
 )
-from .schemas import PostCreate, Post, User, UserCreate, Token
+from .schemas import PostCreate, Post, PostExpanded, PostFields, PostPage, TagCount, PostBatch, PostBatchRequest, PostSearchResult, BulkPostResult, User, UserCreate, Token, CurrentUser
 from .auth import get_current_user, create_access_token, authenticate_user
 from .user_operations import get_user_by_username
+from . import post_cache
+from .fields import SUMMARY_FIELDS, parse_fields, project
+from .bulk import iter_items, ingest_posts
+from .export import export_response
+from .serialization import dump_post_page, dump_search_results
+from .hashing import HashingPoolSaturated, shutdown_event as hashing_shutdown_event
+from . import startup
+from .jobs import shutdown_event as jobs_shutdown_event
+from .metrics import MetricsMiddleware, registry as metrics_registry
+from .query_debug import QueryDebugMiddleware
+from .rate_limit import RateLimitMiddleware
+from .compression import CompressionMiddleware
+from .config import QUERY_DEBUG, POSTS_BATCH_MAX_IDS
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
+# Сжатие ближе всех к приложению: метрики учитывают его время
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+if QUERY_DEBUG:
+    app.add_middleware(QueryDebugMiddleware)
 
-app.add_event_handler("startup", startup_event)
+app.add_event_handler("startup", startup.startup_event)
+app.add_event_handler("shutdown", startup.shutdown_event)
+app.add_event_handler("shutdown", jobs_shutdown_event)
+app.add_event_handler("shutdown", hashing_shutdown_event)
 
+# Связи, которые можно встроить в ответ параметром ?expand=author,tags
+EXPANDABLE = post_cache.EXPANDABLE
 
-@app.get("/posts", response_model=list[Post])
-async def read_posts(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
-    if skip or limit:
-        posts = await crud_get_posts(db, skip=skip, limit=limit)
-    else:
-        posts = await crud_get_posts(db)
-    if not posts:
-        raise HTTPException(status_code=404, detail="No posts found")
-    return posts
+def get_expand(expand: Optional[str] = None) -> tuple:
+    if not expand:
+        return ()
+    values = sorted({value.strip() for value in expand.split(",") if value.strip()})
+    unknown = [value for value in values if value not in EXPANDABLE]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported expand: {', '.join(unknown)}")
+    return tuple(values)
+
+# Поля постов в списках: ?fields=id,title или ?view=summary (без content, с excerpt).
+# None — все поля, как раньше.
+def get_fields(fields: Optional[str] = None, view: Literal["full", "summary"] = "full") -> Optional[tuple]:
+    if fields:
+        try:
+            return parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Unsupported fields: {e}")
+    return SUMMARY_FIELDS if view == "summary" else None
+
+
+# paginate=cursor (или переданный cursor) включает keyset-пагинацию и ответ PostPage,
+# без них остаётся прежний режим skip/limit со списком постов.
+# expand=author добавляет к каждому посту объект author (JOIN в том же запросе),
+# expand=tags — список тегов (один запрос на страницу). tag — только посты с тегом.
+# fields/view=summary — только указанные поля (content не читается из БД).
+# Страницы кэшируются до следующей записи и отдаются с ETag.
+@app.get("/posts", response_model=Union[list[Post], list[PostExpanded], list[PostFields], PostPage])
+async def read_posts(request: Request, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, paginate: Literal["offset", "cursor"] = "offset", tag: Optional[str] = None, expand: tuple = Depends(get_expand), fields: Optional[tuple] = Depends(get_fields), db: AsyncSession = Depends(get_read_db)):
+    cursor_mode = bool(cursor) or paginate == "cursor"
+    key = await post_cache.list_key({"skip": skip, "limit": limit, "cursor": cursor, "paginate": "cursor" if cursor_mode else "offset", "tag": tag, "expand": ",".join(expand) or None, "fields": ",".join(fields) if fields else None})
+    entry = await post_cache.get_list(key)
+    if entry is None:
+        with_author = "author" in expand
+        if cursor_mode:
+            items, next_cursor, prev_cursor = await crud_get_posts_page(db, cursor=cursor, limit=limit, with_author=with_author, tag=tag, fields=fields)
+            if "tags" in expand:
+                await crud_attach_tags(db, items)
+            if fields:
+                project(items, fields)
+            entry = post_cache.build_list_entry(items, next_cursor, prev_cursor, cursor_mode=True)
+        else:
+            if skip or limit:
+                posts = await crud_get_posts(db, skip=skip, limit=limit, with_author=with_author, tag=tag, fields=fields)
+            else:
+                posts = await crud_get_posts(db, with_author=with_author, tag=tag, fields=fields)
+            if not posts:
+                raise HTTPException(status_code=404, detail="No posts found")
+            if "tags" in expand:
+                await crud_attach_tags(db, posts)
+            if fields:
+                project(posts, fields)
+            entry = post_cache.build_list_entry(posts)
+        await post_cache.store_list(key, entry)
+    return post_cache.respond(request, entry, validate_last_modified=False)
+
+@app.get("/post/{id}", response_model=Union[Post, PostExpanded])
+async def read_post(id: int, request: Request, expand: tuple = Depends(get_expand), db: AsyncSession = Depends(get_read_db)):
+    variant = ",".join(expand)
+    entry = await post_cache.get_post(id, variant)
+    if entry is None and ("if-none-match" in request.headers or "if-modified-since" in request.headers):
+        # Условный запрос мимо кэша: сначала сверяем версию, содержимое читаем,
+        # только если оно изменилось
+        validator = await crud_get_post_validator(db, id)
+        if validator is not None:
+            not_modified = post_cache.check_not_modified(request, validator)
+            if not_modified is not None:
+                return not_modified
+    if entry is None:
+        if expand:
+            post = await crud_get_post_expanded(db, id, with_author="author" in expand, with_tags="tags" in expand)
+            entry = await post_cache.store_post(post, variant, schema=PostExpanded)
+        else:
+            post = await crud_get_post(db, id)
+            if post is None:
+                raise HTTPException(status_code=404, detail="Post not found")
+            entry = await post_cache.store_post(post)
+    return post_cache.respond(request, entry)
 
-@app.get("/post/{id}", response_model=Post)
-async def read_post(id: int, db: AsyncSession = Depends(get_db)):
-    post = await crud_get_post(db, id)
-    if post is None:
-        raise HTTPException(status_code=404, detail="Post not found")
-    return post
+# Пакетное чтение: посты из кэша GET /post/{id} (одно обращение get_many), остальные —
+# одним запросом к БД, после чего они тоже попадают в кэш. Порядок ответа — порядок
+# запрошенных ID (повторы убираются), ненайденные ID перечисляются в missing.
+async def read_post_batch(ids: list[int], request: Request, expand: tuple, db: AsyncSession):
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > POSTS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids, the limit is {POSTS_BATCH_MAX_IDS}")
+    variant = ",".join(expand)
+    entries = await post_cache.get_posts(ids, variant)
+    misses = [post_id for post_id in ids if post_id not in entries]
+    if misses:
+        with_author = "author" in expand
+        posts = await crud_get_posts_by_ids(db, misses, with_author=with_author)
+        if "tags" in expand:
+            await crud_attach_tags(db, list(posts.values()))
+        entries.update(await post_cache.store_posts(posts.values(), variant, schema=PostExpanded if expand else Post))
+    missing = [post_id for post_id in ids if post_id not in entries]
+    entry = post_cache.build_batch_entry([entries[post_id] for post_id in ids if post_id in entries], missing)
+    return post_cache.respond(request, entry, validate_last_modified=False)
+
+# GET /posts/batch?ids=1,2,3
+@app.get("/posts/batch", response_model=PostBatch)
+async def read_posts_batch(ids: str, request: Request, expand: tuple = Depends(get_expand), db: AsyncSession = Depends(get_read_db)):
+    try:
+        post_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    return await read_post_batch(post_ids, request, expand, db)
+
+# Тот же ответ для длинных списков ID в теле запроса: {"ids": [...]}
+@app.post("/posts/batch", response_model=PostBatch)
+async def read_posts_batch_body(batch: PostBatchRequest, request: Request, expand: tuple = Depends(get_expand), db: AsyncSession = Depends(get_read_db)):
+    return await read_post_batch(batch.ids, request, expand, db)
 
 @app.post("/posts", response_model=Post)
-async def create_post(post: PostCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_post(post: PostCreate, response: Response, db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
     try:
         return await crud_create_post(db, post, user_id=current_user.id)
     except Exception as e:
         raise HTTPException(status_code=400, detail="Error creating post") from e
 
+# Массовая загрузка: JSON-массив или NDJSON (Content-Type: application/x-ndjson)
+# с объектами {"title": ..., "content": ...}. Ошибки отдельных элементов
+# возвращаются в errors, остальные посты сохраняются.
+@app.post("/posts/bulk", response_model=BulkPostResult)
+async def bulk_create_posts(request: Request, response: Response, db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
+    return await ingest_posts(db, iter_items(request), user_id=current_user.id)
+
+# Изменение и удаление выполняются одним условным запросом с проверкой владельца.
+# If-Match с ETag поста включает оптимистическую блокировку: при несовпадении версии 412.
 @app.put("/posts/{id}", response_model=Post)
-async def update_post(id: int, post: PostCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    existing_post = await crud_get_post(db, id)
-    if not existing_post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    if existing_post.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this post")
-    
+async def update_post(id: int, post: PostCreate, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
+    versions = post_cache.versions_from_if_match(if_match, id)
     try:
-        return await crud_update_post(db, id, post)
+        updated_post = await crud_update_post(db, id, post, user_id=current_user.id, versions=versions)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail="Error updating post") from e
+    response.headers["ETag"] = post_cache.post_etag(updated_post)
+    return updated_post
 
 @app.delete("/posts/{id}")
-async def delete_post(id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    post = await crud_get_post(db, id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    if post.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this post")
-    
+async def delete_post(id: int, response: Response, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
+    versions = post_cache.versions_from_if_match(if_match, id)
     try:
-        await crud_delete_post(db, id)
-        return {"message": "Post deleted successfully"}
+        return await crud_delete_post(db, id, user_id=current_user.id, versions=versions)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail="Error deleting post") from e
 
-@app.get("/posts/search", response_model=list[Post])
-async def search_posts(query: str, skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
-    posts = await crud_search_posts(db, query=query, skip=skip, limit=limit)
+# Связи для результатов поиска: по одному запросу IN (...) на страницу
+async def attach_expanded(db: AsyncSession, posts: list[dict], expand: tuple):
+    if "author" in expand:
+        await crud_attach_authors(db, posts)
+    if "tags" in expand:
+        await crud_attach_tags(db, posts)
+
+# Ответ сериализуется из строк БД напрямую (app/serialization.py);
+# response_model описывает его формат для OpenAPI
+@app.get("/posts/search", response_model=Union[list[PostSearchResult], PostPage])
+async def search_posts(query: str, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, paginate: Literal["offset", "cursor"] = "offset", tag: Optional[str] = None, expand: tuple = Depends(get_expand), db: AsyncSession = Depends(get_read_db)):
+    if cursor or paginate == "cursor":
+        items, next_cursor, prev_cursor = await crud_search_posts_page(db, query=query, cursor=cursor, limit=limit, tag=tag)
+        await attach_expanded(db, items, expand)
+        return Response(content=dump_post_page(items, next_cursor, prev_cursor), media_type="application/json")
+    posts = await crud_search_posts(db, query=query, skip=skip, limit=limit, tag=tag)
     if not posts:
         raise HTTPException(status_code=404, detail="No posts found matching the search criteria")
-    return posts
+    await attach_expanded(db, posts, expand)
+    return Response(content=dump_search_results(posts), media_type="application/json")
+
+# Выгрузка постов потоком: format=ndjson|csv, фильтры по автору и дате создания
+# (created_from включительно, created_to не включительно)
+@app.get("/posts/export")
+async def export_posts(format: Literal["ndjson", "csv"] = "ndjson", user_id: Optional[int] = None, created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, db: AsyncSession = Depends(get_read_db)):
+    return export_response(db, format, user_id=user_id, created_from=created_from, created_to=created_to)
 
 @app.get("/posts/statistics/{user_id}")
-async def get_user_statistics(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_statistics(user_id: int, db: AsyncSession = Depends(get_read_db)):
     statistics = await crud_get_user_post_statistics(db, user_id)
     if not statistics:
         raise HTTPException(status_code=404, detail="Statistics not found for this user")
     return statistics
 
+# Подписки на авторов для ленты GET /feed
+@app.post("/users/{user_id}/follow")
+async def follow_user(user_id: int, response: Response, db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
+    return await crud_follow_user(db, current_user.id, user_id)
+
+@app.delete("/users/{user_id}/follow")
+async def unfollow_user(user_id: int, response: Response, db: AsyncSession = Depends(get_db), current_user: CurrentUser = Depends(get_current_user)):
+    stick_to_primary(response)
+    return await crud_unfollow_user(db, current_user.id, user_id)
+
+# Лента: посты авторов, на которых подписан пользователь, новые первыми.
+# Пагинация только вперёд по next_cursor; expand, fields и view — как в GET /posts.
+FEED_MAX_LIMIT = 100
+
+@app.get("/feed", response_model=PostPage)
+async def read_feed(cursor: Optional[str] = None, limit: int = 10, expand: tuple = Depends(get_expand), fields: Optional[tuple] = Depends(get_fields), db: AsyncSession = Depends(get_read_db), current_user: CurrentUser = Depends(get_current_user)):
+    if not 1 <= limit <= FEED_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {FEED_MAX_LIMIT}")
+    items, next_cursor = await crud_get_feed(db, current_user.id, cursor=cursor, limit=limit, with_author="author" in expand, fields=fields)
+    if "tags" in expand:
+        await crud_attach_tags(db, items)
+    if fields:
+        project(items, fields)
+    return Response(content=dump_post_page(items, next_cursor), media_type="application/json")
+
 @app.post("/register", response_model=User)
-async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    print("Register User:", user)
+async def register(user: UserCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    stick_to_primary(response)
     try:
         return await create_user(db, user)
+    except HashingPoolSaturated:
+        raise
     except Exception as e:
-        print("Register User:", e)
+        logger.exception("Error registering user %s", user.username)
         raise HTTPException(status_code=400, detail="Error registering user") from e
 
 @app.post("/token", response_model=Token)
@@ -107,6 +298,29 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         )
     
     access_token_expires = timedelta(minutes=70)
-    access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
+    access_token = create_access_token(data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
+# Облако тегов: теги с числом постов, самые популярные первыми
+@app.get("/tags", response_model=list[TagCount])
+async def read_tags(limit: int = 50, db: AsyncSession = Depends(get_read_db)):
+    return await crud_get_tags(db, limit=limit)
+
+# Готовность воркера для балансировщика и проверок Kubernetes: 200 только после
+# проверки схемы и прогрева, 503 во время запуска и остановки
+@app.get("/ready")
+async def read_ready(response: Response):
+    if not startup.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not ready"}
+    return {"status": "ready"}
+
+# Состояние пула соединений: занятые соединения, overflow и время ожидания
+@app.get("/metrics/pool")
+async def read_pool_metrics():
+    return pool_metrics(engine)
+
+# Метрики в текстовом формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,259 @@
+# app/metrics.py
+# Метрики в текстовом формате Prometheus без внешних зависимостей.
+# Запросы считаются по шаблону маршрута (/post/{id}, а не /post/42), время
+# и число SQL-запросов на HTTP-запрос собираются событиями SQLAlchemy,
+# ожидание пула — InstrumentedQueuePool, время bcrypt — HashingPool.
+# На горячем пути только bisect по границам бакетов и сложение.
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self):
+        self._values.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            # [счётчики по бакетам (+Inf последним), сумма, количество]
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get(self, *labels):
+        state = self._values.get(labels)
+        return {"count": state[2], "sum": state[1]} if state else {"count": 0, "sum": 0.0}
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+# Значение, которое вычисляется в момент чтения /metrics (например, состояние пула)
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def render(self):
+        if self.collect is not None:
+            self._values = dict(self.collect())
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+HTTP_REQUEST_DB_DURATION = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request", ("method", "route"))
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time")
+DB_POOL_WAIT = registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection when all connections are checked out")
+PASSWORD_HASH_DURATION = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt time by operation, excluding queueing", ("operation",),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0))
+
+
+# Счётчики текущего HTTP-запроса. Объект изменяемый: контекст копируется в
+# дочерние задачи (например, при отдаче StreamingResponse), а данные общие.
+class RequestStats:
+    __slots__ = ("db_seconds", "queries")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+# Слушатели событий курсора для движка. Время выполнения пишется в общую
+# гистограмму и в счётчики текущего запроса, если он есть.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+        stats.queries += 1
+
+def _handle_error(exception_context):
+    # Незавершённый запрос не должен оставить время старта в стеке соединения
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    return engine
+
+
+# ASGI middleware. Шаблон маршрута берётся из endpoint, который Starlette
+# записывает в scope после маршрутизации; запросы мимо маршрутов попадают
+# под route="unmatched", чтобы число серий оставалось ограниченным.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_template(self, scope) -> str:
+        if self._routes is None:
+            app = scope.get("app")
+            self._routes = {
+                (getattr(route, "endpoint", None), method): route.path
+                for route in getattr(app, "routes", ())
+                for method in (getattr(route, "methods", None) or ("",))
+            }
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get((endpoint, scope["method"]))
+        if route is None:
+            route = self._routes.get((endpoint, ""), "unmatched")
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            method = scope["method"]
+            route = self._route_template(scope)
+            HTTP_REQUESTS.inc(method, route, str(status_code))
+            HTTP_REQUEST_DURATION.observe(elapsed, method, route)
+            HTTP_REQUEST_DB_DURATION.observe(stats.db_seconds, method, route)
+            HTTP_REQUEST_DB_QUERIES.observe(stats.queries, method, route)
@@ -1,21 +1,118 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import DDL, Column, Integer, String, Date, DateTime, ForeignKey, Index, JSON, event
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from .database import Base
 
+# В SQLite CURRENT_TIMESTAMP (func.now()) хранится без микросекунд. Храним даты
+# в том же формате, иначе сравнения по курсору с параметрами расходятся.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 class Post(Base):
     __tablename__ = "posts"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     content = Column(String, nullable=False)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Начало content для списков (view=summary), заполняется при записи (app/fields.py)
+    excerpt = Column(String)
+    created_at = Column(Timestamp, default=func.now())
+    updated_at = Column(Timestamp, default=func.now(), onupdate=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Увеличивается при каждом изменении; используется в ETag и If-Match
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        # Ключ для keyset-пагинации и стабильной сортировки
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # Посты одного пользователя по времени: экспорт, пересчёт статистики
+        Index("ix_posts_user_id_created_at", "user_id", "created_at", "id"),
+    )
+    # created_at и updated_at возвращаются из INSERT ... RETURNING: месяц нового
+    # поста для статистики известен без отдельного SELECT
+    __mapper_args__ = {"eager_defaults": True}
+
+# Хранение длинных текстов в PostgreSQL при create_all — как в миграции 3f8d2b6e9a14:
+# content больше порога сжимается (lz4 с PostgreSQL 14) и выносится из строки таблицы
+def _supports_lz4(ddl, target, bind, **kw):
+    return bind.dialect.name == "postgresql" and bind.dialect.server_version_info >= (14,)
+
+event.listen(Post.__table__, "after_create", DDL("ALTER TABLE posts SET (toast_tuple_target = 512)").execute_if(dialect="postgresql"))
+event.listen(Post.__table__, "after_create", DDL("ALTER TABLE posts ALTER COLUMN content SET COMPRESSION lz4").execute_if(callable_=_supports_lz4))
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime, default=func.now())
+
+# Подписки: follower_id читает посты followee_id в ленте (GET /feed).
+# Авторы, на которых подписан пользователь, читаются по первичному ключу.
+class Follow(Base):
+    __tablename__ = "follows"
+
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime, default=func.now())
+
+# Число постов пользователя по месяцам; обновляется при создании и удалении постов
+class UserPostStats(Base):
+    __tablename__ = "user_post_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    post_count = Column(Integer, nullable=False, default=0)
+
+# Ключи уже применённых задач refresh_user_stats (app/stats.py): ключ записывается
+# в одной транзакции с изменением счётчика, и повтор задачи его не меняет
+class UserPostStatsJob(Base):
+    __tablename__ = "user_post_stats_jobs"
+
+    key = Column(String, primary_key=True)
+    applied_at = Column(DateTime, nullable=False, index=True)
+
+# Теги постов. post_count — число постов с тегом, обновляется при записи постов
+# (app/tags.py), поэтому облако тегов не требует GROUP BY по post_tags.
+class Tag(Base):
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    post_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+# Самые популярные теги (GET /tags) читаются по индексу без сортировки
+Index("ix_tags_post_count_name", Tag.post_count.desc(), Tag.name)
+
+class PostTag(Base):
+    __tablename__ = "post_tags"
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        # Посты с тегом (?tag=): первичный ключ начинается с post_id и не подходит
+        Index("ix_post_tags_tag_id_post_id", "tag_id", "post_id"),
+    )
+
+# Надёжная очередь фоновых задач (JOBS_BACKEND=outbox, app/jobs.py). Строка
+# добавляется в транзакции записи и удаляется после выполнения задачи.
+# run_at — когда задачу можно взять (после взятия сдвигается на время аренды),
+# NULL — попытки исчерпаны, задача оставлена для разбора вместе с last_error.
+class JobOutbox(Base):
+    __tablename__ = "job_outbox"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    run_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(String)
+
+    __table_args__ = (
+        Index("ix_job_outbox_run_at_id", "run_at", "id"),
+    )
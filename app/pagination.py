@@ -0,0 +1,66 @@
+# app/pagination.py
+# Keyset-пагинация (по курсору). Курсор — непрозрачная base64-строка с ключом
+# последней/первой записи страницы и направлением перехода.
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_cursor(created_at: datetime, id: int, direction: str = "next") -> str:
+    raw = json.dumps([created_at.isoformat(), id, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), int(id), direction
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Возвращает (записи, next_cursor, prev_cursor); записи — словари колонок
+# запроса, в нём должны быть created_at и id.
+# Порядок стабильный: (created_at, id) по возрастанию, его обслуживает
+# составной индекс ix_posts_created_at_id. Курсор нужно декодировать до вызова,
+# чтобы ошибка 400 не потерялась во внешних обработчиках.
+async def fetch_keyset_page(db: AsyncSession, query, model, key, limit: int = 10):
+    key_columns = tuple_(model.created_at, model.id)
+    if key is None:
+        direction = "next"
+    else:
+        created_at, id, direction = key
+        key_values = tuple_(literal(created_at, model.created_at.type), literal(id, model.id.type))
+        if direction == "next":
+            query = query.where(key_columns > key_values)
+        else:
+            query = query.where(key_columns < key_values)
+
+    if direction == "next":
+        query = query.order_by(model.created_at, model.id)
+    else:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = [row._asdict() for row in result]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    if direction == "next":
+        next_cursor = encode_cursor(last["created_at"], last["id"], "next") if has_more else None
+        prev_cursor = encode_cursor(first["created_at"], first["id"], "prev") if key is not None else None
+    else:
+        next_cursor = encode_cursor(last["created_at"], last["id"], "next")
+        prev_cursor = encode_cursor(first["created_at"], first["id"], "prev") if has_more else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,197 @@
+# app/post_cache.py
+# Кэш сериализованных ответов GET /post/{id} и GET /posts с ETag/Last-Modified.
+# Запись поста обновляет его ключ (write-through) и сдвигает поколение списков:
+# страницы списков хранятся под ключом с номером поколения, поэтому после
+# любой записи старые страницы больше не читаются и истекают по ttl.
+import hashlib
+import json
+from collections import namedtuple
+from itertools import combinations
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from .cache import MemoryCacheBackend, RedisCacheBackend
+from .config import RESPONSE_CACHE_URL, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+from .schemas import Post
+from .serialization import dump_post_page, dump_posts
+
+CachedResponse = namedtuple("CachedResponse", ["body", "etag", "last_modified"])
+
+LIST_GENERATION_KEY = "posts:generation"
+
+# Связи, которые можно встроить в ответ параметром ?expand=...
+EXPANDABLE = ("author", "tags")
+
+# Варианты одного поста с раскрытыми связями (все сочетания EXPANDABLE в порядке
+# сортировки, как их строит main.get_expand), которые кэшируются отдельно и
+# сбрасываются при записи поста
+POST_VARIANTS = tuple(
+    ",".join(names) for size in range(1, len(EXPANDABLE) + 1) for names in combinations(sorted(EXPANDABLE), size)
+)
+
+
+def _create_backend():
+    if RESPONSE_CACHE_URL:
+        # Необязательная зависимость: нужна только для общего кэша
+        import redis.asyncio
+        return RedisCacheBackend(redis.asyncio.from_url(RESPONSE_CACHE_URL), ttl=RESPONSE_CACHE_TTL)
+    return MemoryCacheBackend(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+response_cache = _create_backend()
+
+
+def _pack(entry: CachedResponse) -> bytes:
+    return json.dumps([entry.etag, entry.last_modified]).encode() + b"\n" + entry.body
+
+def _unpack(raw: bytes) -> CachedResponse:
+    meta, body = raw.split(b"\n", 1)
+    etag, last_modified = json.loads(meta)
+    return CachedResponse(body, etag, last_modified)
+
+def _http_date(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+# Сильный ETag поста: id и номер версии. Его же принимает If-Match в PUT/DELETE.
+def post_etag(post) -> str:
+    return '"%d-%d"' % (post.id, post.version)
+
+# Версии из If-Match для поста post_id: None — без проверки ("*" или нет заголовка),
+# пустой список — ни один тег не подходит (412)
+def versions_from_if_match(header, post_id: int):
+    if header is None or header.strip() == "*":
+        return None
+    versions = []
+    for value in header.split(","):
+        value = value.strip()
+        # Слабые теги для If-Match не подходят (RFC 9110, 13.1.1)
+        if value.startswith("W/"):
+            continue
+        id, _, version = value.strip('"').partition("-")
+        if id == str(post_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
+
+def post_key(post_id: int, variant: str = "") -> str:
+    return f"post:{post_id}:{variant}" if variant else f"post:{post_id}"
+
+
+# Сериализация одного поста (ORM-объекта, строки или словаря) в запись кэша.
+# Варианты с раскрытыми связями имеют тот же ETag: связи не меняют версию поста.
+# exclude_unset оставляет в ответе только связи, которые есть в post.
+def build_post_entry(post, schema=Post) -> CachedResponse:
+    post = schema.model_validate(post)
+    return CachedResponse(post.model_dump_json(exclude_unset=True).encode(), post_etag(post), _http_date(post.updated_at))
+
+# Сериализация страницы списка (строки из crud в виде словарей): ETag — хеш
+# содержимого, Last-Modified — самое позднее изменение среди постов страницы
+def build_list_entry(posts, next_cursor=None, prev_cursor=None, cursor_mode=False) -> CachedResponse:
+    if cursor_mode:
+        body = dump_post_page(posts, next_cursor, prev_cursor)
+    else:
+        body = dump_posts(posts)
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    # Без updated_at в ?fields= страница отдаётся без Last-Modified
+    last_modified = max((post["updated_at"] for post in posts if post.get("updated_at")), default=None)
+    return CachedResponse(body, etag, _http_date(last_modified))
+
+
+async def get_post(post_id: int, variant: str = ""):
+    raw = await response_cache.get(post_key(post_id, variant))
+    return _unpack(raw) if raw is not None else None
+
+async def store_post(post, variant: str = "", schema=Post) -> CachedResponse:
+    entry = build_post_entry(post, schema)
+    if RESPONSE_CACHE_TTL > 0:
+        post_id = post["id"] if isinstance(post, dict) else post.id
+        await response_cache.set(post_key(post_id, variant), _pack(entry))
+    return entry
+
+# Пакетное чтение: записи тех же ключей, что у GET /post/{id}, одним обращением
+# к кэшу. Возвращает {id: запись} только для найденных в кэше постов.
+async def get_posts(post_ids, variant: str = "") -> dict:
+    raws = await response_cache.get_many([post_key(post_id, variant) for post_id in post_ids])
+    return {post_id: _unpack(raw) for post_id, raw in zip(post_ids, raws) if raw is not None}
+
+# Записи для постов из БД (словари колонок) с сохранением в кэш одной пачкой
+async def store_posts(posts, variant: str = "", schema=Post) -> dict:
+    entries = {post["id"]: build_post_entry(post, schema) for post in posts}
+    if RESPONSE_CACHE_TTL > 0 and entries:
+        await response_cache.set_many([(post_key(post_id, variant), _pack(entry)) for post_id, entry in entries.items()])
+    return entries
+
+# Ответ пакетного чтения собирается из готовых тел постов без повторной сериализации
+def build_batch_entry(entries, missing) -> CachedResponse:
+    body = b'{"items":[' + b",".join(entry.body for entry in entries) + b'],"missing":' + json.dumps(missing, separators=(",", ":")).encode() + b"}"
+    return CachedResponse(body, '"%s"' % hashlib.md5(body).hexdigest(), None)
+
+async def list_key(params: dict) -> str:
+    generation = await response_cache.get_counter(LIST_GENERATION_KEY)
+    query = "&".join(f"{name}={params[name]}" for name in sorted(params) if params[name] is not None)
+    return f"posts:list:{generation}:{query}"
+
+async def get_list(key: str):
+    raw = await response_cache.get(key)
+    return _unpack(raw) if raw is not None else None
+
+async def store_list(key: str, entry: CachedResponse):
+    if RESPONSE_CACHE_TTL > 0:
+        await response_cache.set(key, _pack(entry))
+
+
+# Вызываются из crud после успешного commit
+async def post_written(post):
+    await store_post(post)
+    await response_cache.delete(*(post_key(post.id, variant) for variant in POST_VARIANTS))
+    await response_cache.incr(LIST_GENERATION_KEY)
+
+async def posts_bulk_written():
+    await response_cache.incr(LIST_GENERATION_KEY)
+
+async def post_deleted(post_id: int):
+    await response_cache.delete(post_key(post_id), *(post_key(post_id, variant) for variant in POST_VARIANTS))
+    await response_cache.incr(LIST_GENERATION_KEY)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    return any(value.removeprefix("W/") == etag.removeprefix("W/") for value in candidates)
+
+def _not_modified_since(header: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+# Ответ из записи кэша с учётом условных заголовков (304 Not Modified).
+# Для списков If-Modified-Since не проверяется: удаление поста не меняет
+# Last-Modified страницы, надёжен только ETag.
+def respond(request: Request, entry: CachedResponse, validate_last_modified: bool = True) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if entry.last_modified:
+        headers["Last-Modified"] = entry.last_modified
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, entry.etag)
+    else:
+        not_modified = (
+            validate_last_modified and bool(if_modified_since and entry.last_modified)
+            and _not_modified_since(if_modified_since, entry.last_modified)
+        )
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+# Условный GET поста, которого нет в кэше: ETag и Last-Modified считаются по
+# версии и времени изменения (post — строка с id, version, updated_at), до чтения
+# и сериализации содержимого. Возвращает 304 или None, если нужен полный ответ.
+def check_not_modified(request: Request, post):
+    response = respond(request, CachedResponse(b"", post_etag(post), _http_date(post.updated_at)))
+    return response if response.status_code == 304 else None
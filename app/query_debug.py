@@ -0,0 +1,169 @@
+# app/query_debug.py
+# Режим отладки запросов к БД для разработки и CI (QUERY_DEBUG=1).
+# Для каждого HTTP-запроса собирает выполненные SQL-выражения и пишет в лог
+# предупреждение, если их больше QUERY_DEBUG_MAX_STATEMENTS или одно и то же
+# выражение (с точностью до параметров) повторяется QUERY_DEBUG_MAX_REPEATS раз
+# и больше — типичный признак N+1. Выражения дольше SLOW_QUERY_SECONDS
+# логируются с параметрами и планом EXPLAIN.
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from .config import QUERY_DEBUG_MAX_STATEMENTS, QUERY_DEBUG_MAX_REPEATS, SLOW_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+# Форма выражения: без литералов и лишних пробелов, чтобы запросы, отличающиеся
+# только значениями, считались одинаковыми
+def statement_shape(statement: str) -> str:
+    shape = re.sub(r"\s+", " ", statement).strip()
+    shape = re.sub(r"'(?:[^']|'')*'", "?", shape)
+    shape = re.sub(r"\b\d+\b", "?", shape)
+    # Развёрнутые IN (?, ?, ?) с разным числом элементов — одна форма
+    return re.sub(r"\((?:\s*(?:\?|\$\?(?:::\w+)?|%\(\w+\)s)\s*,?)+\)", "(...)", shape)
+
+
+class QueryLog:
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement: str, parameters, elapsed: float):
+        self.statements.append((statement, parameters, elapsed))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(elapsed for _, _, elapsed in self.statements)
+
+    # Формы, которые встречаются max_repeats раз и больше: {форма: число повторов}
+    def repeated(self, max_repeats: int = QUERY_DEBUG_MAX_REPEATS) -> dict:
+        shapes = Counter(statement_shape(statement) for statement, _, _ in self.statements)
+        return {shape: count for shape, count in shapes.items() if count >= max_repeats}
+
+    # Описание проблем или пустой список, если запрос укладывается в бюджет
+    def problems(self, max_statements: int = QUERY_DEBUG_MAX_STATEMENTS, max_repeats: int = QUERY_DEBUG_MAX_REPEATS):
+        problems = []
+        if max_statements is not None and self.count > max_statements:
+            problems.append(f"{self.count} statements (budget {max_statements})")
+        if max_repeats is not None:
+            for shape, count in self.repeated(max_repeats).items():
+                problems.append(f"{count}x {shape}")
+        return problems
+
+    def report(self) -> str:
+        lines = [f"{i + 1}. {elapsed * 1000:.2f} ms {statement_shape(statement)}" for i, (statement, _, elapsed) in enumerate(self.statements)]
+        return "\n".join(lines)
+
+current_log: ContextVar = ContextVar("query_debug_log", default=None)
+
+
+# Сбор выражений внутри блока; используется middleware и фикстурой query_budget
+@contextmanager
+def capture_queries():
+    log = QueryLog()
+    token = current_log.set(log)
+    try:
+        yield log
+    finally:
+        current_log.reset(token)
+
+
+# План выражения. analyze=True в PostgreSQL выполняет его (EXPLAIN ANALYZE) внутри
+# точки сохранения, которая затем откатывается; SQLite плана с замерами не умеет.
+def explain(conn, statement, parameters, analyze: bool = False) -> str:
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+    # Отдельный курсор DBAPI: EXPLAIN не проходит через события и не попадает в журнал
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if dialect == "postgresql":
+            # Ошибка EXPLAIN не должна прерывать транзакцию обработчика
+            cursor.execute("SAVEPOINT query_debug_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" ".join(str(value) for value in row) for row in cursor.fetchall())
+        finally:
+            if dialect == "postgresql":
+                cursor.execute("ROLLBACK TO SAVEPOINT query_debug_explain")
+                cursor.execute("RELEASE SAVEPOINT query_debug_explain")
+        return plan
+    finally:
+        cursor.close()
+
+def is_explainable(statement: str) -> bool:
+    return statement.lstrip().upper().startswith(EXPLAINABLE)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_debug_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_debug_started"].pop()
+    conn.info["query_debug_elapsed"] = elapsed
+    log = current_log.get()
+    if log is not None:
+        log.record(statement, parameters, elapsed)
+
+def _log_slow_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = conn.info["query_debug_elapsed"]
+    if SLOW_QUERY_SECONDS > 0 and elapsed >= SLOW_QUERY_SECONDS:
+        plan = None
+        if not executemany and is_explainable(statement):
+            try:
+                plan = explain(conn, statement, parameters)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+        logger.warning(
+            "Slow statement (%.1f ms): %s\nparameters: %r\nplan:\n%s",
+            elapsed * 1000, statement, parameters, plan,
+        )
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_debug_started"):
+        conn.info["query_debug_started"].pop()
+
+# log_slow=False — только сбор выражений для capture_queries (index_advisor)
+def instrument_engine(engine, log_slow: bool = True):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    if log_slow:
+        event.listen(sync_engine, "after_cursor_execute", _log_slow_statement)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    return engine
+
+
+# ASGI middleware: подключается в main.py только при QUERY_DEBUG
+class QueryDebugMiddleware:
+    def __init__(self, app, max_statements: int = QUERY_DEBUG_MAX_STATEMENTS, max_repeats: int = QUERY_DEBUG_MAX_REPEATS):
+        self.app = app
+        self.max_statements = max_statements
+        self.max_repeats = max_repeats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with capture_queries() as log:
+            await self.app(scope, receive, send)
+        problems = log.problems(self.max_statements, self.max_repeats)
+        if problems:
+            logger.warning(
+                "%s %s: %s\n%s",
+                scope["method"], scope["path"], "; ".join(problems), log.report(),
+            )
@@ -0,0 +1,202 @@
+# app/rate_limit.py
+# Ограничение частоты запросов алгоритмом token bucket.
+# Правило задаёт маршрут (метод и шаблон пути) и лимит: capacity запросов
+# с пополнением capacity / period токенов в секунду. Корзина своя для каждого
+# пользователя (по токену Authorization) или, без токена, для каждого IP.
+# Хранилище корзин подключаемое: в памяти процесса или общее для всех
+# воркеров (RedisRateLimitStore).
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from jose import JWTError
+from starlette.routing import compile_path
+from . import metrics
+from .auth import decode_access_token
+from .config import RATE_LIMITS, RATE_LIMIT_STORE_URL, RATE_LIMIT_STORE_SIZE, RATE_LIMIT_TRUST_FORWARDED
+
+RATE_LIMITED = metrics.registry.counter(
+    "http_rate_limited_total", "Requests rejected by the rate limiter", ("rule",))
+
+
+class RateLimitRule:
+    def __init__(self, method: str, path: str, capacity: int, period: float):
+        self.method = method.upper()
+        self.path = path
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.name = f"{self.method} {path}"
+        if path.endswith("*"):
+            self._regex = re.compile("^" + re.escape(path[:-1]))
+        else:
+            self._regex = compile_path(path)[0]
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method == "*" or self.method == method) and self._regex.match(path) is not None
+
+
+# Правила из строки вида "POST /token=10/60; GET /post/{id}=100/1"
+# (N запросов за T секунд; * в конце пути — любой хвост, метод * — любой метод)
+def parse_rules(spec: str):
+    rules = []
+    for item in spec.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            route, limit = item.rsplit("=", 1)
+            method, path = route.split(None, 1)
+            capacity, period = limit.split("/")
+            rules.append(RateLimitRule(method, path.strip(), int(capacity), float(period)))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit rule: {item!r}")
+    return rules
+
+
+# Интерфейс хранилища корзин. take списывает cost токенов и возвращает
+# (разрешено, через сколько секунд появятся токены)
+class RateLimitStore:
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1):
+        raise NotImplementedError
+
+
+# Корзины в памяти процесса: лимит действует отдельно в каждом воркере.
+# Старые корзины вытесняются по LRU, вытесненная корзина снова полная.
+class MemoryRateLimitStore(RateLimitStore):
+    def __init__(self, maxsize: int = 100000, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.timer = timer
+        self._buckets = OrderedDict()
+
+    async def take(self, key, rate, capacity, cost=1):
+        now = self.timer()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+            if len(self._buckets) >= self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            tokens, updated_at = bucket
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            self._buckets.move_to_end(key)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now)
+            return True, 0.0
+        self._buckets[key] = (tokens, now)
+        return False, (cost - tokens) / rate
+
+    def clear(self):
+        self._buckets.clear()
+
+
+# Общие корзины в Redis (клиент с API redis.asyncio). Списание атомарно
+# (Lua-скрипт), время берётся с сервера Redis, а не с часов воркеров.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring((cost - tokens) / rate)}
+"""
+
+class RedisRateLimitStore(RateLimitStore):
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key, rate, capacity, cost=1):
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[rate, capacity, cost])
+        if int(allowed):
+            return True, 0.0
+        return False, float(retry_after)
+
+
+def _create_store():
+    if RATE_LIMIT_STORE_URL:
+        # Необязательная зависимость: нужна только для общих лимитов
+        import redis.asyncio
+        return RedisRateLimitStore(redis.asyncio.from_url(RATE_LIMIT_STORE_URL))
+    return MemoryRateLimitStore(maxsize=RATE_LIMIT_STORE_SIZE)
+
+rules = parse_rules(RATE_LIMITS)
+store = _create_store()
+
+
+# Кто отправил запрос: пользователь из валидного токена или IP-адрес.
+# Невалидный токен не даёт новой корзины — такой запрос считается по IP.
+def client_identity(scope) -> str:
+    authorization = None
+    forwarded_for = None
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            authorization = value.decode("latin-1")
+        elif name == b"x-forwarded-for":
+            forwarded_for = value.decode("latin-1")
+    if authorization and authorization[:7].lower() == "bearer ":
+        try:
+            subject = decode_access_token(authorization[7:]).get("sub")
+            if subject is not None:
+                return f"user:{subject}"
+        except JWTError:
+            pass
+    if RATE_LIMIT_TRUST_FORWARDED and forwarded_for:
+        return "ip:" + forwarded_for.split(",")[0].strip()
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+# ASGI middleware. Правило ищется по методу и пути до маршрутизации; запросы
+# без подходящего правила проходят без обращения к хранилищу.
+class RateLimitMiddleware:
+    def __init__(self, app, rules=rules, store=store):
+        self.app = app
+        self.rules = rules
+        self.store = store
+
+    def match(self, method: str, path: str):
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.rules:
+            await self.app(scope, receive, send)
+            return
+        rule = self.match(scope["method"], scope["path"])
+        if rule is not None:
+            key = f"{rule.name}|{client_identity(scope)}"
+            allowed, retry_after = await self.store.take(key, rule.rate, rule.capacity)
+            if not allowed:
+                RATE_LIMITED.inc(rule.name)
+                await self._reject(send, retry_after)
+                return
+        await self.app(scope, receive, send)
+
+    async def _reject(self, send, retry_after: float):
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, ConfigDict  # Импортируйте ConfigDict
+from pydantic import BaseModel, ConfigDict, field_validator  # Импортируйте ConfigDict
 
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Union
+from typing_extensions import NotRequired, TypedDict
+from .config import MAX_TAGS_PER_POST, MAX_TAG_LENGTH
 
 class UserBase(BaseModel):
     username: str
@@ -13,23 +15,134 @@ class User(UserBase):
     id: int
     created_at: datetime
 
+# Аутентифицированный пользователь: снимок, не привязанный к сессии БД
+class CurrentUser(BaseModel):
+    id: int
+    username: str
+
 class PostBase(BaseModel):
     title: str
     content: str
 
+# tags: None — не менять теги (PUT), список — заменить. Имена приводятся
+# к нижнему регистру, повторы убираются.
 class PostCreate(PostBase):
-    pass
+    tags: Optional[list[str]] = None
+
+    @field_validator("tags")
+    @classmethod
+    def normalize_tags(cls, tags):
+        if tags is None:
+            return None
+        names = list(dict.fromkeys(name.strip().lower() for name in tags if name.strip()))
+        if len(names) > MAX_TAGS_PER_POST:
+            raise ValueError(f"At most {MAX_TAGS_PER_POST} tags per post")
+        if any(len(name) > MAX_TAG_LENGTH for name in names):
+            raise ValueError(f"Tag names are limited to {MAX_TAG_LENGTH} characters")
+        return names
 
 class Post(PostBase):
     id: int
     created_at: datetime
     updated_at: datetime
     user_id: int
+    version: int = 1
 
     model_config = ConfigDict(
         from_attributes=True,  # Замените orm_mode на from_attributes
     )
 
+# Автор поста для ?expand=author
+class Author(BaseModel):
+    id: int
+    username: str
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PostWithAuthor(Post):
+    author: Optional[Author] = None
+
+# Пост с раскрытыми связями (?expand=author,tags). Сериализуется с exclude_unset:
+# в ответ попадают только запрошенные связи.
+class PostExpanded(PostWithAuthor):
+    tags: list[str] = []
+
+# Пост в списке с ?fields= или ?view=summary: только запрошенные поля
+class PostFields(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    excerpt: Optional[str] = None
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    user_id: Optional[int] = None
+    version: Optional[int] = None
+    author: Optional[Author] = None
+    tags: Optional[list[str]] = None
+
+# Тег в облаке тегов (GET /tags)
+class TagCount(BaseModel):
+    name: str
+    post_count: int
+
+# Результат полнотекстового поиска: rank — релевантность, snippet — фрагмент
+# текста с совпадениями, выделенными <mark>
+class PostSearchResult(Post):
+    rank: float
+    snippet: str
+
+# Страница постов в режиме курсорной пагинации
+class PostPage(BaseModel):
+    items: list[Post]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+# Пакетное чтение постов: items в порядке запрошенных ID, missing — ненайденные ID
+class PostBatchRequest(BaseModel):
+    ids: list[int]
+
+class PostBatch(BaseModel):
+    items: list[Union[PostExpanded, Post]]
+    missing: list[int]
+
+# Результат массовой загрузки: index — номер элемента во входных данных
+class BulkItemError(BaseModel):
+    index: int
+    errors: list
+
+class BulkPostResult(BaseModel):
+    inserted: int
+    ids: list[int]
+    errors: list[BulkItemError]
+
+# Те же данные, что Post/PostSearchResult/PostPage, но для строк из БД в виде
+# словарей: списки сериализуются TypeAdapter без валидации (app/serialization.py).
+# Ключи выводятся в порядке колонок запроса (crud.POST_COLUMNS).
+class AuthorRow(TypedDict):
+    id: int
+    username: str
+
+class PostRow(TypedDict):
+    title: str
+    content: str
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    user_id: int
+    version: int
+    author: NotRequired[Optional[AuthorRow]]
+    tags: NotRequired[list[str]]
+    excerpt: NotRequired[Optional[str]]
+
+class PostSearchRow(PostRow):
+    rank: float
+    snippet: str
+
+class PostRowPage(TypedDict):
+    items: list[PostRow]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,107 @@
+# app/search.py
+# Полнотекстовый поиск по постам.
+# PostgreSQL: генерируемая колонка posts.search_vector (tsvector) + GIN-индекс.
+# SQLite (тесты): виртуальная таблица FTS5 posts_fts, синхронизируемая триггерами.
+# Обе схемы создаются миграцией, а при create_all — обработчиками DDL ниже.
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, select, table
+from .models import Post
+
+# Внешняя FTS5-таблица: rowid совпадает с posts.id
+posts_fts = table("posts_fts", column("rowid"), column("title"), column("content"))
+
+# Конфигурация текстового поиска PostgreSQL (to_tsvector), не зависит от языка.
+# Та же, что в миграции 9e3f0c2d7a41: другая потребовала бы новой миграции колонки
+# search_vector, иначе запросы не совпадут с индексом.
+SEARCH_TS_CONFIG = "simple"
+
+# Конфигурация передаётся литералом: asyncpg не приводит VARCHAR-параметр к regconfig
+_ts_config = literal_column(f"'{SEARCH_TS_CONFIG}'::regconfig")
+
+SNIPPET_START = "<mark>"
+SNIPPET_STOP = "</mark>"
+
+POSTGRES_DDL = [
+    f"""ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_TS_CONFIG}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_TS_CONFIG}', coalesce(content, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING gin (search_vector)",
+]
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+for statement in POSTGRES_DDL:
+    event.listen(Post.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    event.listen(Post.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Post.__table__, "before_drop", DDL("DROP TABLE IF EXISTS posts_fts").execute_if(dialect="sqlite"))
+
+
+# Слова запроса; каждое ищется как префикс, все слова обязательны.
+# Пользовательский ввод не попадает в синтаксис tsquery/FTS5 напрямую.
+def query_terms(query: str):
+    return re.findall(r"\w+", query.lower())
+
+def _tsquery(terms):
+    return func.to_tsquery(_ts_config, " & ".join(f"{term}:*" for term in terms))
+
+def _fts5_query(terms):
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+# Условие WHERE для выборки найденных постов (используется в курсорном режиме)
+def search_condition(dialect: str, terms):
+    if dialect == "postgresql":
+        return literal_column("posts.search_vector").op("@@")(_tsquery(terms))
+    if dialect == "sqlite":
+        return Post.id.in_(
+            select(posts_fts.c.rowid).where(literal_column("posts_fts").op("MATCH")(_fts5_query(terms)))
+        )
+    raise NotImplementedError(f"Full-text search is not supported for {dialect}")
+
+
+# Запрос с ранжированием (лучшие совпадения первыми) и подсвеченным фрагментом
+def ranked_search_query(dialect: str, terms):
+    columns = [Post.title, Post.content, Post.id, Post.created_at, Post.updated_at, Post.user_id, Post.version]
+    if dialect == "postgresql":
+        tsquery = _tsquery(terms)
+        search_vector = literal_column("posts.search_vector")
+        rank = func.ts_rank_cd(search_vector, tsquery).label("rank")
+        snippet = func.ts_headline(
+            _ts_config, Post.content, tsquery,
+            f"StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxWords=35, MinWords=15",
+        ).label("snippet")
+        return (
+            select(*columns, rank, snippet)
+            .where(search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), Post.id)
+        )
+    if dialect == "sqlite":
+        fts = literal_column("posts_fts")
+        # bm25 возвращает отрицательные значения: чем меньше, тем релевантнее
+        bm25 = func.bm25(fts)
+        rank = (-bm25).label("rank")
+        snippet = func.snippet(fts, -1, SNIPPET_START, SNIPPET_STOP, "…", 16).label("snippet")
+        return (
+            select(*columns, rank, snippet)
+            .select_from(posts_fts.join(Post.__table__, Post.id == posts_fts.c.rowid))
+            .where(fts.op("MATCH")(_fts5_query(terms)))
+            .order_by(bm25, Post.id)
+        )
+    raise NotImplementedError(f"Full-text search is not supported for {dialect}")
@@ -0,0 +1,20 @@
+# app/serialization.py
+# Быстрая сериализация списков постов. Строки из БД (словари колонок) сразу
+# превращаются в JSON заранее построенными TypeAdapter: без ORM-объектов,
+# без from_attributes-валидации и без jsonable_encoder из FastAPI.
+from pydantic import TypeAdapter
+from .schemas import PostRow, PostRowPage, PostSearchRow
+
+post_rows_adapter = TypeAdapter(list[PostRow])
+post_page_adapter = TypeAdapter(PostRowPage)
+search_rows_adapter = TypeAdapter(list[PostSearchRow])
+
+
+def dump_posts(rows) -> bytes:
+    return post_rows_adapter.dump_json(rows)
+
+def dump_post_page(rows, next_cursor=None, prev_cursor=None) -> bytes:
+    return post_page_adapter.dump_json({"items": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+
+def dump_search_results(rows) -> bytes:
+    return search_rows_adapter.dump_json(rows)
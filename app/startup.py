@@ -0,0 +1,115 @@
+# app/startup.py
+# Запуск воркера: проверка версии схемы, прогрев и готовность.
+# 1. Вместо create_all на каждом старте — один запрос к alembic_version и
+#    сравнение с головной ревизией в migrations/versions. При расхождении воркер
+#    не стартует; схему обновляет `alembic upgrade head` перед запуском.
+# 2. Прогрев: пул заполняется соединениями, на каждом выполняются частые
+#    запросы (SQLAlchemy компилирует их, asyncpg готовит prepared statements),
+#    загружаются backend bcrypt и пул потоков anyio, запускаются потоки пула хеширования.
+# 3. GET /ready отвечает 200 только после прогрева и до начала остановки.
+import asyncio
+import logging
+import os
+import anyio.to_thread
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import crud
+from .config import DB_SCHEMA_CHECK, DB_POOL_SIZE, STARTUP_WARMUP
+from .database import Base, engine, read_engine
+from .hashing import password_pool, pwd_context
+from .user_operations import get_user_by_username
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+ready = False
+
+
+class SchemaVersionMismatch(RuntimeError):
+    pass
+
+
+def migration_heads():
+    from alembic.script import ScriptDirectory
+    return set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+
+async def check_schema_version(db_engine):
+    expected = migration_heads()
+    async with db_engine.connect() as conn:
+        try:
+            result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+            current = {row.version_num for row in result}
+        except Exception as e:
+            raise SchemaVersionMismatch(f"Database is not under Alembic control, run `alembic upgrade head`: {e}") from e
+    if current != expected:
+        raise SchemaVersionMismatch(
+            f"Database schema is at {sorted(current) or 'no revision'}, code expects {sorted(expected)}; "
+            "run `alembic upgrade head`"
+        )
+
+
+# Частые запросы на чтение. Ошибки 404 на пустой базе ожидаемы и не мешают прогреву.
+WARMUP_QUERIES = [
+    lambda db: crud.get_posts(db, skip=0, limit=10),
+    lambda db: crud.get_posts(db, skip=0, limit=10, with_author=True),
+    lambda db: crud.get_posts_page(db, limit=10),
+    lambda db: crud.get_post(db, 0),
+    lambda db: crud.get_post_validator(db, 0),
+    lambda db: crud.get_post_expanded(db, 0, with_author=True, with_tags=True),
+    lambda db: crud.get_posts(db, skip=0, limit=10, tag="warmup"),
+    lambda db: crud.get_tags(db),
+    lambda db: crud.get_posts_by_ids(db, [0]),
+    lambda db: crud.search_posts(db, query="warmup"),
+    lambda db: crud.get_user_post_statistics(db, 0),
+    lambda db: crud.get_feed(db, 0),
+    lambda db: get_user_by_username(db, ""),
+]
+
+async def _warm_connection(db_engine):
+    async with AsyncSession(db_engine) as db:
+        for query in WARMUP_QUERIES:
+            try:
+                await query(db)
+            except HTTPException:
+                pass
+
+# Сессии работают одновременно, поэтому каждая берёт своё соединение из пула
+# и на каждом соединении asyncpg готовит свои выражения
+async def warm_pool(db_engine, connections: int = DB_POOL_SIZE):
+    if db_engine.dialect.name == "sqlite":
+        connections = 1
+    await asyncio.gather(*(_warm_connection(db_engine) for _ in range(connections)))
+
+async def warm_up(db_engine, replica_engine=None):
+    await warm_pool(db_engine)
+    if replica_engine is not None:
+        await warm_pool(replica_engine)
+    # Синхронные зависимости FastAPI выполняются в пуле потоков anyio: первый вызов
+    # импортирует его backend и запускает поток
+    await anyio.to_thread.run_sync(lambda: None)
+    # Загрузка backend bcrypt и криптографии JWT при первом вызове занимает заметное время
+    pwd_context.handler("bcrypt").get_backend()
+    jwt.decode(jwt.encode({"sub": "warmup"}, "warmup", algorithm="HS256"), "warmup", algorithms=["HS256"])
+    await password_pool.run(pwd_context.identify, "warmup")
+
+
+async def startup_event():
+    global ready
+    if DB_SCHEMA_CHECK == "alembic":
+        await check_schema_version(engine)
+    elif DB_SCHEMA_CHECK == "create_all":
+        # Для разработки без миграций: схема создаётся из моделей
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    if STARTUP_WARMUP:
+        await warm_up(engine, read_engine)
+    ready = True
+    logger.info("Worker is ready")
+
+async def shutdown_event():
+    # /ready отвечает 503: балансировщик перестаёт слать запросы, пока воркер завершает текущие
+    global ready
+    ready = False
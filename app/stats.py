@@ -0,0 +1,126 @@
+# app/stats.py
+# Агрегаты по постам пользователей: таблица user_post_stats с числом постов
+# за каждый месяц, поэтому статистика читается одним запросом по первичному ключу.
+# Запись поста ставит фоновую задачу refresh_user_stats (app/jobs.py), которая
+# меняет счётчик месяца на число добавленных или удалённых постов: повтор задачи
+# или порядок выполнения не искажают счётчик, но статистика обновляется с
+# небольшой задержкой.
+#
+# Пересчёт с нуля (после миграции или ручных правок в posts):
+#   python -m app.stats rebuild [--user-id N]
+import argparse
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import case, cast, delete, func, insert, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import jobs
+from .config import STATS_JOB_KEY_TTL
+from .models import Post, UserPostStats, UserPostStatsJob
+
+
+# Первое число месяца для даты/времени в SQL
+def month_expr(dialect: str, value):
+    if dialect == "postgresql":
+        # Литерал, а не параметр: иначе GROUP BY не совпадёт с выражением в SELECT
+        return cast(func.date_trunc(literal_column("'month'"), value), UserPostStats.month.type)
+    if dialect == "sqlite":
+        return func.date(value, "start of month")
+    raise NotImplementedError(f"Post statistics are not supported for {dialect}")
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+# Изменение счётчика месяца на delta. Задача доставляется хотя бы один раз, поэтому
+# её ключ записывается в той же транзакции: повтор не находит новой строки и
+# ничего не меняет. Прибавление в upsert атомарно — одновременные задачи одного
+# месяца не затирают друг друга.
+@jobs.handler("refresh_user_stats")
+async def _refresh_user_stats(db: AsyncSession, payload: dict):
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    now = jobs.utcnow()
+    applied = await db.execute(
+        dialect_insert(UserPostStatsJob).values(key=payload["key"], applied_at=now)
+        .on_conflict_do_nothing(index_elements=[UserPostStatsJob.key])
+        .returning(UserPostStatsJob.key)
+    )
+    if applied.first() is None:
+        return
+    statement = dialect_insert(UserPostStats).values(
+        user_id=payload["user_id"], month=date.fromisoformat(payload["month"]), post_count=payload["delta"],
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserPostStats.user_id, UserPostStats.month],
+        set_={"post_count": UserPostStats.post_count + statement.excluded.post_count},
+    )
+    await db.execute(statement)
+    await db.execute(delete(UserPostStatsJob).where(UserPostStatsJob.applied_at < now - timedelta(seconds=STATS_JOB_KEY_TTL)))
+    await db.commit()
+
+# Вызывается из crud до commit записи постов: delta — сколько постов месяца
+# created_at добавлено (> 0) или удалено (< 0)
+def record_post_change(db: AsyncSession, user_id: int, created_at: datetime, delta: int):
+    jobs.enqueue(db, "refresh_user_stats", {
+        "user_id": user_id, "month": month_start(created_at).isoformat(), "delta": delta, "key": uuid.uuid4().hex,
+    })
+
+
+# Статистика пользователя: всего постов, посты за текущий месяц и среднее число
+# постов в месяц с месяца первого поста по текущий включительно
+async def get_statistics(db: AsyncSession, user_id: int, today: date = None):
+    today = today or datetime.now(timezone.utc).date()
+    current_month = month_start(today)
+    query = select(
+        func.coalesce(func.sum(UserPostStats.post_count), 0),
+        func.coalesce(func.sum(case((UserPostStats.month == current_month, UserPostStats.post_count), else_=0)), 0),
+        func.min(UserPostStats.month),
+    ).where(UserPostStats.user_id == user_id, UserPostStats.post_count > 0)
+    total, this_month, first_month = (await db.execute(query)).one()
+    if isinstance(first_month, str):
+        first_month = date.fromisoformat(first_month)
+
+    months = 0
+    if first_month is not None:
+        months = (current_month.year - first_month.year) * 12 + current_month.month - first_month.month + 1
+    return {
+        "average_posts_per_month": round(total / months, 2) if months > 0 else 0,
+        "posts_this_month": this_month,
+        "total_posts": total,
+        "months": months,
+    }
+
+
+# Полный пересчёт агрегатов по таблице posts. Задачи, ещё не выполненные к этому
+# моменту, прибавят свои изменения повторно — запускать при пустой очереди.
+async def rebuild(db: AsyncSession, user_id: int = None):
+    dialect = db.get_bind().dialect.name
+    month = month_expr(dialect, Post.created_at)
+    source = (
+        select(Post.user_id, month.label("month"), func.count(Post.id))
+        .where(Post.user_id.is_not(None), Post.created_at.is_not(None))
+        .group_by(Post.user_id, month)
+    )
+    clear = delete(UserPostStats)
+    if user_id is not None:
+        source = source.where(Post.user_id == user_id)
+        clear = clear.where(UserPostStats.user_id == user_id)
+    await db.execute(clear)
+    await db.execute(
+        insert(UserPostStats).from_select(["user_id", "month", "post_count"], source)
+    )
+    await db.commit()
+
+
+async def _main(args):
+    from .database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await rebuild(db, user_id=args.user_id)
+    print("user_post_stats rebuilt")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance of the user_post_stats rollup")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user-id", type=int, default=None)
+    asyncio.run(_main(parser.parse_args()))
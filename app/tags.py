@@ -0,0 +1,124 @@
+# app/tags.py
+# Теги постов: таблицы tags и post_tags. Счётчики tags.post_count обновляются
+# в той же транзакции, что и запись поста, приращениями (post_count + delta),
+# поэтому облако тегов читается по индексу, без GROUP BY по post_tags.
+#
+# Пересчёт счётчиков с нуля (после ручных правок в post_tags):
+#   python -m app.tags rebuild
+import argparse
+import asyncio
+from collections import Counter, defaultdict
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Post, PostTag, Tag
+
+tags_table = Tag.__table__
+
+
+# Условие WHERE для постов с тегом name (полусоединение по ix_post_tags_tag_id_post_id)
+def tag_condition(name: str):
+    return Post.id.in_(
+        select(PostTag.post_id).join(Tag, Tag.id == PostTag.tag_id).where(Tag.name == name.strip().lower())
+    )
+
+
+# ID тегов по именам; недостающие теги создаются (INSERT ... ON CONFLICT DO NOTHING,
+# чтобы параллельные записи с новым тегом не падали на уникальном индексе)
+async def ensure_tags(db: AsyncSession, names) -> dict:
+    names = sorted(set(names))
+    if not names:
+        return {}
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    await db.execute(
+        dialect_insert(Tag).values([{"name": name, "post_count": 0} for name in names])
+        .on_conflict_do_nothing(index_elements=[Tag.name])
+    )
+    result = await db.execute(select(Tag.id, Tag.name).where(Tag.name.in_(names)))
+    return {row.name: row.id for row in result}
+
+# Прибавляет к post_count тегов приращения {tag_id: delta} одним executemany
+async def change_counts(db: AsyncSession, deltas: dict):
+    params = [{"tag_id": tag_id, "delta": delta} for tag_id, delta in sorted(deltas.items()) if delta]
+    if not params:
+        return
+    connection = await db.connection()
+    await connection.execute(
+        update(tags_table)
+        .where(tags_table.c.id == bindparam("tag_id"))
+        .values(post_count=tags_table.c.post_count + bindparam("delta")),
+        params,
+    )
+
+
+# Теги новых постов: items — пары (post_id, имена тегов)
+async def add_post_tags(db: AsyncSession, items):
+    items = [(post_id, names) for post_id, names in items if names]
+    if not items:
+        return
+    tag_ids = await ensure_tags(db, (name for _, names in items for name in names))
+    rows = [{"post_id": post_id, "tag_id": tag_ids[name]} for post_id, names in items for name in names]
+    await db.execute(insert(PostTag), rows)
+    await change_counts(db, Counter(row["tag_id"] for row in rows))
+
+# Замена тегов поста: добавляются и удаляются только отличающиеся
+async def set_post_tags(db: AsyncSession, post_id: int, names):
+    tag_ids = await ensure_tags(db, names)
+    current = set((await db.execute(select(PostTag.tag_id).where(PostTag.post_id == post_id))).scalars())
+    wanted = set(tag_ids.values())
+    added, removed = wanted - current, current - wanted
+    if removed:
+        await db.execute(delete(PostTag).where(PostTag.post_id == post_id, PostTag.tag_id.in_(removed)))
+    if added:
+        await db.execute(insert(PostTag), [{"post_id": post_id, "tag_id": tag_id} for tag_id in added])
+    await change_counts(db, {**{tag_id: 1 for tag_id in added}, **{tag_id: -1 for tag_id in removed}})
+
+# Удаление поста: вызывается до DELETE поста в той же транзакции. Связи удаляются
+# явно, а не каскадом post_tags.post_id, — по ним уменьшаются счётчики тегов.
+async def remove_post_tags(db: AsyncSession, post_id: int):
+    result = await db.execute(delete(PostTag).where(PostTag.post_id == post_id).returning(PostTag.tag_id))
+    await change_counts(db, {tag_id: -1 for tag_id in result.scalars()})
+
+
+# Имена тегов для уже выбранных постов (словарей колонок) одним запросом
+async def attach_tags(db: AsyncSession, posts: list[dict]):
+    post_ids = {post["id"] for post in posts}
+    if not post_ids:
+        return posts
+    result = await db.execute(
+        select(PostTag.post_id, Tag.name).join(Tag, Tag.id == PostTag.tag_id)
+        .where(PostTag.post_id.in_(post_ids)).order_by(Tag.name)
+    )
+    names = defaultdict(list)
+    for row in result:
+        names[row.post_id].append(row.name)
+    for post in posts:
+        post["tags"] = names.get(post["id"], [])
+    return posts
+
+# Облако тегов: самые популярные теги
+async def get_tags(db: AsyncSession, limit: int = 50):
+    result = await db.execute(
+        select(Tag.name, Tag.post_count).where(Tag.post_count > 0)
+        .order_by(Tag.post_count.desc(), Tag.name).limit(limit)
+    )
+    return [row._asdict() for row in result]
+
+
+# Полный пересчёт счётчиков по таблице post_tags
+async def rebuild(db: AsyncSession):
+    counts = select(func.count()).where(PostTag.tag_id == Tag.id).scalar_subquery()
+    await db.execute(update(Tag).values(post_count=counts))
+    await db.commit()
+
+
+async def _main(args):
+    from .database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        await rebuild(db)
+    print("tags.post_count rebuilt")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintenance of the tags.post_count counters")
+    parser.add_argument("command", choices=["rebuild"])
+    asyncio.run(_main(parser.parse_args()))
@@ -1,9 +1,31 @@
 # app/user_operations.py
 from .models import User
+from .schemas import CurrentUser
+from .cache import TTLCache
+from .config import AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+# Кэш пользователей для аутентификации: username -> CurrentUser
+user_cache = TTLCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL)
+
 async def get_user_by_username(db: AsyncSession, username: str):
      
     result = await db.execute(select(User).where(User.username == username))
-    return result.scalar_one_or_none()
\ No newline at end of file
+    return result.scalar_one_or_none()
+
+# Пользователь для аутентификации: сначала кэш, при промахе — запрос в БД
+async def get_cached_user(db: AsyncSession, username: str):
+    current_user = user_cache.get(username)
+    if current_user is None:
+        user = await get_user_by_username(db, username)
+        if user is None:
+            return None
+        current_user = CurrentUser(id=user.id, username=user.username)
+        user_cache.set(username, current_user)
+    return current_user
+
+# Вызывать при изменении или удалении пользователя. Отсутствующие пользователи
+# не кэшируются, поэтому после создания сбрасывать нечего.
+def invalidate_cached_user(username: str):
+    user_cache.delete(username)
@@ -0,0 +1,141 @@
+# app/worker.py
+# Процесс для фоновых задач из таблицы job_outbox (JOBS_BACKEND=outbox).
+# Можно запускать несколько экземпляров: в PostgreSQL задачи берутся через
+# FOR UPDATE SKIP LOCKED, и один процесс не получит задачу другого.
+#
+#   python -m app.worker [--concurrency 4] [--batch 100] [--metrics-port 9100]
+import argparse
+import asyncio
+import logging
+import signal
+from datetime import timedelta, timezone
+from sqlalchemy import delete, func, select, update
+from . import crud  # noqa: F401 — регистрирует обработчики задач
+from . import jobs, metrics
+from .config import DB_SCHEMA_CHECK, JOBS_CONCURRENCY, JOBS_LEASE_SECONDS, JOBS_MAX_ATTEMPTS, JOBS_POLL_INTERVAL
+from .models import JobOutbox
+
+logger = logging.getLogger(__name__)
+
+
+# Взятие задач: run_at сдвигается на время аренды одним UPDATE ... RETURNING.
+# Если процесс упадёт, задача снова станет доступной по истечении аренды.
+async def claim(db, limit: int, lease: float = JOBS_LEASE_SECONDS):
+    now = jobs.utcnow()
+    due = (
+        select(JobOutbox.id).where(JobOutbox.run_at <= now)
+        .order_by(JobOutbox.run_at, JobOutbox.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(JobOutbox).where(JobOutbox.id.in_(due.scalar_subquery()))
+        .values(run_at=now + timedelta(seconds=lease), attempts=JobOutbox.attempts + 1)
+        .returning(JobOutbox.id, JobOutbox.name, JobOutbox.payload, JobOutbox.created_at, JobOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await db.commit()
+    return rows
+
+async def pending(db) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(JobOutbox).where(JobOutbox.run_at <= jobs.utcnow())
+    )).scalar_one()
+
+
+# Строка задачи удаляется в сессии обработчика: если он сам делает commit, задача
+# и её результат фиксируются одной транзакцией
+async def process(session_factory, row, max_attempts: int = JOBS_MAX_ATTEMPTS):
+    job = jobs.Job(row.name, row.payload, row.created_at.replace(tzinfo=timezone.utc).timestamp(), row.attempts)
+    try:
+        async with session_factory() as db:
+            await db.execute(delete(JobOutbox).where(JobOutbox.id == row.id))
+            await jobs.run_job(db, job)
+            await db.commit()
+        jobs.JOBS_PROCESSED.inc(job.name, "ok")
+    except Exception as e:
+        if job.attempts >= max_attempts:
+            run_at = None
+            jobs.JOBS_PROCESSED.inc(job.name, "failed")
+            logger.exception("Job %s #%d failed after %d attempts", job.name, row.id, job.attempts)
+        else:
+            run_at = jobs.utcnow() + timedelta(seconds=jobs.retry_delay(job.attempts))
+            jobs.JOBS_PROCESSED.inc(job.name, "retry")
+            logger.warning("Job %s #%d failed (attempt %d), retrying", job.name, row.id, job.attempts, exc_info=True)
+        async with session_factory() as db:
+            await db.execute(
+                update(JobOutbox).where(JobOutbox.id == row.id)
+                .values(run_at=run_at, last_error=repr(e)[:1000])
+            )
+            await db.commit()
+
+
+# Одна итерация: взять до batch задач и выполнить их, не больше concurrency одновременно.
+# Возвращает число взятых задач.
+async def run_once(session_factory, batch: int = 100, concurrency: int = JOBS_CONCURRENCY,
+                   max_attempts: int = JOBS_MAX_ATTEMPTS):
+    async with session_factory() as db:
+        rows = await claim(db, batch)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(row):
+        async with semaphore:
+            await process(session_factory, row, max_attempts)
+
+    await asyncio.gather(*(limited(row) for row in rows))
+    async with session_factory() as db:
+        jobs.queue.outbox_pending = await pending(db)
+    return len(rows)
+
+
+# Метрики процесса в формате Prometheus на отдельном порту (без FastAPI)
+async def serve_metrics(port: int):
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = metrics.registry.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, "0.0.0.0", port)
+
+
+async def main(args):
+    from .database import AsyncSessionLocal, engine
+    if DB_SCHEMA_CHECK == "alembic":
+        from .startup import check_schema_version
+        await check_schema_version(engine)
+    server = await serve_metrics(args.metrics_port) if args.metrics_port else None
+
+    # SIGTERM/SIGINT: текущая пачка дорабатывает, новые задачи не берутся
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    logger.info("Job worker started")
+    while not stopping.is_set():
+        claimed = await run_once(AsyncSessionLocal, args.batch, args.concurrency)
+        if claimed < args.batch:
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=args.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    if server is not None:
+        server.close()
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs from the job_outbox table")
+    parser.add_argument("--concurrency", type=int, default=JOBS_CONCURRENCY)
+    parser.add_argument("--batch", type=int, default=100, help="сколько задач брать за один запрос")
+    parser.add_argument("--poll-interval", type=float, default=JOBS_POLL_INTERVAL, help="пауза, когда задач нет, сек")
+    parser.add_argument("--metrics-port", type=int, default=None, help="отдавать метрики Prometheus на этом порту")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+# benchmarks/bulk_ingest.py
+# Скорость загрузки постов: POST /posts/bulk (NDJSON) против POST /posts по одному.
+#
+#   python -m benchmarks.bulk_ingest --posts 50000
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .common import asgi_client, seed
+
+
+async def login(client):
+    response = await client.post("/token", data={"username": "user0", "password": "benchpass"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def main(args):
+    db_path = os.path.join(tempfile.gettempdir(), "bench_bulk_ingest.db")
+    async with asgi_client(db_path) as (client, Session):
+        await seed(Session, users=1, posts=0)
+        headers = await login(client)
+
+        body = "".join(
+            json.dumps({"title": f"Imported {i}", "content": f"Imported content {i} " * 20}) + "\n"
+            for i in range(args.posts)
+        )
+        started = time.perf_counter()
+        response = await client.post(
+            "/posts/bulk", content=body, headers={**headers, "Content-Type": "application/x-ndjson"}, timeout=None,
+        )
+        bulk_elapsed = time.perf_counter() - started
+        result = response.json()
+
+        started = time.perf_counter()
+        for i in range(args.single):
+            await client.post("/posts", json={"title": f"Single {i}", "content": "..."}, headers=headers)
+        single_elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "bulk_posts": result["inserted"],
+        "bulk_errors": len(result["errors"]),
+        "bulk_posts_per_second": round(result["inserted"] / bulk_elapsed),
+        "single_posts": args.single,
+        "single_posts_per_second": round(args.single / single_elapsed),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk ingest throughput: POST /posts/bulk versus one POST /posts per post")
+    parser.add_argument("--posts", type=int, default=50_000)
+    parser.add_argument("--single", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
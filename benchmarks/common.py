@@ -0,0 +1,111 @@
+# benchmarks/common.py
+# Общие функции для бенчмарков: приложение в процессе поверх SQLite-файла,
+# наполнение базы и подсчёт перцентилей.
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+# Бенчмарки сами создают нагрузку, ограничение частоты им мешает
+os.environ.setdefault("RATE_LIMITS", "")
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app import jobs
+from app.database import get_db
+from app.models import Base, Post, User
+from app.hashing import hash_password
+from app.fields import make_excerpt
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+@asynccontextmanager
+async def asgi_client(db_path: str):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+
+    async def override_get_db():
+        async with Session() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Фоновые задачи (JOBS_BACKEND=memory) открывают свои сессии — к той же базе
+    session_factory = jobs.queue.session_factory
+    jobs.queue.session_factory = Session
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            yield client, Session
+    finally:
+        await jobs.queue.shutdown()
+        jobs.queue.session_factory = session_factory
+        app.dependency_overrides.clear()
+        await engine.dispose()
+
+# Наполнение базы: users пользователей с одинаковым паролем и posts постов,
+# равномерно распределённых по пользователям и по времени создания.
+# content_size — длина текста поста в символах (по умолчанию одна короткая строка).
+async def seed(Session, users: int, posts: int, password: str = "benchpass", batch: int = 5000, content_size: int = 0):
+    hashed_password = hash_password(password)
+    start = datetime(2024, 1, 1)
+    async with Session() as session:
+        await session.execute(insert(User), [
+            {"username": f"user{i}", "hashed_password": hashed_password, "created_at": start}
+            for i in range(users)
+        ])
+        for offset in range(0, posts, batch):
+            await session.execute(insert(Post), [
+                {
+                    "title": f"Post {i}",
+                    "content": post_content(i, content_size),
+                    "excerpt": make_excerpt(post_content(i, content_size)),
+                    "user_id": i % users + 1,
+                    "created_at": start + timedelta(seconds=i),
+                    "updated_at": start + timedelta(seconds=i),
+                }
+                for i in range(offset, min(posts, offset + batch))
+            ])
+        await session.commit()
+
+# Текст из случайных (с постоянным зерном) слов: сжимается примерно как обычный текст
+WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an have not which but all "
+    "post blog api database query index cursor page request response server client cache token user "
+    "latency throughput memory network compression benchmark python async session commit worker queue"
+).split()
+
+def post_content(i: int, size: int) -> str:
+    text = f"Content of post number {i}"
+    rng = random.Random(i)
+    while len(text) < size:
+        text += " " + rng.choice(WORDS)
+    return text
+
+async def timed(coro):
+    started = time.perf_counter()
+    response = await coro
+    return response, time.perf_counter() - started
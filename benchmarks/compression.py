@@ -0,0 +1,65 @@
+# benchmarks/compression.py
+# Байты на проводе и процессорное время на запрос для страниц GET /posts разного
+# размера без сжатия, с gzip и с brotli (если установлен пакет brotli), а также
+# ответ 304 на запрос с If-None-Match. Кэш ответов выключен: каждый запрос
+# доходит до базы, сериализации и сжатия.
+#
+#   python -m benchmarks.compression --posts 2000 --content-size 1500 --limits 10 50 100
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .common import asgi_client, seed
+from app import compression, post_cache
+
+
+# 304 тоже успешный ответ, raise_for_status считает его ошибкой
+async def get_page(client, params, headers):
+    response = await client.get("/posts", params=params, headers=headers)
+    if response.status_code >= 400:
+        response.raise_for_status()
+    return response
+
+async def measure(client, params, headers, requests):
+    response = await get_page(client, params, headers)
+    wire_bytes = response.num_bytes_downloaded
+    cpu_started = time.process_time()
+    for _ in range(requests):
+        await get_page(client, params, headers)
+    cpu = time.process_time() - cpu_started
+    return {
+        "status": response.status_code,
+        "encoding": response.headers.get("content-encoding", "identity"),
+        "wire_bytes": wire_bytes,
+        "body_bytes": len(response.content),
+        "cpu_ms_per_request": round(cpu / requests * 1000, 3),
+    }
+
+async def main(args):
+    post_cache.RESPONSE_CACHE_TTL = 0
+    db_path = os.path.join(tempfile.gettempdir(), "bench_compression.db")
+    encodings = ["identity", "gzip"] + (["br"] if compression.brotli is not None else [])
+    async with asgi_client(db_path) as (client, Session):
+        await seed(Session, users=10, posts=args.posts, content_size=args.content_size)
+        results = {}
+        for limit in args.limits:
+            params = {"limit": limit}
+            page = {encoding: await measure(client, params, {"Accept-Encoding": encoding}, args.requests) for encoding in encodings}
+            # Условный запрос с ETag страницы: ответ 304 без тела
+            etag = (await client.get("/posts", params=params)).headers["etag"]
+            page["304"] = await measure(client, params, {"Accept-Encoding": "gzip", "If-None-Match": etag}, args.requests)
+            for result in page.values():
+                result["ratio"] = round(result["wire_bytes"] / page["identity"]["wire_bytes"], 3)
+            results[f"GET /posts?limit={limit}"] = page
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Response size and CPU time of GET /posts pages with and without gzip/brotli")
+    parser.add_argument("--posts", type=int, default=2_000)
+    parser.add_argument("--content-size", type=int, default=1500, help="длина текста поста, символов")
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 50, 100], help="размеры страниц")
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
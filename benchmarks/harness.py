@@ -0,0 +1,293 @@
+# benchmarks/harness.py
+# Нагрузочный прогон всех маршрутов API: наполняет базу, гоняет каждый маршрут
+# с заданной конкурентностью и сохраняет throughput и p50/p95/p99 в JSON для
+# сравнения между коммитами.
+#
+#   # приложение в процессе (ASGI) поверх SQLite-файла
+#   python -m benchmarks.harness --users 10 --posts 10000 --concurrency 16 --output before.json
+#
+#   # настоящий uvicorn на localhost, запускаемый харнессом (SQLite-файл)
+#   python -m benchmarks.harness --serve --port 8001 --output after.json --compare before.json
+#
+#   # уже запущенный сервер; база наполняется через API
+#   python -m benchmarks.harness --url http://localhost:8000 --users 5 --posts 2000
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+from jose import jwt
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from .common import asgi_client, seed, summarize
+from app import startup
+from app.models import Base
+
+PASSWORD = "benchpass"
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# Сценарий: имя маршрута и функция, строящая i-й запрос (method, url, kwargs).
+# setup готовит данные заранее (например, посты для удаления), requests
+# переопределяет общее число запросов для дорогих маршрутов.
+class Scenario:
+    def __init__(self, name, build, setup=None, requests=None):
+        self.name = name
+        self.build = build
+        self.setup = setup
+        self.requests = requests
+
+
+def _auth(ctx):
+    return {"Authorization": f"Bearer {ctx['token']}"}
+
+# tagged — посты с тегами из 20 имён (для облака тегов)
+async def _create_posts(client, ctx, count, tagged=False):
+    response = await client.post(
+        "/posts/bulk",
+        json=[
+            {"title": f"Bench {i}", "content": "Benchmark post content", **({"tags": [f"tag{i % 20}", "bench"]} if tagged else {})}
+            for i in range(count)
+        ],
+        headers=_auth(ctx),
+    )
+    response.raise_for_status()
+    ids = response.json()["ids"]
+    if not ids:
+        # COPY не возвращает id: берём последние посты пользователя из экспорта
+        export = await client.get("/posts/export", params={"user_id": ctx["user_id"]})
+        ids = [json.loads(line)["id"] for line in export.text.splitlines()][-count:]
+    return ids
+
+async def _setup_delete(client, ctx, count):
+    ctx["delete_ids"] = await _create_posts(client, ctx, count)
+
+def build_scenarios(args):
+    post_ids = lambda ctx, i: ctx["post_ids"][i % len(ctx["post_ids"])]
+    followee_ids = lambda ctx, i: ctx["followee_ids"][i % len(ctx["followee_ids"])]
+    batch_ids = lambda ctx, i, count: [post_ids(ctx, i + j) for j in range(count)]
+    return [
+        Scenario("GET /posts", lambda ctx, i: ("GET", "/posts", {"params": {"skip": i % 100 * 10, "limit": 10}})),
+        Scenario("GET /posts?paginate=cursor", lambda ctx, i: ("GET", "/posts", {"params": {"paginate": "cursor", "limit": 10}})),
+        Scenario("GET /post/{id}", lambda ctx, i: ("GET", f"/post/{post_ids(ctx, i)}", {})),
+        Scenario("GET /posts/search", lambda ctx, i: ("GET", "/posts/search", {"params": {"query": f"post {i % 10}"}})),
+        Scenario("GET /posts/export", lambda ctx, i: ("GET", "/posts/export", {"params": {"user_id": ctx["user_id"]}}), requests=args.requests // 10 or 1),
+        Scenario("GET /posts/statistics/{user_id}", lambda ctx, i: ("GET", f"/posts/statistics/{ctx['user_id']}", {})),
+        Scenario("GET /posts/batch", lambda ctx, i: ("GET", "/posts/batch", {"params": {"ids": ",".join(map(str, batch_ids(ctx, i, 10)))}})),
+        Scenario("POST /posts/batch", lambda ctx, i: ("POST", "/posts/batch", {"json": {"ids": batch_ids(ctx, i, 100)}})),
+        Scenario("GET /feed", lambda ctx, i: ("GET", "/feed", {"params": {"limit": 10}, "headers": _auth(ctx)})),
+        Scenario("GET /tags", lambda ctx, i: ("GET", "/tags", {})),
+        Scenario("GET /metrics/pool", lambda ctx, i: ("GET", "/metrics/pool", {})),
+        Scenario("GET /metrics", lambda ctx, i: ("GET", "/metrics", {})),
+        Scenario("GET /ready", lambda ctx, i: ("GET", "/ready", {})),
+        Scenario("POST /posts", lambda ctx, i: ("POST", "/posts", {"json": {"title": f"New {i}", "content": "Created by benchmark"}, "headers": _auth(ctx)})),
+        Scenario("POST /posts/bulk", lambda ctx, i: ("POST", "/posts/bulk", {"json": [{"title": f"Bulk {i}-{j}", "content": "..."} for j in range(100)], "headers": _auth(ctx)}), requests=args.requests // 10 or 1),
+        Scenario("PUT /posts/{id}", lambda ctx, i: ("PUT", f"/posts/{ctx['own_ids'][i % len(ctx['own_ids'])]}", {"json": {"title": f"Updated {i}", "content": "Updated by benchmark"}, "headers": _auth(ctx)})),
+        Scenario("DELETE /posts/{id}", lambda ctx, i: ("DELETE", f"/posts/{ctx['delete_ids'][i]}", {"headers": _auth(ctx)}), setup=_setup_delete),
+        # Подписки уже оформлены в prepare_context: повторная подписка ничего не меняет,
+        # отписка идёт после GET /feed
+        Scenario("POST /users/{id}/follow", lambda ctx, i: ("POST", f"/users/{followee_ids(ctx, i)}/follow", {"headers": _auth(ctx)})),
+        Scenario("DELETE /users/{id}/follow", lambda ctx, i: ("DELETE", f"/users/{followee_ids(ctx, i)}/follow", {"headers": _auth(ctx)})),
+        Scenario("POST /register", lambda ctx, i: ("POST", "/register", {"json": {"username": f"bench_{ctx['run_id']}_{i}", "password": PASSWORD}}), requests=args.auth_requests),
+        Scenario("POST /token", lambda ctx, i: ("POST", "/token", {"data": {"username": ctx["username"], "password": PASSWORD}}), requests=args.auth_requests),
+    ]
+
+
+async def run_scenario(client, scenario, ctx, total, concurrency):
+    if scenario.setup is not None:
+        await scenario.setup(client, ctx, total)
+    counter = itertools.count()
+    latencies, statuses = [], Counter()
+
+    async def worker():
+        while (i := next(counter)) < total:
+            method, url, kwargs = scenario.build(ctx, i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    wall = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": dict(statuses),
+        "throughput_rps": round(total / wall, 1) if wall else 0.0,
+        **summarize(latencies),
+    }
+
+
+# Наполнение базы, к которой у харнесса есть прямой доступ
+async def seed_database(db_path, users, posts):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+    await seed(Session, users=users, posts=posts, password=PASSWORD)
+    await engine.dispose()
+
+# Наполнение чужого сервера через API: регистрация и POST /posts/bulk
+async def seed_via_api(client, users, posts):
+    per_user = posts // users
+    for u in range(users):
+        username = f"user{u}"
+        await client.post("/register", json={"username": username, "password": PASSWORD})
+        token = (await client.post("/token", data={"username": username, "password": PASSWORD})).json()["access_token"]
+        for offset in range(0, per_user, 1000):
+            await client.post(
+                "/posts/bulk",
+                json=[{"title": f"Post {offset + i}", "content": f"Content of post number {offset + i}"} for i in range(min(1000, per_user - offset))],
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=None,
+            )
+
+async def prepare_context(client, args):
+    ctx = {"run_id": int(time.time()), "username": "user0"}
+    response = await client.post("/token", data={"username": ctx["username"], "password": PASSWORD})
+    response.raise_for_status()
+    ctx["token"] = response.json()["access_token"]
+    ctx["user_id"] = jwt.get_unverified_claims(ctx["token"])["uid"]
+    export = await client.get("/posts/export", params={"user_id": ctx["user_id"]}, timeout=None)
+    ctx["post_ids"] = [json.loads(line)["id"] for line in export.text.splitlines()][:1000] or [1]
+    ctx["own_ids"] = await _create_posts(client, ctx, 100)
+    await _create_posts(client, ctx, 100, tagged=True)
+    # Лента: подписка на авторов первой страницы постов
+    page = await client.get("/posts", params={"limit": 100})
+    ctx["followee_ids"] = sorted({post["user_id"] for post in page.json()} - {ctx["user_id"]}) or [ctx["user_id"]]
+    for followee_id in ctx["followee_ids"]:
+        await client.post(f"/users/{followee_id}/follow", headers=_auth(ctx))
+    return ctx
+
+async def run_all(client, args):
+    ctx = await prepare_context(client, args)
+    selected = set(args.only) if args.only else None
+    results = {}
+    for scenario in build_scenarios(args):
+        if selected and scenario.name not in selected:
+            continue
+        total = scenario.requests or args.requests
+        results[scenario.name] = await run_scenario(client, scenario, ctx, total, args.concurrency)
+        print(f"{scenario.name:36} {results[scenario.name]['throughput_rps']:>9} rps  "
+              f"p50 {results[scenario.name]['p50_ms']:>8} ms  p99 {results[scenario.name]['p99_ms']:>8} ms  "
+              f"errors {results[scenario.name]['errors']}", file=sys.stderr)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _wait_for_server(url, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get("/metrics/pool")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start in {timeout} s")
+
+async def main(args):
+    db_path = os.path.join(tempfile.gettempdir(), "bench_harness.db")
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    server = None
+
+    if args.url is None and not args.serve:
+        target = "asgi"
+        # Без lifespan: проверка схемы и прогрев не выполняются, воркер считаем готовым
+        startup.ready = True
+        async with asgi_client(db_path) as (client, Session):
+            await seed(Session, users=args.users, posts=args.posts, password=PASSWORD)
+            results = await run_all(client, args)
+    else:
+        if args.serve:
+            await seed_database(db_path, args.users, args.posts)
+            args.url = f"http://127.0.0.1:{args.port}"
+            # База уже создана seed_database без миграций
+            env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}", "DB_SCHEMA_CHECK": "off"}
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                 "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=ROOT, env=env,
+            )
+        target = args.url
+        try:
+            if server is not None:
+                await _wait_for_server(args.url)
+            async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60.0) as client:
+                if not args.serve and not args.no_seed:
+                    await seed_via_api(client, args.users, args.posts)
+                results = await run_all(client, args)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    report = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": "uvicorn " + target if args.serve else target,
+            "users": args.users,
+            "posts": args.posts,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "endpoints": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        print_comparison(args.compare, report)
+
+
+def print_comparison(path, report):
+    with open(path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\n{'endpoint':36} {'rps':>21} {'p50 ms':>21} {'p99 ms':>21}")
+    for name, new in report["endpoints"].items():
+        old = previous["endpoints"].get(name)
+        if old is None:
+            continue
+        cells = [f"{old[key]:>9} -> {new[key]:<9}" for key in ("throughput_rps", "p50_ms", "p99_ms")]
+        print(f"{name:36} " + " ".join(cells))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test every API route")
+    parser.add_argument("--url", default=None, help="уже запущенный сервер; по умолчанию приложение в процессе")
+    parser.add_argument("--serve", action="store_true", help="запустить uvicorn на localhost поверх SQLite-файла")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1, help="число воркеров uvicorn для --serve")
+    parser.add_argument("--no-seed", action="store_true", help="не наполнять базу для --url")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="запросов на маршрут")
+    parser.add_argument("--auth-requests", type=int, default=20, help="запросов для /register и /token (bcrypt)")
+    parser.add_argument("--only", nargs="*", help="прогнать только указанные маршруты, например 'GET /posts'")
+    parser.add_argument("--output", help="файл для JSON-результатов")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    asyncio.run(main(parser.parse_args()))
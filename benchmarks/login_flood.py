@@ -0,0 +1,66 @@
+# benchmarks/login_flood.py
+# Латентность GET /posts без нагрузки и во время потока логинов (bcrypt).
+#
+#   python -m benchmarks.login_flood --flood 32 --duration 5 --executor thread
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from .common import asgi_client, seed, summarize, timed
+from app import hashing, post_cache
+
+
+async def read_loop(client, deadline, latencies):
+    while time.perf_counter() < deadline:
+        response, elapsed = await timed(client.get("/posts", params={"limit": 10}))
+        response.raise_for_status()
+        latencies.append(elapsed)
+
+async def login_loop(client, deadline, statuses):
+    data = {"username": "user0", "password": "benchpass"}
+    while time.perf_counter() < deadline:
+        response = await client.post("/token", data=data)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+async def main(args):
+    hashing.password_pool = hashing.HashingPool(
+        kind=args.executor, workers=args.workers, max_pending=args.max_pending, queue_timeout=args.queue_timeout,
+    )
+    # Кэш ответов выключен: чтения идут в базу, как при промахе кэша
+    post_cache.RESPONSE_CACHE_TTL = 0
+    db_path = os.path.join(tempfile.gettempdir(), "bench_login_flood.db")
+    async with asgi_client(db_path) as (client, Session):
+        await seed(Session, users=10, posts=1000)
+
+        baseline = []
+        await read_loop(client, time.perf_counter() + args.duration, baseline)
+
+        under_flood, statuses = [], {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            read_loop(client, deadline, under_flood),
+            *(login_loop(client, deadline, statuses) for _ in range(args.flood)),
+        )
+    hashing.password_pool.shutdown()
+
+    print(json.dumps({
+        "executor": args.executor,
+        "workers": args.workers,
+        "flood_concurrency": args.flood,
+        "get_posts_idle": summarize(baseline),
+        "get_posts_under_login_flood": summarize(under_flood),
+        "login_statuses": statuses,
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GET /posts latency while a flood of logins hashes passwords")
+    parser.add_argument("--flood", type=int, default=32, help="число параллельных логинов")
+    parser.add_argument("--duration", type=float, default=5.0, help="длительность каждой фазы, сек")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,58 @@
+# benchmarks/pagination.py
+# Сравнение первой и 10 000-й страницы GET /posts в режимах OFFSET и курсора.
+#
+#   python -m benchmarks.pagination --posts 100000 --page 10000
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+
+from sqlalchemy import select
+from .common import asgi_client, seed, timed
+from app import post_cache
+from app.models import Post
+from app.pagination import encode_cursor
+
+
+async def measure(client, params, repeat):
+    latencies = []
+    for _ in range(repeat):
+        response, elapsed = await timed(client.get("/posts", params=params))
+        response.raise_for_status()
+        latencies.append(elapsed)
+    return round(statistics.median(latencies) * 1000, 3)
+
+async def main(args):
+    # Кэш ответов выключен: повторные запросы страницы иначе не доходят до базы
+    post_cache.RESPONSE_CACHE_TTL = 0
+    db_path = os.path.join(tempfile.gettempdir(), "bench_pagination.db")
+    async with asgi_client(db_path) as (client, Session):
+        await seed(Session, users=100, posts=args.posts)
+
+        skip = (args.page - 1) * args.limit
+        # Курсор, указывающий на последнюю запись предыдущей страницы
+        async with Session() as session:
+            created_at, id = (await session.execute(
+                select(Post.created_at, Post.id).order_by(Post.created_at, Post.id).offset(skip - 1).limit(1)
+            )).one()
+        deep_cursor = encode_cursor(created_at, id)
+
+        results = {
+            "posts": args.posts,
+            "limit": args.limit,
+            "offset_page_1_ms": await measure(client, {"skip": 0, "limit": args.limit}, args.repeat),
+            f"offset_page_{args.page}_ms": await measure(client, {"skip": skip, "limit": args.limit}, args.repeat),
+            "cursor_page_1_ms": await measure(client, {"paginate": "cursor", "limit": args.limit}, args.repeat),
+            f"cursor_page_{args.page}_ms": await measure(client, {"cursor": deep_cursor, "limit": args.limit}, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="First versus deep page of GET /posts with OFFSET and cursor pagination")
+    parser.add_argument("--posts", type=int, default=100_010)
+    parser.add_argument("--page", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+# benchmarks/serialization.py
+# Запросов в секунду на ядро для страниц по 100 постов: прежний путь (ORM-объекты,
+# response_model и jsonable_encoder FastAPI) против строк из БД, сериализуемых
+# TypeAdapter (app/serialization.py). Кэш ответов выключен, чтобы каждый запрос
+# доходил до базы и сериализации.
+#
+#   python -m benchmarks.serialization --posts 20000 --limit 100
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .common import asgi_client, seed
+from app import post_cache
+from app.database import get_db
+from app.models import Post
+from app.schemas import Post as PostSchema, PostSearchResult
+from app.search import query_terms, ranked_search_query
+
+# Обработчики в том виде, в каком они были до быстрого пути
+legacy_app = FastAPI()
+
+@legacy_app.get("/posts", response_model=list[PostSchema])
+async def legacy_posts(limit: int = 10, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(Post).order_by(Post.created_at, Post.id).limit(limit))
+    return result.scalars().all()
+
+@legacy_app.get("/posts/search", response_model=list[PostSearchResult])
+async def legacy_search(query: str, limit: int = 10, db: AsyncSession = Depends(get_db)):
+    search_query = ranked_search_query(db.get_bind().dialect.name, query_terms(query)).limit(limit)
+    return [dict(row._mapping) for row in await db.execute(search_query)]
+
+
+# Последовательные запросы в одном процессе: rps по процессорному времени
+# и есть пропускная способность одного ядра
+async def measure(client, url, params, requests):
+    response = await client.get(url, params=params)
+    response.raise_for_status()
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for _ in range(requests):
+        (await client.get(url, params=params)).raise_for_status()
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    return {
+        "rps_per_core": round(requests / cpu, 1),
+        "rps": round(requests / wall, 1),
+        "bytes": len(response.content),
+    }
+
+async def main(args):
+    post_cache.RESPONSE_CACHE_TTL = 0
+    db_path = os.path.join(tempfile.gettempdir(), "bench_serialization.db")
+    async with asgi_client(db_path) as (client, Session):
+        await seed(Session, users=10, posts=args.posts)
+
+        async def override_get_db():
+            async with Session() as session:
+                yield session
+
+        legacy_app.dependency_overrides[get_db] = override_get_db
+        async with AsyncClient(transport=ASGITransport(app=legacy_app), base_url="http://bench") as legacy_client:
+            results = {}
+            for name, url, params in (
+                ("GET /posts", "/posts", {"limit": args.limit}),
+                ("GET /posts/search", "/posts/search", {"query": "post", "limit": args.limit}),
+            ):
+                before = await measure(legacy_client, url, params, args.requests)
+                after = await measure(client, url, params, args.requests)
+                results[name] = {
+                    "before": before,
+                    "after": after,
+                    "speedup": round(after["rps_per_core"] / before["rps_per_core"], 2),
+                }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Requests per second per core for GET /posts: ORM and response_model versus TypeAdapter rows")
+    parser.add_argument("--posts", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
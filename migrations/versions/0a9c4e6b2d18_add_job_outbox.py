@@ -0,0 +1,38 @@
+"""Add job_outbox for durable background jobs
+
+Revision ID: 0a9c4e6b2d18
+Revises: d52e8c1a7f30
+Create Date: 2026-10-18 18:12:46.730215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9c4e6b2d18'
+down_revision: Union[str, None] = 'd52e8c1a7f30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('job_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Выборка готовых задач: WHERE run_at <= now ORDER BY run_at, id
+    op.create_index('ix_job_outbox_run_at_id', 'job_outbox', ['run_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_job_outbox_run_at_id', table_name='job_outbox')
+    op.drop_table('job_outbox')
@@ -0,0 +1,28 @@
+"""Add posts (created_at, id) index for keyset pagination
+
+Revision ID: 1cbab4bf282c
+Revises: 5a5e182c42bb
+Create Date: 2026-10-18 10:12:03.514220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1cbab4bf282c'
+down_revision: Union[str, None] = '5a5e182c42bb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_created_at_id')
@@ -0,0 +1,50 @@
+"""Add posts.excerpt and compressed out-of-line storage for long post bodies
+
+Revision ID: 3f8d2b6e9a14
+Revises: 6b1e5f9a3c72
+Create Date: 2026-10-18 20:41:09.517623
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8d2b6e9a14'
+down_revision: Union[str, None] = '6b1e5f9a3c72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EXCERPT_LENGTH = 200
+
+
+def upgrade() -> None:
+    op.add_column('posts', sa.Column('excerpt', sa.String(), nullable=True))
+    # То же правило, что у app.fields.make_excerpt
+    op.execute(f"""
+        UPDATE posts SET excerpt = CASE
+            WHEN length(content) > {EXCERPT_LENGTH} THEN rtrim(substr(content, 1, {EXCERPT_LENGTH})) || '…'
+            ELSE content
+        END
+    """)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        # Строки длиннее 512 байт сжимаются, а тексты, которые и после этого не
+        # помещаются, выносятся в TOAST: строки posts остаются узкими, и запросы без
+        # content читают меньше страниц. Новые значения сжимаются lz4 (PostgreSQL 14+),
+        # уже записанные остаются в pglz до перезаписи.
+        op.execute("ALTER TABLE posts SET (toast_tuple_target = 512)")
+        if bind.dialect.server_version_info >= (14,):
+            op.execute("ALTER TABLE posts ALTER COLUMN content SET COMPRESSION lz4")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        if bind.dialect.server_version_info >= (14,):
+            op.execute("ALTER TABLE posts ALTER COLUMN content SET COMPRESSION DEFAULT")
+        op.execute("ALTER TABLE posts RESET (toast_tuple_target)")
+    op.drop_column('posts', 'excerpt')
@@ -0,0 +1,35 @@
+"""Add follows for the subscription feed
+
+Revision ID: 6b1e5f9a3c72
+Revises: 0a9c4e6b2d18
+Create Date: 2026-10-18 19:12:47.903154
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b1e5f9a3c72'
+down_revision: Union[str, None] = '0a9c4e6b2d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Авторы, на которых подписан пользователь, читаются по первичному ключу;
+    # посты каждого автора в ленте — по ix_posts_user_id_created_at
+    op.create_table('follows',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['followee_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['follower_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('follows')
@@ -0,0 +1,32 @@
+"""Add user_post_stats_jobs for idempotent statistics updates
+
+Revision ID: 8c5a1e7d3b90
+Revises: 3f8d2b6e9a14
+Create Date: 2026-10-18 22:05:37.184402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c5a1e7d3b90'
+down_revision: Union[str, None] = '3f8d2b6e9a14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_post_stats_jobs',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('applied_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_user_post_stats_jobs_applied_at'), 'user_post_stats_jobs', ['applied_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_post_stats_jobs_applied_at'), table_name='user_post_stats_jobs')
+    op.drop_table('user_post_stats_jobs')
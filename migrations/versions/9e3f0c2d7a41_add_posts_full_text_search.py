@@ -0,0 +1,68 @@
+"""Add full-text search for posts
+
+Revision ID: 9e3f0c2d7a41
+Revises: 1cbab4bf282c
+Create Date: 2026-10-18 11:02:47.108355
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3f0c2d7a41'
+down_revision: Union[str, None] = '1cbab4bf282c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Генерируемая колонка заполняется для существующих строк при добавлении
+        op.execute("""
+            ALTER TABLE posts ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(content, '')), 'B')
+            ) STORED
+        """)
+        op.execute("CREATE INDEX ix_posts_search_vector ON posts USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE posts_fts USING fts5(
+                title, content, content='posts', content_rowid='id', tokenize='unicode61'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN
+                INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER posts_fts_ad AFTER DELETE ON posts BEGIN
+                INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER posts_fts_au AFTER UPDATE OF title, content ON posts BEGIN
+                INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+                INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+            END
+        """)
+        # Индексируем уже существующие посты
+        op.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_posts_search_vector")
+        op.execute("ALTER TABLE posts DROP COLUMN IF EXISTS search_vector")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS posts_fts_ai")
+        op.execute("DROP TABLE IF EXISTS posts_fts")
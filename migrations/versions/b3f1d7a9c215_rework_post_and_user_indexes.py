@@ -0,0 +1,38 @@
+"""Index posts by (user_id, created_at, id), drop indexes duplicating primary keys
+
+Revision ID: b3f1d7a9c215
+Revises: e7a2b9d4c013
+Create Date: 2026-10-18 15:40:27.903114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f1d7a9c215'
+down_revision: Union[str, None] = 'e7a2b9d4c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Экспорт и пересчёт статистики пользователя: WHERE user_id [AND created_at ...]
+    # ORDER BY created_at, id. users.username уже проиндексирован ограничением UNIQUE.
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_user_id_created_at', ['user_id', 'created_at', 'id'], unique=False)
+        batch_op.drop_index('ix_posts_id')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_id')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_id', ['id'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_id', ['id'], unique=False)
+        batch_op.drop_index('ix_posts_user_id_created_at')
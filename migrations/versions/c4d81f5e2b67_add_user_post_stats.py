@@ -0,0 +1,44 @@
+"""Add user_post_stats rollup table
+
+Revision ID: c4d81f5e2b67
+Revises: 9e3f0c2d7a41
+Create Date: 2026-10-18 12:20:31.640912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d81f5e2b67'
+down_revision: Union[str, None] = '9e3f0c2d7a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_post_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('post_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'month')
+    )
+
+    # Заполняем агрегаты по существующим постам
+    if op.get_bind().dialect.name == 'postgresql':
+        month = "date_trunc('month', created_at)::date"
+    else:
+        month = "date(created_at, 'start of month')"
+    op.execute(f"""
+        INSERT INTO user_post_stats (user_id, month, post_count)
+        SELECT user_id, {month}, count(id) FROM posts
+        WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY user_id, {month}
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_post_stats')
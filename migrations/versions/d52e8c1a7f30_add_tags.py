@@ -0,0 +1,47 @@
+"""Add tags and post_tags with denormalized tag post counts
+
+Revision ID: d52e8c1a7f30
+Revises: b3f1d7a9c215
+Create Date: 2026-10-18 16:55:12.418306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd52e8c1a7f30'
+down_revision: Union[str, None] = 'b3f1d7a9c215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('post_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    # Облако тегов: ORDER BY post_count DESC, name
+    op.create_index('ix_tags_post_count_name', 'tags', [sa.text('post_count DESC'), 'name'], unique=False)
+
+    op.create_table('post_tags',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('post_id', 'tag_id')
+    )
+    # Посты с тегом (?tag=); теги поста читаются по первичному ключу
+    op.create_index('ix_post_tags_tag_id_post_id', 'post_tags', ['tag_id', 'post_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_post_tags_tag_id_post_id', table_name='post_tags')
+    op.drop_table('post_tags')
+    op.drop_index('ix_tags_post_count_name', table_name='tags')
+    op.drop_table('tags')
@@ -0,0 +1,28 @@
+"""Add posts.version for optimistic concurrency
+
+Revision ID: e7a2b9d4c013
+Revises: c4d81f5e2b67
+Create Date: 2026-10-18 13:05:12.281774
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2b9d4c013'
+down_revision: Union[str, None] = 'c4d81f5e2b67'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -8,6 +8,17 @@ from sqlalchemy.orm import sessionmaker
 from app.main import app  # импорт приложения
 from app.database import get_db
 from app.models import Base
+from app.user_operations import user_cache
+from app.auth import token_cache
+from app.post_cache import response_cache
+from app import post_cache
+from app import rate_limit
+from app import jobs
+from app import feed
+
+# Фоновые задачи выполняются сразу после commit в сессии запроса: в тестах нет
+# воркеров, а база в памяти доступна только через эту сессию
+jobs.queue.backend = "inline"
 
 
 DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -31,6 +42,12 @@ async def client(db_session):
         return db_session  # Возвращаем сессию напрямую, 
 
     app.dependency_overrides[get_db] = override_get_db
+    # Кэши живут в процессе, а база пересоздаётся для каждого теста
+    user_cache.clear()
+    token_cache.clear()
+    response_cache.clear()
+    rate_limit.store.clear()
+    feed.author_cache.clear()
 
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
         async with engine.begin() as conn:
@@ -40,6 +57,28 @@ async def client(db_session):
             await conn.run_sync(Base.metadata.drop_all)
 
 
+from contextlib import contextmanager
+from app import query_debug
+
+# Бюджет SQL-запросов для маршрута: тест падает, если внутри блока выполнено
+# больше max_statements выражений или одно выражение повторяется max_repeats раз.
+#     with query_budget(2):
+#         await client.get("/post/1")
+@pytest.fixture
+def query_budget():
+    query_debug.instrument_engine(engine)
+
+    @contextmanager
+    def budget(max_statements: int, max_repeats: int = 3):
+        with query_debug.capture_queries() as log:
+            yield log
+        problems = log.problems(max_statements, max_repeats)
+        if problems:
+            pytest.fail("Query budget exceeded: " + "; ".join(problems) + "\n" + log.report())
+
+    return budget
+
+
 
 from app.schemas import PostCreate, UserCreate
 
@@ -220,3 +259,920 @@ async def test_search_posts(client, db_session):
     assert len(posts) > 0
     assert posts[0]["title"] == "First Post"
 
+
+
+from app import hashing
+
+@pytest.mark.asyncio
+async def test_login_rejected_when_hash_pool_saturated(client, db_session, monkeypatch):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+
+    # Пул из одного воркера без очереди: пока воркер занят, логин получает 503
+    pool = hashing.HashingPool("thread", workers=1, max_pending=0, queue_timeout=0.1)
+    monkeypatch.setattr(hashing, "password_pool", pool)
+    async with pool.slot():
+        response = await client.post("/token", data=user_data)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    # После освобождения воркера логин снова проходит
+    response = await client.post("/token", data=user_data)
+    assert response.status_code == 200
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_read_posts_cursor_pagination(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token_response = await client.post("/token", data=user_data)
+    token = token_response.json()["access_token"]
+
+    for i in range(5):
+        await client.post(
+            "/posts",
+            json={"title": f"Post {i}", "content": f"Content for post {i}"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    # Первая страница в режиме курсора
+    response = await client.get("/posts?paginate=cursor&limit=2")
+    assert response.status_code == 200
+    page = response.json()
+    assert [p["title"] for p in page["items"]] == ["Post 0", "Post 1"]
+    assert page["prev_cursor"] is None
+
+    # Вперёд до конца
+    page2 = (await client.get(f"/posts?cursor={page['next_cursor']}&limit=2")).json()
+    assert [p["title"] for p in page2["items"]] == ["Post 2", "Post 3"]
+    page3 = (await client.get(f"/posts?cursor={page2['next_cursor']}&limit=2")).json()
+    assert [p["title"] for p in page3["items"]] == ["Post 4"]
+    assert page3["next_cursor"] is None
+
+    # И обратно
+    back = (await client.get(f"/posts?cursor={page3['prev_cursor']}&limit=2")).json()
+    assert [p["title"] for p in back["items"]] == ["Post 2", "Post 3"]
+
+    # Поиск тоже поддерживает курсор
+    found = (await client.get("/posts/search?query=Post&paginate=cursor&limit=3")).json()
+    assert len(found["items"]) == 3
+    assert found["next_cursor"] is not None
+
+    response = await client.get("/posts?cursor=garbage")
+    assert response.status_code == 400
+
+
+from app import auth
+
+@pytest.mark.asyncio
+async def test_current_user_is_cached(client, db_session, monkeypatch):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    post_data = {"title": "Test Post", "content": "This is a test post."}
+
+    response = await client.post("/posts", json=post_data, headers=headers)
+    assert response.status_code == 200
+    assert user_cache.get("testuser").id == response.json()["user_id"]
+    assert token in token_cache
+
+    # В режиме доверия claims пользователь не ищется ни в кэше, ни в БД
+    user_cache.clear()
+    monkeypatch.setattr(auth, "AUTH_TRUST_TOKEN_CLAIMS", True)
+    response = await client.post("/posts", json=post_data, headers=headers)
+    assert response.status_code == 200
+    assert len(user_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_search_posts_ranked_with_snippet(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    await client.post("/posts", json={"title": "Cooking", "content": "A python recipe."}, headers=headers)
+    await client.post("/posts", json={"title": "Python tips", "content": "More python, python everywhere."}, headers=headers)
+    created = await client.post("/posts", json={"title": "Gardening", "content": "Nothing here."}, headers=headers)
+
+    response = await client.get("/posts/search?query=pyth")
+    assert response.status_code == 200
+    posts = response.json()
+    assert [p["title"] for p in posts] == ["Python tips", "Cooking"]
+    assert "<mark>" in posts[0]["snippet"]
+    assert posts[0]["rank"] >= posts[1]["rank"]
+
+    # Индекс следует за изменениями поста
+    await client.put(
+        f"/posts/{created.json()['id']}",
+        json={"title": "Gardening", "content": "Python in the garden."},
+        headers=headers,
+    )
+    response = await client.get("/posts/search?query=garden python")
+    assert [p["title"] for p in response.json()] == ["Gardening"]
+
+
+import asyncio
+from app import metrics as metrics_module
+from app.database import create_database_engine, pool_metrics, InstrumentedQueuePool
+
+@pytest.mark.asyncio
+async def test_pool_metrics(tmp_path):
+    pool_engine = create_database_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0,
+    )
+    assert pool_engine.echo is False
+    observed = metrics_module.DB_POOL_WAIT.get()["count"]
+    async with pool_engine.connect():
+        metrics = pool_metrics(pool_engine)
+        assert metrics["checked_out"] == 1
+        assert metrics["waits"] == 0
+
+        # Второе соединение ждёт, пока первое не вернётся в пул
+        async def second():
+            async with pool_engine.connect():
+                pass
+        waiting = asyncio.create_task(second())
+        await asyncio.sleep(0.05)
+    await waiting
+    metrics = pool_metrics(pool_engine)
+    assert metrics["checked_out"] == 0
+    assert metrics["waits"] == 1 and metrics["wait_seconds_max"] > 0
+    assert metrics_module.DB_POOL_WAIT.get()["count"] == observed + 1
+    await pool_engine.dispose()
+
+
+from app import database
+from app.models import Post as PostModel
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_until_own_write(tmp_path, monkeypatch):
+    # Два SQLite-файла вместо основной БД и реплики
+    primary_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    for db_engine in (primary_engine, replica_engine):
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    PrimarySession = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine, class_=AsyncSession)
+    ReplicaSession = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, class_=AsyncSession)
+
+    async with ReplicaSession() as session:
+        session.add(PostModel(title="Replica Post", content="Only on the replica", user_id=1))
+        await session.commit()
+
+    async def override_get_db():
+        async with PrimarySession() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    monkeypatch.setattr(database, "AsyncReadSessionLocal", ReplicaSession)
+    user_cache.clear()
+    token_cache.clear()
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/posts")
+            assert [p["title"] for p in response.json()] == ["Replica Post"]
+
+            # После записи клиент читает из основной БД
+            user_data = {"username": "testuser", "password": "testpass"}
+            await client.post("/register", json=user_data)
+            token = (await client.post("/token", data=user_data)).json()["access_token"]
+            response = await client.post(
+                "/posts",
+                json={"title": "Primary Post", "content": "Written to the primary"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            assert database.PRIMARY_STICKY_COOKIE in response.cookies
+            response = await client.get("/posts")
+            assert [p["title"] for p in response.json()] == ["Primary Post"]
+    finally:
+        app.dependency_overrides.clear()
+        await primary_engine.dispose()
+        await replica_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_post_cache_etag_and_invalidation(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    post_id = (await client.post("/posts", json={"title": "Cached", "content": "v1"}, headers=headers)).json()["id"]
+
+    response = await client.get(f"/post/{post_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    # Клиент с актуальной версией получает 304 без тела
+    response = await client.get(f"/post/{post_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    listing = await client.get("/posts")
+    assert listing.json()[0]["content"] == "v1"
+    response = await client.get("/posts", headers={"If-None-Match": listing.headers["ETag"]})
+    assert response.status_code == 304
+
+    # Запись обновляет кэш поста и сбрасывает закэшированные страницы
+    await client.put(f"/posts/{post_id}", json={"title": "Cached", "content": "v2"}, headers=headers)
+    assert (await client.get(f"/post/{post_id}")).json()["content"] == "v2"
+    listing = await client.get("/posts")
+    assert listing.json()[0]["content"] == "v2"
+
+    await client.delete(f"/posts/{post_id}", headers=headers)
+    assert (await client.get(f"/post/{post_id}")).status_code == 404
+
+
+from datetime import datetime, timedelta, timezone
+from app import stats
+
+@pytest.mark.asyncio
+async def test_user_statistics_rollup(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    user_id = (await client.post("/register", json=user_data)).json()["id"]
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    post_ids = []
+    for i in range(3):
+        response = await client.post("/posts", json={"title": f"Post {i}", "content": "..."}, headers=headers)
+        post_ids.append(response.json()["id"])
+    await client.delete(f"/posts/{post_ids[0]}", headers=headers)
+
+    response = await client.get(f"/posts/statistics/{user_id}")
+    assert response.status_code == 200
+    assert response.json() == {
+        "average_posts_per_month": 2, "posts_this_month": 2, "total_posts": 2, "months": 1,
+    }
+
+    # Повтор уже применённой задачи не меняет счётчик
+    month = stats.month_start(datetime.now(timezone.utc)).isoformat()
+    payload = {"user_id": user_id, "month": month, "delta": 1, "key": "retried"}
+    for _ in range(2):
+        await stats._refresh_user_stats(db_session, payload)
+    assert (await client.get(f"/posts/statistics/{user_id}")).json()["total_posts"] == 3
+    await stats._refresh_user_stats(db_session, {**payload, "delta": -1, "key": "undo"})
+
+    # Пост трёхмесячной давности, добавленный в обход API, учитывается после пересчёта
+    old = datetime.now(timezone.utc).replace(tzinfo=None, day=1) - timedelta(days=80)
+    db_session.add(PostModel(title="Old", content="...", user_id=user_id, created_at=old, updated_at=old))
+    await db_session.commit()
+    await stats.rebuild(db_session)
+    statistics = (await client.get(f"/posts/statistics/{user_id}")).json()
+    assert statistics["total_posts"] == 3
+    assert statistics["months"] == 4
+    assert statistics["average_posts_per_month"] == 0.75
+
+
+import json
+
+@pytest.mark.asyncio
+async def test_bulk_create_posts(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    user_id = (await client.post("/register", json=user_data)).json()["id"]
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # JSON-массив: некорректный элемент не мешает остальным
+    items = [{"title": f"Bulk {i}", "content": "..."} for i in range(5)]
+    items.insert(2, {"title": "No content"})
+    response = await client.post("/posts/bulk", json=items, headers=headers)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["inserted"] == 5
+    assert len(result["ids"]) == 5
+    assert [e["index"] for e in result["errors"]] == [2]
+
+    # NDJSON с битой строкой
+    lines = [json.dumps({"title": f"Line {i}", "content": "..."}) for i in range(3)] + ["{not json"]
+    response = await client.post(
+        "/posts/bulk",
+        content="\n".join(lines) + "\n",
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    result = response.json()
+    assert result["inserted"] == 3
+    assert result["errors"][0]["index"] == 3
+
+    assert len((await client.get("/posts?limit=100")).json()) == 8
+    statistics = (await client.get(f"/posts/statistics/{user_id}")).json()
+    assert statistics["total_posts"] == 8
+
+
+import csv
+import io
+
+@pytest.mark.asyncio
+async def test_export_posts(client, db_session):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    items = [{"title": f"Post {i}", "content": f"Content, \"quoted\" {i}"} for i in range(3)]
+    await client.post("/posts/bulk", json=items, headers=headers)
+    # Пост другого автора не должен попасть в выгрузку с фильтром
+    db_session.add(PostModel(title="Foreign", content="...", user_id=999))
+    await db_session.commit()
+
+    response = await client.get("/posts/export?user_id=1")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["title"] for row in rows] == ["Post 0", "Post 1", "Post 2"]
+
+    response = await client.get("/posts/export?format=csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 4
+    assert rows[0]["content"] == 'Content, "quoted" 0'
+
+
+from sqlalchemy import event
+
+@pytest.mark.asyncio
+async def test_conditional_update_and_delete(client, db_session):
+    owner = {"username": "owner", "password": "testpass"}
+    other = {"username": "other", "password": "testpass"}
+    for user_data in (owner, other):
+        await client.post("/register", json=user_data)
+    owner_headers = {"Authorization": f"Bearer {(await client.post('/token', data=owner)).json()['access_token']}"}
+    other_headers = {"Authorization": f"Bearer {(await client.post('/token', data=other)).json()['access_token']}"}
+
+    post = (await client.post("/posts", json={"title": "T", "content": "v1"}, headers=owner_headers)).json()
+    assert post["version"] == 1
+    etag = (await client.get(f"/post/{post['id']}")).headers["ETag"]
+
+    # Успешное изменение — ровно один SQL-запрос
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = await client.put(f"/posts/{post['id']}", json={"title": "T", "content": "v2"}, headers={**owner_headers, "If-Match": etag})
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert len(statements) == 1 and statements[0].startswith("UPDATE posts")
+    new_etag = response.headers["ETag"]
+
+    # Устаревший ETag — 412, чужой пост — 403, несуществующий — 404
+    response = await client.put(f"/posts/{post['id']}", json={"title": "T", "content": "v3"}, headers={**owner_headers, "If-Match": etag})
+    assert response.status_code == 412
+    response = await client.put(f"/posts/{post['id']}", json={"title": "T", "content": "v3"}, headers=other_headers)
+    assert response.status_code == 403
+    response = await client.delete(f"/posts/{post['id']}", headers=other_headers)
+    assert response.status_code == 403
+    response = await client.delete("/posts/9999", headers=owner_headers)
+    assert response.status_code == 404
+
+    response = await client.delete(f"/posts/{post['id']}", headers={**owner_headers, "If-Match": new_etag})
+    assert response.status_code == 200
+
+
+from app import metrics
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client, db_session):
+    metrics.instrument_engine(engine)
+    metrics.registry.clear()
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    token = (await client.post("/token", data=user_data)).json()["access_token"]
+    post = (await client.post("/posts", json={"title": "T", "content": "C"}, headers={"Authorization": f"Bearer {token}"})).json()
+    await client.get(f"/post/{post['id']}")
+    await client.get("/post/9999")
+    await client.get("/no-such-path")
+
+    # Серии по шаблону маршрута, а не по конкретному пути
+    assert metrics.HTTP_REQUESTS.get("GET", "/post/{id}", "200") == 1
+    assert metrics.HTTP_REQUESTS.get("GET", "/post/{id}", "404") == 1
+    assert metrics.HTTP_REQUESTS.get("GET", "unmatched", "404") == 1
+    assert metrics.HTTP_REQUEST_DB_QUERIES.get("POST", "/posts")["sum"] >= 1
+    assert metrics.HTTP_REQUEST_DB_DURATION.get("POST", "/posts")["count"] == 1
+    assert metrics.PASSWORD_HASH_DURATION.get("hash_password")["count"] == 1
+    assert metrics.PASSWORD_HASH_DURATION.get("check_password")["count"] == 1
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_requests_total{method="GET",route="/post/{id}",status="200"} 1' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/post/{id}",le="+Inf"} 2' in body
+    assert "/post/9999" not in body
+
+
+import logging
+from app.crud import get_post as crud_get_post
+
+@pytest.mark.asyncio
+async def test_query_budget(client, db_session, query_budget, monkeypatch, caplog):
+    user_data = {"username": "testuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+    for i in range(5):
+        await client.post("/posts", json={"title": f"Post {i}", "content": "C"}, headers=headers)
+
+    with query_budget(1) as log:
+        await client.get("/posts")
+    assert log.count == 1
+    # INSERT и чтение поста; ещё три выражения — задача статистики (в тестах inline)
+    with query_budget(5):
+        await client.post("/posts", json={"title": "T", "content": "C"}, headers=headers)
+
+    # Чтение постов по одному в цикле — N+1 с одинаковой формой выражения
+    with pytest.raises(pytest.fail.Exception, match="5x SELECT"):
+        with query_budget(10):
+            for post_id in range(1, 6):
+                await crud_get_post(db_session, post_id)
+
+    # Медленные выражения логируются с параметрами и планом
+    monkeypatch.setattr(query_debug, "SLOW_QUERY_SECONDS", 1e-9)
+    with caplog.at_level(logging.WARNING, logger="app.query_debug"):
+        await crud_get_post(db_session, 1)
+    assert "Slow statement" in caplog.text
+    assert "plan:" in caplog.text and "posts" in caplog.text.split("plan:")[1]
+
+
+@pytest.mark.asyncio
+async def test_expand_author(client, db_session, query_budget):
+    authors = [{"username": f"author{i}", "password": "testpass"} for i in range(3)]
+    for i, user_data in enumerate(authors):
+        await client.post("/register", json=user_data)
+        headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+        for j in range(2):
+            post = (await client.post("/posts", json={"title": f"Post {i}-{j}", "content": "Expand me"}, headers=headers)).json()
+
+    # Авторы загружаются тем же запросом, что и страница
+    with query_budget(1):
+        response = await client.get("/posts", params={"expand": "author"})
+    assert response.status_code == 200
+    posts = response.json()
+    assert len(posts) == 6
+    assert all(p["author"] == {"id": p["user_id"], "username": f"author{p['user_id'] - 1}"} for p in posts)
+    assert "author" not in (await client.get("/posts")).json()[0]
+
+    page = (await client.get("/posts", params={"paginate": "cursor", "limit": 2, "expand": "author"})).json()
+    assert page["items"][0]["author"]["username"] == "author0"
+    # Для поиска — один дополнительный запрос IN (...) на страницу
+    with query_budget(2, max_repeats=2):
+        results = (await client.get("/posts/search", params={"query": "expand", "expand": "author"})).json()
+    assert {r["author"]["username"] for r in results} == {"author0", "author1", "author2"}
+
+    response = await client.get(f"/post/{post['id']}", params={"expand": "author"})
+    assert response.json()["author"] == {"id": 3, "username": "author2"}
+    assert response.headers["ETag"] == (await client.get(f"/post/{post['id']}")).headers["ETag"]
+
+    # Изменение поста сбрасывает и закэшированный вариант с автором
+    await client.put(f"/posts/{post['id']}", json={"title": "Changed", "content": "Expand me"}, headers=headers)
+    response = await client.get(f"/post/{post['id']}", params={"expand": "author"})
+    assert response.json()["title"] == "Changed"
+    assert response.json()["author"]["username"] == "author2"
+
+    assert (await client.get("/post/9999", params={"expand": "author"})).status_code == 404
+    assert (await client.get("/posts", params={"expand": "comments"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_posts_batch(client, db_session, query_budget):
+    user_data = {"username": "batchuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+    ids = [(await client.post("/posts", json={"title": f"Batch {i}", "content": "Batch"}, headers=headers)).json()["id"] for i in range(3)]
+
+    # Пост ids[1] уже в кэше после GET /post/{id}; остальные читаются одним запросом
+    single = await client.get(f"/post/{ids[1]}")
+    await post_cache.response_cache.delete(post_cache.post_key(ids[0]), post_cache.post_key(ids[2]))
+    with query_budget(1):
+        response = await client.get("/posts/batch", params={"ids": f"{ids[2]},9999,{ids[0]},{ids[1]},{ids[2]}"})
+    assert response.status_code == 200
+    batch = response.json()
+    assert [p["id"] for p in batch["items"]] == [ids[2], ids[0], ids[1]]
+    assert batch["missing"] == [9999]
+    assert batch["items"][2] == single.json()
+
+    # Посты из пакета попали в общий кэш
+    with query_budget(0):
+        assert (await client.get(f"/post/{ids[0]}")).json() == batch["items"][1]
+        assert (await client.post("/posts/batch", json={"ids": ids})).json()["missing"] == []
+
+    response = await client.post("/posts/batch", params={"expand": "author"}, json={"ids": [ids[0], 12345]})
+    assert response.json()["items"][0]["author"] == {"id": 1, "username": "batchuser"}
+    assert response.json()["missing"] == [12345]
+
+    # Изменение поста видно в пакетном чтении
+    await client.put(f"/posts/{ids[0]}", json={"title": "Changed", "content": "Batch"}, headers=headers)
+    assert (await client.get("/posts/batch", params={"ids": str(ids[0])})).json()["items"][0]["title"] == "Changed"
+
+    assert (await client.get("/posts/batch", params={"ids": "1,x"})).status_code == 400
+    assert (await client.post("/posts/batch", json={"ids": list(range(1000))})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_tags(client, db_session, query_budget):
+    user_data = {"username": "taguser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+    first = (await client.post("/posts", json={"title": "Python tips", "content": "Tagged", "tags": ["Python", "web", "python "]}, headers=headers)).json()
+    second = (await client.post("/posts", json={"title": "Web notes", "content": "Tagged", "tags": ["web"]}, headers=headers)).json()
+    await client.post("/posts", json={"title": "Untagged", "content": "Tagged"}, headers=headers)
+    await client.post("/posts/bulk", json=[{"title": "Bulk", "content": "Tagged", "tags": ["web", "bulk"]}], headers=headers)
+
+    # Счётчики обновляются при записи, облако тегов читается одним запросом
+    with query_budget(1):
+        assert (await client.get("/tags")).json() == [
+            {"name": "web", "post_count": 3}, {"name": "bulk", "post_count": 1}, {"name": "python", "post_count": 1},
+        ]
+
+    assert [p["title"] for p in (await client.get("/posts", params={"tag": "web"})).json()] == ["Python tips", "Web notes", "Bulk"]
+    page = (await client.get("/posts", params={"tag": "python", "paginate": "cursor"})).json()
+    assert [p["id"] for p in page["items"]] == [first["id"]]
+    assert (await client.get("/posts", params={"tag": "missing"})).status_code == 404
+    results = (await client.get("/posts/search", params={"query": "tagged", "tag": "bulk", "expand": "tags"})).json()
+    assert [(r["title"], r["tags"]) for r in results] == [("Bulk", ["bulk", "web"])]
+
+    with query_budget(2):
+        posts = (await client.get("/posts", params={"expand": "tags"})).json()
+    assert [p["tags"] for p in posts] == [["python", "web"], ["web"], [], ["bulk", "web"]]
+    assert "author" not in posts[0]
+    post = (await client.get(f"/post/{first['id']}", params={"expand": "tags,author"})).json()
+    assert post["tags"] == ["python", "web"] and post["author"]["username"] == "taguser"
+    assert "tags" not in (await client.get(f"/post/{first['id']}")).json()
+
+    # Замена тегов меняет только отличающиеся счётчики; PUT без tags их не трогает
+    await client.put(f"/posts/{first['id']}", json={"title": "Python tips", "content": "Tagged", "tags": ["python", "async"]}, headers=headers)
+    await client.put(f"/posts/{second['id']}", json={"title": "Web notes 2", "content": "Tagged"}, headers=headers)
+    assert (await client.get(f"/post/{first['id']}", params={"expand": "tags"})).json()["tags"] == ["async", "python"]
+    assert (await client.get(f"/post/{second['id']}", params={"expand": "tags"})).json()["tags"] == ["web"]
+    await client.delete(f"/posts/{second['id']}", headers=headers)
+    assert {t["name"]: t["post_count"] for t in (await client.get("/tags")).json()} == {"async": 1, "bulk": 1, "python": 1, "web": 1}
+
+    # Пересчёт с нуля даёт те же значения
+    from app import tags
+    before = (await client.get("/tags")).json()
+    await tags.rebuild(db_session)
+    assert (await client.get("/tags")).json() == before
+
+    response = await client.post("/posts", json={"title": "Too many", "content": "Tags", "tags": [f"t{i}" for i in range(11)]}, headers=headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_delete_post_decrements_tag_counts_with_foreign_keys(tmp_path):
+    # Как в PostgreSQL: ON DELETE CASCADE удалил бы связи с тегами вместе с постом
+    fk_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fk.db'}")
+
+    @event.listens_for(fk_engine.sync_engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    async with fk_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    FkSession = sessionmaker(autocommit=False, autoflush=False, bind=fk_engine, class_=AsyncSession)
+    from app import crud, tags
+    from app.schemas import PostCreate, UserCreate
+    try:
+        async with FkSession() as session:
+            user_id = (await crud.create_user(session, UserCreate(username="fkuser", password="testpass"))).id
+            post_id = (await crud.create_post(session, PostCreate(title="Tagged", content="Cascade", tags=["web"]), user_id)).id
+            await crud.create_post(session, PostCreate(title="Kept", content="Cascade", tags=["web"]), user_id)
+            await crud.delete_post(session, post_id, user_id=user_id)
+            assert [(t["name"], t["post_count"]) for t in await tags.get_tags(session)] == [("web", 1)]
+    finally:
+        await fk_engine.dispose()
+
+
+
+@pytest.mark.asyncio
+async def test_feed(client, db_session, query_budget):
+    users = {}
+    for name in ("reader", "alice", "bob"):
+        user_data = {"username": name, "password": "testpass"}
+        user_id = (await client.post("/register", json=user_data)).json()["id"]
+        token = (await client.post("/token", data=user_data)).json()["access_token"]
+        users[name] = (user_id, {"Authorization": f"Bearer {token}"})
+    reader_id, reader = users["reader"]
+
+    for name in ("alice", "bob"):
+        response = await client.post(f"/users/{users[name][0]}/follow", headers=reader)
+        assert response.status_code == 200
+    await client.post(f"/users/{users['alice'][0]}/follow", headers=reader)
+    assert (await client.post(f"/users/{reader_id}/follow", headers=reader)).status_code == 400
+    assert (await client.post("/users/999/follow", headers=reader)).status_code == 404
+
+    # Посты авторов вперемешку; свои посты читателя в ленту не попадают
+    ids = []
+    for i in range(3):
+        for name in ("alice", "bob"):
+            ids.append((await client.post("/posts", json={"title": f"{name} {i}", "content": "Feed"}, headers=users[name][1])).json()["id"])
+    await client.post("/posts", json={"title": "Own", "content": "Feed"}, headers=reader)
+    ids.reverse()
+
+    first = (await client.get("/feed", params={"limit": 4}, headers=reader)).json()
+    assert [p["id"] for p in first["items"]] == ids[:4]
+    assert first["prev_cursor"] is None
+    second = (await client.get("/feed", params={"limit": 4, "cursor": first["next_cursor"]}, headers=reader)).json()
+    assert [p["id"] for p in second["items"]] == ids[4:]
+    assert second["next_cursor"] is None
+
+    # Ключи постов авторов уже в кэше: подписки и посты по ID, без чтения постов авторов
+    with query_budget(2):
+        response = await client.get("/feed", params={"limit": 4, "expand": "author"}, headers=reader)
+    assert [p["author"]["username"] for p in response.json()["items"]] == ["bob", "alice", "bob", "alice"]
+
+    # Новый пост сбрасывает кэш автора, отписка убирает его посты
+    new = (await client.post("/posts", json={"title": "alice 3", "content": "Feed"}, headers=users["alice"][1])).json()
+    assert (await client.get("/feed", params={"limit": 1}, headers=reader)).json()["items"][0]["id"] == new["id"]
+    assert (await client.delete(f"/users/{users['bob'][0]}/follow", headers=reader)).status_code == 200
+    items = (await client.get("/feed", params={"limit": 10}, headers=reader)).json()["items"]
+    assert [p["title"] for p in items] == ["alice 3", "alice 2", "alice 1", "alice 0"]
+
+    assert (await client.get("/feed", params={"limit": 0}, headers=reader)).status_code == 400
+    assert (await client.get("/feed", params={"cursor": "bad"}, headers=reader)).status_code == 400
+    assert (await client.get("/feed")).status_code == 401
+
+
+
+from app import compression
+import gzip
+
+@pytest.mark.asyncio
+async def test_compression_and_conditional_get(client, db_session, query_budget):
+    user_data = {"username": "zipuser", "password": "testpass"}
+    await client.post("/register", json=user_data)
+    headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+    post = (await client.post("/posts", json={"title": "Long", "content": "Lorem ipsum dolor sit amet. " * 200}, headers=headers)).json()
+    await client.post("/posts", json={"title": "Long 2", "content": "Consectetur adipiscing elit. " * 200}, headers=headers)
+
+    # Тело сжимается целиком, ETag не меняется и годится для If-Match
+    response = await client.get(f"/post/{post['id']}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == response.num_bytes_downloaded < len(response.content) / 10
+    assert response.json()["content"] == post["content"]
+    assert response.headers["etag"] == '"%d-1"' % post["id"]
+    plain = await client.get(f"/post/{post['id']}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.content == response.content
+    assert "content-encoding" not in (await client.get(f"/post/{post['id']}", headers={"Accept-Encoding": "gzip;q=0"})).headers
+    assert "content-encoding" not in (await client.get("/tags", headers={"Accept-Encoding": "gzip"})).headers
+
+    # Потоковый ответ сжимается по частям, Content-Length не отправляется
+    response = await client.get("/posts/export", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip" and "content-length" not in response.headers
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["Long", "Long 2"]
+
+    # Маршрут без своего ETag получает слабый по хешу тела
+    feed = await client.get("/feed", headers=headers)
+    etag = feed.headers["etag"]
+    assert etag.startswith('W/"')
+    response = await client.get("/feed", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b"" and response.headers["etag"] == etag
+
+    # Пост не в кэше: If-None-Match проверяется по версии, содержимое не читается
+    etag = (await client.get(f"/post/{post['id']}")).headers["etag"]
+    response_cache.clear()
+    with query_budget(1) as log:
+        response = await client.get(f"/post/{post['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert "content" not in log.statements[0][0].split("FROM")[0]
+    response = await client.get(f"/post/{post['id']}", headers={"If-None-Match": '"0-0"'})
+    assert response.status_code == 200 and response.json()["id"] == post["id"]
+
+    assert compression.negotiate("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert compression.negotiate("gzip, br", ("br", "gzip")) == "br"
+    assert compression.negotiate("*;q=0.1", ("gzip",)) == "gzip"
+    assert compression.negotiate("gzip;q=0, *", ("gzip",)) is None
+    assert compression.negotiate("", ("gzip",)) is None
+    compressor = compression.GzipCompressor()
+    stream = compressor.process(b"first ", flush=True) + compressor.process(b"second") + compressor.finish()
+    assert gzip.decompress(stream) == b"first second"
+
+
+
+@pytest.mark.asyncio
+async def test_post_fields_and_summary(client, db_session, query_budget):
+    user_data = {"username": "fielduser", "password": "testpass"}
+    user_id = (await client.post("/register", json=user_data)).json()["id"]
+    headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+    long_content = "word " * 100
+    long = (await client.post("/posts", json={"title": "Long", "content": long_content}, headers=headers)).json()
+    await client.post("/posts", json={"title": "Short", "content": "Short text"}, headers=headers)
+
+    # Сводка: без content, с отрывком; content не читается из БД
+    with query_budget(1) as log:
+        summary = (await client.get("/posts", params={"view": "summary"})).json()
+    assert "posts.content" not in log.statements[0][0]
+    assert list(summary[0]) == ["title", "excerpt", "id", "created_at", "updated_at", "user_id", "version"]
+    assert summary[0]["excerpt"] == long_content[:200].rstrip() + "…"
+    assert summary[1]["excerpt"] == "Short text"
+
+    assert (await client.get("/posts", params={"fields": "title"})).json() == [{"title": "Long"}, {"title": "Short"}]
+    page = (await client.get("/posts", params={"fields": "title", "paginate": "cursor", "limit": 1})).json()
+    assert page["items"] == [{"title": "Long"}]
+    page = (await client.get("/posts", params={"fields": "title", "cursor": page["next_cursor"], "limit": 1})).json()
+    assert page["items"] == [{"title": "Short"}]
+    posts = (await client.get("/posts", params={"fields": "title,id", "expand": "author,tags"})).json()
+    assert posts[0] == {"title": "Long", "id": long["id"], "author": {"id": user_id, "username": "fielduser"}, "tags": []}
+    response = await client.get("/posts", params={"fields": "title,password"})
+    assert response.status_code == 400 and "password" in response.json()["detail"]
+
+    # Отрывок обновляется вместе с текстом; полный пост по-прежнему с content
+    await client.put(f"/posts/{long['id']}", json={"title": "Long", "content": "Rewritten"}, headers=headers)
+    assert (await client.get("/posts", params={"fields": "excerpt"})).json()[0] == {"excerpt": "Rewritten"}
+    post = (await client.get(f"/post/{long['id']}")).json()
+    assert post["content"] == "Rewritten" and "excerpt" not in post
+
+    reader = {"username": "fieldreader", "password": "testpass"}
+    await client.post("/register", json=reader)
+    reader_headers = {"Authorization": f"Bearer {(await client.post('/token', data=reader)).json()['access_token']}"}
+    await client.post(f"/users/{user_id}/follow", headers=reader_headers)
+    items = (await client.get("/feed", params={"view": "summary"}, headers=reader_headers)).json()["items"]
+    assert [(p["title"], p["excerpt"], "content" in p) for p in items] == [("Short", "Short text", False), ("Long", "Rewritten", False)]
+
+
+from fastapi import FastAPI
+
+@pytest.mark.asyncio
+async def test_rate_limit(client, db_session):
+    # Лимит по умолчанию для /register: 5 запросов за минуту с одного IP
+    for i in range(5):
+        response = await client.post("/register", json={"username": f"user{i}", "password": "testpass"})
+        assert response.status_code == 200
+    response = await client.post("/register", json={"username": "user5", "password": "testpass"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert (await client.get("/posts/statistics/1")).status_code != 429
+
+    # Корзины: отдельная для каждого пользователя, пополняются со временем
+    now = [0.0]
+    store = rate_limit.MemoryRateLimitStore(timer=lambda: now[0])
+    limited = FastAPI()
+    limited.add_middleware(rate_limit.RateLimitMiddleware, rules=rate_limit.parse_rules("GET /items/{id}=2/10"), store=store)
+
+    @limited.get("/items/{id}")
+    async def read_item(id: int):
+        return {"id": id}
+
+    tokens = {name: (await client.post("/token", data={"username": name, "password": "testpass"})).json()["access_token"] for name in ("user0", "user1")}
+    async with AsyncClient(transport=ASGITransport(app=limited), base_url="http://test") as limited_client:
+        get = lambda path, user: limited_client.get(path, headers={"Authorization": f"Bearer {tokens[user]}"})
+        assert (await get("/items/1", "user0")).status_code == 200
+        assert (await get("/items/2", "user0")).status_code == 200
+        response = await get("/items/3", "user0")
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "5"
+        assert (await get("/items/1", "user1")).status_code == 200
+        now[0] = 5.0
+        assert (await get("/items/1", "user0")).status_code == 200
+        assert (await get("/items/1", "user0")).status_code == 429
+        # Невалидный токен считается по IP, а не даёт новую корзину
+        for _ in range(2):
+            await limited_client.get("/items/1", headers={"Authorization": "Bearer garbage"})
+        assert (await limited_client.get("/items/1", headers={"Authorization": "Bearer other"})).status_code == 429
+
+    with pytest.raises(ValueError):
+        rate_limit.parse_rules("POST /token")
+
+
+from app import index_advisor
+
+@pytest.mark.asyncio
+async def test_index_advisor_finds_no_sequential_scans(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'advisor.db'}"
+    setup_engine = create_async_engine(url)
+    async with setup_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await setup_engine.dispose()
+
+    flagged = await index_advisor.run(url, users=5, posts=500)
+    assert flagged == []
+
+    # Тестовые данные откатываются
+    check_engine = create_async_engine(url)
+    async with check_engine.connect() as conn:
+        assert (await conn.exec_driver_sql("SELECT count(*) FROM posts")).scalar() == 0
+    await check_engine.dispose()
+
+    assert index_advisor.sequential_scans("sqlite", "3 0 0 SCAN posts\n7 0 0 SEARCH users USING INTEGER PRIMARY KEY (rowid=?)") == ["posts"]
+    assert index_advisor.sequential_scans("sqlite", "2 0 0 SCAN posts USING INDEX ix_posts_created_at_id") == []
+    assert index_advisor.sequential_scans("postgresql", "Limit\n  ->  Seq Scan on posts  (cost=0.00..1.05)") == ["posts"]
+
+
+from app import startup
+
+@pytest.mark.asyncio
+async def test_startup_checks_schema_version_and_warms_up(tmp_path, monkeypatch):
+    startup_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'startup.db'}")
+    async with startup_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Таблицы есть, но база не под управлением Alembic
+    with pytest.raises(startup.SchemaVersionMismatch):
+        await startup.check_schema_version(startup_engine)
+    async with startup_engine.begin() as conn:
+        await conn.exec_driver_sql("CREATE TABLE alembic_version (version_num VARCHAR(32) PRIMARY KEY)")
+        await conn.exec_driver_sql("INSERT INTO alembic_version VALUES ('e7a2b9d4c013')")
+    with pytest.raises(startup.SchemaVersionMismatch):
+        await startup.check_schema_version(startup_engine)
+    async with startup_engine.begin() as conn:
+        await conn.exec_driver_sql("UPDATE alembic_version SET version_num = ?", (next(iter(startup.migration_heads())),))
+    await startup.check_schema_version(startup_engine)
+
+    monkeypatch.setattr(startup, "engine", startup_engine)
+    monkeypatch.setattr(startup, "read_engine", None)
+    monkeypatch.setattr(startup, "DB_SCHEMA_CHECK", "alembic")
+    monkeypatch.setattr(startup, "ready", False)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/ready")
+        assert response.status_code == 503
+        await startup.startup_event()
+        response = await client.get("/ready")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready"}
+        await startup.shutdown_event()
+        assert (await client.get("/ready")).status_code == 503
+    await startup_engine.dispose()
+
+
+from sqlalchemy import func, select
+from app import worker
+from app.models import JobOutbox, User as UserModel, UserPostStats
+
+@pytest.mark.asyncio
+async def test_memory_jobs_use_benchmark_database(tmp_path, monkeypatch):
+    # Очередь в памяти, как по умолчанию: задача статистики пишет в базу бенчмарка
+    from benchmarks.common import asgi_client
+    monkeypatch.setattr(jobs.queue, "backend", "memory")
+    previous = jobs.queue.session_factory
+    user_cache.clear()
+    token_cache.clear()
+    rate_limit.store.clear()
+    async with asgi_client(str(tmp_path / "bench.db")) as (client, Session):
+        user_data = {"username": "benchuser", "password": "testpass"}
+        await client.post("/register", json=user_data)
+        headers = {"Authorization": f"Bearer {(await client.post('/token', data=user_data)).json()['access_token']}"}
+        await client.post("/posts", json={"title": "Queued", "content": "Stats"}, headers=headers)
+        await jobs.queue.join()
+        async with Session() as session:
+            assert (await session.execute(select(UserPostStats.post_count))).scalar_one() == 1
+    assert jobs.queue.session_factory is previous
+
+
+@pytest.mark.asyncio
+async def test_background_jobs(tmp_path, monkeypatch):
+    jobs_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with jobs_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=jobs_engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "retry_delay", lambda attempt: 0.01)
+
+    # Обработчик, который падает на первой попытке
+    calls = []
+    async def flaky(db, payload):
+        calls.append(payload["n"])
+        if calls.count(payload["n"]) == 1:
+            raise RuntimeError("first attempt fails")
+    monkeypatch.setitem(jobs.handlers, "flaky", flaky)
+
+    # Очередь в памяти: задачи откаченной транзакции не выполняются, упавшие повторяются
+    memory = jobs.JobQueue("memory", concurrency=2, max_attempts=3, session_factory=session_factory)
+    async with session_factory() as db:
+        await db.execute(select(func.count()).select_from(JobOutbox))
+        memory.enqueue(db, "flaky", {"n": 0})
+        await db.rollback()
+        assert "pending_jobs" not in db.info
+        for n in (1, 2):
+            memory.enqueue(db, "flaky", {"n": n})
+        await db.commit()
+        await memory.dispatch(db)
+    await memory.join()
+    assert sorted(calls) == [1, 1, 2, 2]
+    await memory.shutdown()
+    with pytest.raises(LookupError):
+        memory.enqueue(None, "unknown", {})
+
+    # Outbox: задача записывается вместе с постом и выполняется процессом app.worker
+    monkeypatch.setattr(jobs.queue, "backend", "outbox")
+    async with session_factory() as db:
+        db.add(UserModel(id=1, username="jobs", hashed_password="-"))
+        post = PostModel(title="T", content="C", user_id=1)
+        db.add(post)
+        await db.flush()
+        stats.record_post_change(db, 1, post.created_at, 1)
+        jobs.enqueue(db, "flaky", {"n": 3})
+        await db.commit()
+        assert (await db.execute(select(func.count()).select_from(JobOutbox))).scalar_one() == 2
+
+        assert await worker.run_once(session_factory, max_attempts=1) == 2
+        assert (await db.execute(select(UserPostStats.post_count))).scalar_one() == 1
+        # Попытки исчерпаны: строка остаётся с ошибкой и больше не берётся
+        failed = (await db.execute(select(JobOutbox))).scalar_one()
+        assert failed.name == "flaky" and failed.run_at is None and "first attempt fails" in failed.last_error
+        assert await worker.run_once(session_factory) == 0
+        assert jobs.queue.outbox_pending == 0
+    await jobs_engine.dispose()